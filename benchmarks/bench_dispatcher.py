@@ -0,0 +1,319 @@
+"""In-process dispatcher benchmark.
+
+Builds the Dispatcher like main() does (in-flight tracking, deduplication, auth and all
+handlers; flood control is left out) and feeds synthetic updates through
+Dispatcher.feed_update. The Bot uses a stub session
+that records API calls instead of talking to Telegram, so the numbers measure our own
+handler stack only.
+
+Usage:
+    python benchmarks/bench_dispatcher.py [--updates 5000] [--output bench_results.json]
+                                          [--compare previous.json] [--threshold 10]
+
+For every scenario (business_message, callback_query, business_connection) it reports
+throughput, p50/p99 handler latency and memory allocated per update, and writes the
+results to a JSON file that later runs can be compared against.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+BUSINESS_CONNECTION_ID = "bench-connection"
+OWNER_ID = 1000
+BOT_ID = 42
+
+# The configuration is read at import time, so the environment is prepared first.
+RESPONSES_DIR = tempfile.mkdtemp(prefix="replybot-bench-")
+os.environ.setdefault("BOT_TOKEN", f"{BOT_ID}:BENCHMARK-TOKEN")
+os.environ["RESPONSES_DIR"] = RESPONSES_DIR
+os.environ["HC_BUSINESS_CONNECTION_ID"] = BUSINESS_CONNECTION_ID
+os.environ["HC_BUSINESS_OWNER_CHAT_ID"] = str(OWNER_ID)
+os.environ["FSM_STORAGE"] = "memory"
+os.environ.pop("DATABASE_URL", None)
+
+from menu_config import DEFAULT_MENU_STRUCTURE  # noqa: E402
+
+
+def _write_response_files() -> None:
+    client_dir = os.path.join(RESPONSES_DIR, BUSINESS_CONNECTION_ID)
+    os.makedirs(client_dir, exist_ok=True)
+    for key, node in DEFAULT_MENU_STRUCTURE.items():
+        if "text_path" in node:
+            with open(os.path.join(client_dir, node["text_path"]), "w", encoding="utf-8") as f:
+                f.write(f"<b>{key}</b>\n" + "Lorem ipsum dolor sit amet. " * 20)
+
+
+_write_response_files()
+
+import logging  # noqa: E402
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import GetBusinessConnection, TelegramMethod  # noqa: E402
+from aiogram.types import BusinessConnection, Message, Update  # noqa: E402
+
+from main import build_dispatcher  # noqa: E402
+from middlewares.dedup_middleware import DeduplicationMiddleware  # noqa: E402
+from middlewares.inflight_middleware import InFlightMiddleware  # noqa: E402
+from menu_graph import compile_all_menus  # noqa: E402
+from services.owner_notifications import owner_notifier  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)  # main.py configures INFO logging on import
+
+
+class StubSession(BaseSession):
+    """Bot session that records API calls and returns canned results without network I/O."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        self.calls[type(method).__name__] += 1
+        if isinstance(method, GetBusinessConnection):
+            return BusinessConnection.model_validate(
+                _business_connection(method.business_connection_id), context={"bot": bot}
+            )
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return True
+        self._message_id += 1
+        return Message.model_validate(
+            {"message_id": self._message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}},
+            context={"bot": bot},
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        for chunk in ():  # Nothing to download: an empty stream
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Client", "last_name": str(user_id)}
+
+
+def _business_connection(connection_id: str, user_id: int = OWNER_ID) -> dict:
+    return {
+        "id": connection_id,
+        "user": _user(user_id),
+        "user_chat_id": user_id,
+        "date": int(time.time()),
+        "can_reply": True,
+        "is_enabled": True,
+    }
+
+
+def _business_message(update_id: int) -> dict:
+    client_id = 100_000 + update_id % 500  # 500 distinct clients
+    return {
+        "update_id": update_id,
+        "business_message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": client_id, "type": "private", "first_name": "Client"},
+            "from": _user(client_id),
+            "business_connection_id": BUSINESS_CONNECTION_ID,
+            "text": "Hello, how much is a boat trip?",
+        },
+    }
+
+
+_NODE_KEYS = sorted(DEFAULT_MENU_STRUCTURE)
+
+
+def _callback_query(update_id: int) -> dict:
+    client_id = 100_000 + update_id % 500
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(client_id),
+            "chat_instance": str(client_id),
+            "data": _NODE_KEYS[update_id % len(_NODE_KEYS)],
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": client_id, "type": "private", "first_name": "Client"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+                "business_connection_id": BUSINESS_CONNECTION_ID,
+                "text": "menu",
+            },
+        },
+    }
+
+
+def _business_connection_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "business_connection": _business_connection(f"bench-{update_id % 1000}", OWNER_ID + update_id % 1000),
+    }
+
+
+SCENARIOS = {
+    "business_message": _business_message,
+    "callback_query": _callback_query,
+    "business_connection": _business_connection_update,
+}
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    dp: Dispatcher, storage: MemoryStorage, name: str, make_update, updates: int, warmup: int, first_id: int
+) -> dict:
+    """
+    Runs one scenario with update_ids from first_id on (warmup + 2 * updates of them). The
+    deduplication middleware drops repeated ids, so every pass and scenario gets fresh ones.
+    """
+    session = StubSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    storage.storage.clear()  # Every scenario starts with empty FSM state
+    parsed = [
+        Update.model_validate(make_update(i), context={"bot": bot}) for i in range(first_id, first_id + warmup + updates)
+    ]
+
+    for update in parsed[:warmup]:
+        await dp.feed_update(bot, update)
+
+    # Timing pass
+    latencies = []
+    started = time.perf_counter()
+    for update in parsed[warmup:]:
+        t0 = time.perf_counter_ns()
+        await dp.feed_update(bot, update)
+        latencies.append((time.perf_counter_ns() - t0) / 1000)  # microseconds
+    elapsed = time.perf_counter() - started
+
+    # Allocation pass (tracemalloc slows everything down, so it is measured separately). New
+    # update and message ids, so it takes the same path as the timing pass instead of
+    # hitting the render cache for every edit the timing pass already made.
+    first_alloc_id = first_id + warmup + updates
+    alloc_updates = [
+        Update.model_validate(make_update(i), context={"bot": bot})
+        for i in range(first_alloc_id, first_alloc_id + updates)
+    ]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    blocks_before = sys.getallocatedblocks()
+    current_before, _ = tracemalloc.get_traced_memory()
+    for update in alloc_updates:
+        await dp.feed_update(bot, update)
+    current_after, peak = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    await owner_notifier.flush_all()
+    latencies.sort()
+    return {
+        "updates": updates,
+        "throughput_per_s": updates / elapsed if elapsed else 0.0,
+        "latency_us": {
+            "p50": _percentile(latencies, 0.50),
+            "p99": _percentile(latencies, 0.99),
+            "mean": statistics.fmean(latencies),
+            "max": latencies[-1],
+        },
+        "alloc": {
+            "peak_bytes_per_update": (peak - current_before) / updates,
+            "retained_bytes_per_update": (current_after - current_before) / updates,
+            "retained_blocks_per_update": (blocks_after - blocks_before) / updates,
+        },
+        "api_calls": dict(session.calls),
+    }
+
+
+def compare(current: dict, previous: dict, threshold: float) -> list[str]:
+    """Returns a list of regressions beyond threshold percent."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        checks = [
+            ("throughput_per_s", result["throughput_per_s"], old["throughput_per_s"], True),
+            ("p50", result["latency_us"]["p50"], old["latency_us"]["p50"], False),
+            ("p99", result["latency_us"]["p99"], old["latency_us"]["p99"], False),
+            ("peak_bytes_per_update", result["alloc"]["peak_bytes_per_update"], old["alloc"]["peak_bytes_per_update"], False),
+        ]
+        for metric, new_value, old_value, higher_is_better in checks:
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            print(f"  {name:20s} {metric:22s} {old_value:12.1f} -> {new_value:12.1f} ({change:+.1f}%)")
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(f"{name}.{metric} {change:+.1f}%")
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000, help="updates per scenario")
+    parser.add_argument("--warmup", type=int, default=500, help="untimed updates per scenario")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append", help="run only these scenarios")
+    parser.add_argument("--output", default="bench_results.json", help="where to save the results")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    compile_all_menus()
+    # The handler routers are module-level singletons and can only be attached to one dispatcher
+    storage = MemoryStorage()
+    # Without flood control: the synthetic clients send far faster than real ones, and
+    # throttling them would measure the drop path instead of the handlers
+    dp = build_dispatcher(storage, InFlightMiddleware(), DeduplicationMiddleware(state_path=""), throttle=False)
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {},
+    }
+    first_id = 0
+    for name in args.scenario or SCENARIOS:
+        result = await run_scenario(dp, storage, name, SCENARIOS[name], args.updates, args.warmup, first_id)
+        first_id += args.warmup + 2 * args.updates
+        results["scenarios"][name] = result
+        print(
+            f"{name:20s} {result['throughput_per_s']:10.0f} upd/s  "
+            f"p50 {result['latency_us']['p50']:8.1f}us  p99 {result['latency_us']['p99']:8.1f}us  "
+            f"peak {result['alloc']['peak_bytes_per_update']:8.0f} B/upd"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare} ({previous.get('timestamp')}):")
+        regressions = compare(results, previous, args.threshold)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
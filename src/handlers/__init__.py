@@ -2,6 +2,7 @@
 from aiogram import Dispatcher
 from .common import register_common_handlers
 from .user_commands import register_user_command_handlers
+from .owner_commands import register_owner_command_handlers
 from .business_handlers import register_business_handlers  # For Business API events
 from .business_features import (
     register_business_command_handlers,
@@ -17,6 +18,9 @@ def register_all_handlers(dp: Dispatcher):
     # Command-based business features
     register_business_command_handlers(dp)
 
+    # Owner-only commands (/stats, /profile); other users fall through to the handlers below
+    register_owner_command_handlers(dp)
+
     # General user commands
     register_user_command_handlers(dp)
 
@@ -8,9 +8,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from config import BUSINESS_CONTACT_EMAIL, BUSINESS_HOURS
-from keyboards.reply_keyboards import get_business_menu_keyboard
 
-router = Router()  # Keep this router local to these features
+router = Router(name="business_features")  # Keep this router local to these features
 
 
 class BusinessDialog(StatesGroup):
@@ -22,6 +21,8 @@ class BusinessDialog(StatesGroup):
 
 async def cmd_business_start(message: Message):
     """Handler for /business command"""
+    from keyboards.reply_keyboards import get_business_menu_keyboard  # Only needed by this rarely used command
+
     await message.answer(
         "Welcome to our business bot! How can I help you today?",
         reply_markup=get_business_menu_keyboard(),
@@ -9,17 +9,25 @@ from aiogram.types import (
     User,
     CallbackQuery,
 )
-import aiofiles # Import aiofiles
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.exceptions import TelegramAPIError
-import html
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.methods import SendMessage
 import os
 
 # Import the configuration and menu modules
 import config as app_config
-from menu_config import get_menu_for_client
-from keyboards.inline_keyboards import build_keyboard_from_config
+from keyboards.inline_keyboards import get_pager_keyboard
+from menu_graph import get_compiled_menu
+from services.analytics import menu_analytics
+from services.connection_registry import connection_registry
+from services.faq_index import faq_index
+from services.interaction_log import interaction_log
+from services.media_cache import media_cache
+from services.owner_notifications import owner_notifier
+from services.pagination import CAPTION_LIMIT, MESSAGE_LIMIT, PAGE_SEPARATOR, page_cache, parse_page
+from services.render_cache import render_cache, render_signature
+from services.templates import template_renderer
 
 
 # Define conversation states
@@ -28,20 +36,9 @@ class UserConversationState(StatesGroup):
     in_support = State()
 
 
-business_router = Router()
+business_router = Router(name="business_router")
 
-# Dictionary to store active business connections
-active_business_connections: dict = {}
-
-# --- Hardcoded Business Connection Details (Loaded from Config) ---
-if app_config.HC_BUSINESS_CONNECTION_ID and app_config.HC_BUSINESS_OWNER_CHAT_ID:
-    active_business_connections[app_config.HC_BUSINESS_CONNECTION_ID] = {
-        "user_chat_id": app_config.HC_BUSINESS_OWNER_CHAT_ID,
-        "user": User(id=app_config.HC_BUSINESS_OWNER_CHAT_ID, is_bot=False, first_name="Owner"),
-    }
-    logging.info(f"Initialized with business connection from config: ID='{app_config.HC_BUSINESS_CONNECTION_ID}'")
-
-RESPONSES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../static/responses'))
+RESPONSES_DIR = app_config.RESPONSES_DIR
 
 
 @business_router.business_connection()
@@ -53,19 +50,17 @@ async def handle_business_connection(business_connection: BusinessConnection, bo
 
     logging.info(f"BusinessConnection Update: ID={connection_id}, UserChatID={user_chat_id}, IsEnabled={is_enabled}")
 
+    # Persisted, so owners keep getting notifications after a restart
+    previous = await connection_registry.update(business_connection)
+
     if is_enabled:
-        active_business_connections[connection_id] = {
-            "user_chat_id": user_chat_id,
-            "user": business_connection.user,
-        }
         await bot.send_message(chat_id=user_chat_id, text=f"Business connection (ID: {connection_id}) is now active.")
-    elif not is_enabled and connection_id in active_business_connections:
-        del active_business_connections[connection_id]
+    elif previous and previous.is_enabled:
         await bot.send_message(chat_id=user_chat_id, text=f"Business connection (ID: {connection_id}) has been disabled.")
 
 
 @business_router.business_message()
-async def handle_business_message(message: Message, bot: Bot, state: FSMContext):
+async def handle_business_message(message: Message, bot: Bot, state: FSMContext, is_owner: bool = False):
     """Handles incoming messages via a Business Connection."""
     business_connection_id = message.business_connection_id
     client_user: User | None = message.from_user
@@ -74,50 +69,71 @@ async def handle_business_message(message: Message, bot: Bot, state: FSMContext)
     if not business_connection_id or not client_user:
         return
 
+    is_menu_command = bool(message.text and message.text.strip().startswith('/menu'))
+    interaction_log.record(
+        client_user.id, "message", "/menu" if is_menu_command else "message", business_connection_id, client_chat_id
+    )
+    if not is_owner:
+        menu_analytics.record(business_connection_id, "message", "/menu" if is_menu_command else "message", client_user.id)
+
     # --- Send menu only if explicitly requested or it's the first interaction ---
     current_state = await state.get_state()
+
+    # --- Answer from the client's content if the question clearly matches a node ---
+    if (
+        app_config.FAQ_ENABLED
+        and not is_owner
+        and not is_menu_command
+        and message.text
+        and current_state != UserConversationState.in_support  # The client asked for a human
+    ):
+        menu = await get_compiled_menu(business_connection_id)
+        match = await faq_index.match(business_connection_id, menu, message.text)
+        node = menu.get(match.node_key) if match else None
+        if node is not None:
+            text = await _content_text(business_connection_id, node)
+            render_key, page_text, keyboard = _content_page(business_connection_id, node, text, 1)
+            sent = await message.answer(page_text, reply_markup=keyboard, parse_mode="HTML")
+            render_cache.remember(sent.chat.id, sent.message_id, render_signature(render_key, page_text, keyboard))
+            await state.set_state(UserConversationState.in_menu)
+            interaction_log.record(client_user.id, "faq", node.key, business_connection_id, client_chat_id)
+            menu_analytics.record(business_connection_id, "faq", node.key, client_user.id)
+            logging.debug(f"FAQ answered '{node.key}' (score {match.score:.2f}) for client '{business_connection_id}'")
+            return  # Answered automatically, so the owner is not notified
     
     # Condition to send menu: /menu command, first message (state is None), or user is already in the menu.
     if (
-        (message.text and message.text.strip().startswith('/menu'))
+        is_menu_command
         or current_state is None
         or current_state == UserConversationState.in_menu
     ):
-        if client_user.full_name != app_config.AUTHORIZED_FULL_NAME:
-            menu_structure = get_menu_for_client(business_connection_id)
-            main_menu_node = menu_structure.get("main_menu")
-            
+        if not is_owner:  # Set by AuthMiddleware; the owner's own messages don't get the menu
+            main_menu_node = (await get_compiled_menu(business_connection_id)).get("main_menu")
+            send_menu = None
             if main_menu_node:
-                keyboard = build_keyboard_from_config(main_menu_node["buttons"])
-                await bot.send_message(
+                send_menu = SendMessage(
                     chat_id=client_chat_id,
-                    text=main_menu_node["text"],
+                    text=main_menu_node.text,
                     business_connection_id=business_connection_id,
-                    reply_markup=keyboard,
+                    reply_markup=main_menu_node.keyboard,
                 )
             await state.set_state(UserConversationState.in_menu)
             # If it was a /menu command, we don't need to notify the owner.
-            if message.text and message.text.strip().startswith('/menu'):
-                return
+            # Returning the method lets the dispatcher send it (inline in the webhook response if possible).
+            if is_menu_command:
+                return send_menu
+            if send_menu:
+                sent = await bot(send_menu)
+                render_cache.remember(
+                    sent.chat.id, sent.message_id,
+                    render_signature("main_menu", main_menu_node.text, main_menu_node.keyboard),
+                )
     
     # --- Notify business owner (runs for all messages that are not an explicit /menu command) ---
-    connection_details = active_business_connections.get(business_connection_id)
-    if connection_details and connection_details.get("user_chat_id"):
-        owner_chat_id = connection_details["user_chat_id"]
-        client_name_html = f"<a href='tg://user?id={client_user.id}'>{html.escape(client_user.full_name)}</a>"
-        notification_text = (
-            f"Received message from {client_name_html} (Chat ID: {client_chat_id}):\n"
-            f"<i>{html.escape(message.text or '[No Text]')}</i>"
-        )
-        try:
-            await bot.send_message(
-                chat_id=owner_chat_id,
-                text=notification_text,
-                parse_mode="HTML",
-                disable_web_page_preview=True
-            )
-        except TelegramAPIError as e:
-            logging.error(f"Failed to notify business owner {owner_chat_id}: {e}")
+    connection = await connection_registry.get(bot, business_connection_id)
+    if connection and connection.is_enabled:
+        # Buffered and merged into a per-owner digest; sending happens in the background
+        owner_notifier.notify(bot, connection.user_chat_id, client_user, client_chat_id, message.text)
 
 
 @business_router.callback_query()
@@ -132,95 +148,138 @@ async def handle_tourism_menu_callback(callback: CallbackQuery, state: FSMContex
         logging.error("Callback received without a business_connection_id.")
         return
 
-    menu_structure = get_menu_for_client(business_connection_id)
-    node_key = callback.data
-    node = menu_structure.get(node_key)
+    # Page buttons of long content nodes send "<node_key>|p<page>"
+    node_key, page = parse_page(callback.data)
+    node = (await get_compiled_menu(business_connection_id)).get(node_key)
+    interaction_log.record(
+        callback.from_user.id, "callback", node_key, business_connection_id, callback.message.chat.id
+    )
 
     if not node:
         logging.warning(f"Unknown node key '{node_key}' for client '{business_connection_id}'.")
         return
+    if page is None:  # Page turns of a long node are not counted as opening it again
+        menu_analytics.record(business_connection_id, "callback", node_key, callback.from_user.id)
 
-    node_type = node.get("type")
-    
     try:
-        if node_type == "menu":
-            text = node.get("text", "Меню")  # Default text
+        if node.type == "menu":
+            text = node.text or "Меню"  # Default text
 
             # If a text_path is provided for a menu, try to load it.
-            if "text_path" in node:
-                client_response_path = os.path.join(RESPONSES_DIR, business_connection_id, node["text_path"])
-                try: # Use aiofiles for async file reading
-                    async with aiofiles.open(client_response_path, mode='r', encoding="utf-8") as f:
-                        text = await f.read()
+            if node.text_path:
+                client_response_path = os.path.join(RESPONSES_DIR, business_connection_id, node.text_path)
+                try: # Rendered from memory; the disk is only read on a cache miss
+                    text = await template_renderer.render(business_connection_id, client_response_path)
                 except FileNotFoundError:
                     logging.warning(f"Menu text file not found: {client_response_path}. Using default text.")
                 except OSError as e:
                     logging.error(f"Could not read menu text file {client_response_path}: {e}")
 
-            keyboard = build_keyboard_from_config(node["buttons"])
-            await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+            await _edit_text(callback.message, node_key, text, node.keyboard, parse_mode="HTML")
             await state.set_state(UserConversationState.in_menu)
 
-        elif node_type == "content":
-            text = ""
-            # Construct the client-specific path for the response file
-            client_response_path = os.path.join(RESPONSES_DIR, business_connection_id, node["text_path"])
-            
-            try: # Use aiofiles for async file reading
-                async with aiofiles.open(client_response_path, mode='r', encoding="utf-8") as f:
-                    text = await f.read()
-            except FileNotFoundError:
-                logging.warning(f"Response file not found at client-specific path: {client_response_path}")
-                text = "<i>Контент временно недоступен.</i>"
-            except OSError as e:
-                logging.error(f"Could not read response file {client_response_path}: {e}")
-                text = "<i>Контент временно недоступен.</i>"
-
-            file_id = node.get("file_id")
-            back_to = node.get("back_to")
-            is_final = node.get("is_final", False)
+        elif node.type == "content":
+            text = await _content_text(business_connection_id, node)
+
+            file_id = node.file_id
+            media_path = os.path.join(RESPONSES_DIR, business_connection_id, node.media_path) if node.media_path else None
+            link = f"\n\n{file_id}" if file_id and file_id.startswith('http') else ""
+
+            def page_view(number: int) -> tuple[str, str, object]:
+                return _content_page(business_connection_id, node, text, number, link)
 
             # Set the state before sending the message
-            if is_final:
+            if node.is_final:
                 await state.set_state(UserConversationState.in_support)
             else:
                 await state.set_state(UserConversationState.in_menu)
 
-            keyboard = None
-            if not is_final and back_to:
-                if back_to == "main_menu":
-                    # If "back" is the main menu, just show one button to go there.
-                    nav_buttons = [{"text": "🏠 Главное меню", "target": "main_menu"}]
-                else:
-                    # For deeper menus, show both "Back" and "Home".
-                    nav_buttons = [
-                        {"text": "⬅️ Назад", "target": back_to},
-                        {"text": "🏠 Главное меню", "target": "main_menu"}
-                    ]
-                keyboard = build_keyboard_from_config([nav_buttons])
-
-            if file_id and file_id.startswith('http'):
-                full_text = f"{text}\n\n{file_id}"
-                await callback.message.edit_text(
-                    full_text,
-                    reply_markup=keyboard,
-                    parse_mode="HTML",
-                    disable_web_page_preview=False
-                )
-            elif file_id: # It's a photo ID
-                if len(text) > 1024:
-                    await callback.message.answer_photo(photo=file_id)
-                    await callback.message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+            text_kwargs = {"parse_mode": "HTML"}
+            if link:
+                text_kwargs["disable_web_page_preview"] = False
+
+            if (file_id or media_path) and not link and page is None:
+                # A photo: Telegram file_id or a local file (uploaded once, then by file_id)
+                # The photo is sent as a new message; a repeated tap on the old one must not send it again
+                sent_signature = render_signature(node_key, text)
+                chat_id, message_id = callback.message.chat.id, callback.message.message_id
+                if render_cache.is_current(chat_id, message_id, sent_signature, method="SendPhoto"):
+                    return
+                fits_caption = len(page_cache.pages((business_connection_id, node_key), text, CAPTION_LIMIT)) == 1
+                try:
+                    if not fits_caption:
+                        # Photo first, then the text (paginated if needed); page buttons edit the text message
+                        await _send_photo(callback.message, file_id, media_path)
+                        _, page_text, page_keyboard = page_view(1)
+                        await callback.message.answer(page_text, reply_markup=page_keyboard, **text_kwargs)
+                    else:
+                        await _send_photo(
+                            callback.message, file_id, media_path, caption=text, reply_markup=node.keyboard, parse_mode="HTML"
+                        )
+                except FileNotFoundError:
+                    logging.warning(f"Media file not found: {media_path}. Sending text only.")
+                    await _edit_text(callback.message, *page_view(1), **text_kwargs)
                 else:
-                    await callback.message.answer_photo(photo=file_id, caption=text, reply_markup=keyboard, parse_mode="HTML")
-                await callback.message.edit_reply_markup(reply_markup=None) # Clean up old message
-            else: # Just text
-                await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+                    render_cache.remember(chat_id, message_id, sent_signature)
+                    await callback.message.edit_reply_markup(reply_markup=None) # Clean up old message
+            else: # Text (with a link preview if file_id is a URL), one page at a time
+                await _edit_text(callback.message, *page_view(page or 1), **text_kwargs)
 
     except TelegramAPIError as e:
         if "message is not modified" not in str(e):
             logging.error(f"API Error on callback '{node_key}': {e}", exc_info=True)
 
 
+async def _content_text(business_connection_id: str, node) -> str:
+    """Returns the rendered response text of a content node, or a placeholder if it cannot be read."""
+    # Construct the client-specific path for the response file
+    client_response_path = os.path.join(RESPONSES_DIR, business_connection_id, node.text_path)
+    try: # Rendered from memory; the disk is only read on a cache miss
+        return await template_renderer.render(business_connection_id, client_response_path)
+    except FileNotFoundError:
+        logging.warning(f"Response file not found at client-specific path: {client_response_path}")
+    except OSError as e:
+        logging.error(f"Could not read response file {client_response_path}: {e}")
+    return "<i>Контент временно недоступен.</i>"
+
+
+def _content_page(business_connection_id: str, node, text: str, number: int, link: str = "") -> tuple[str, str, object]:
+    """
+    Returns (render key, text, keyboard) of one page of a content node.
+    Long texts are split into HTML-safe pages once per text version, not per click.
+    """
+    pages = page_cache.pages((business_connection_id, node.key), text, MESSAGE_LIMIT - len(link))
+    if len(pages) == 1:
+        # Pre-built "Back / Home" keyboard; None for final nodes
+        return node.key, pages[0] + link, node.keyboard
+    number = min(number, len(pages))
+    back_to = None if node.is_final else node.back_to
+    return (
+        f"{node.key}{PAGE_SEPARATOR}{number}",
+        pages[number - 1] + link,
+        get_pager_keyboard(node.key, number, len(pages), back_to),
+    )
+
+
+async def _edit_text(message: Message, node_key: str, text: str, keyboard, **kwargs) -> None:
+    """Edits a menu message, unless the render cache says it already shows exactly this."""
+    signature = render_signature(node_key, text, keyboard)
+    if render_cache.is_current(message.chat.id, message.message_id, signature):
+        return
+    try:
+        await message.edit_text(text, reply_markup=keyboard, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    render_cache.remember(message.chat.id, message.message_id, signature)
+
+
+async def _send_photo(message: Message, file_id: str | None, media_path: str | None, **kwargs) -> Message:
+    """Sends a photo by file_id, or a local file through the media cache."""
+    if media_path:
+        return await media_cache.send(media_path, lambda photo: message.answer_photo(photo=photo, **kwargs))
+    return await message.answer_photo(photo=file_id, **kwargs)
+
+
 def register_business_handlers(dp: Dispatcher):
     dp.include_router(business_router)
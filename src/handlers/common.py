@@ -8,7 +8,7 @@ from aiogram import types, Router, Dispatcher
 import logging  # Added for logging
 
 # Create a new Router instance for common handlers
-router = Router()
+router = Router(name="common")
 
 # The send_welcome and send_help functions from the original file are not registered here
 # as /start and /help are typically handled by user_commands.py.
@@ -24,7 +24,7 @@ async def handle_unknown_message(message: types.Message):
     logging.info(
         f"Received an unhandled message from {message.from_user.id}: {message.text}"
     )
-    await message.answer(
+    return message.answer(
         "Sorry, I didn't understand that. Type /help for a list of commands."
     )
 
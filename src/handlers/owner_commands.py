@@ -0,0 +1,116 @@
+"""Commands for business owners, sent in their private chat with the bot."""
+
+import asyncio
+import html
+import math
+
+from aiogram import types, Router, Dispatcher
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile
+
+import config as app_config
+from services.analytics import StatsReport, menu_analytics
+from services.connection_registry import connection_registry
+from services.loop_monitor import ProfileResult, loop_monitor
+from services.outbound import Priority, outbound_scheduler
+
+router = Router(name="owner_commands")
+
+# Menu items listed in /stats
+TOP_NODES = 15
+CAPTION_LIMIT = 1024
+
+# Tasks waiting for a profiling session to finish, to deliver its report; cancelled at shutdown
+_profile_reports: set[asyncio.Task] = set()
+
+
+async def owner_only(message: types.Message, is_owner: bool = False) -> bool:  # pylint: disable=unused-argument
+    """Filter: the sender is an owner (set by AuthMiddleware). Others fall through to the common handler."""
+    return is_owner
+
+
+@router.message(Command("stats"), owner_only)
+async def stats_command(message: types.Message):
+    """Shows which menu items clients open, answered from the pre-aggregated rollups."""
+    connection_ids = await connection_registry.owned_by(message.chat.id)
+    if not connection_ids:
+        return message.answer("No business connections found for this chat.")
+    report = await menu_analytics.report(connection_ids)
+    return message.answer(format_stats(report))
+
+
+def format_stats(report: StatsReport) -> str:
+    if report.from_database:
+        lines = [f"📊 <b>Statistics for the last {report.days} days</b>"]
+    else:
+        lines = ["📊 <b>Statistics for today</b> (since the last restart; set DATABASE_URL to keep history)"]
+    lines.append(f"Today: {report.clients_today} clients, {report.events_today} events")
+    if report.from_database:
+        lines.append(f"{report.days} days: {report.events} events")
+    lines.append(f"Messages: {report.messages}")
+    if report.nodes:
+        lines.append("")
+        lines.append("<b>Most opened:</b>")
+        for number, node in enumerate(report.nodes[:TOP_NODES], 1):
+            lines.append(
+                f"{number}. {html.escape(node.node_key)}: {node.opens}"
+                f" (today {node.opens_today}, {node.clients_today} clients)"
+            )
+    if report.clients_per_connection:
+        lines.append("")
+        lines.append("<i>Clients are counted per business connection and per way of opening an item.</i>")
+    return "\n".join(lines)
+
+
+@router.message(Command("profile"), owner_only)
+async def profile_command(message: types.Message, command: CommandObject):
+    """Profiles the event loop for a few seconds (/profile [seconds]) and reports the hottest functions."""
+    try:
+        seconds = float(command.args) if command.args else app_config.PROFILE_SECONDS
+    except ValueError:
+        return message.answer("Usage: /profile [seconds]")
+    if not math.isfinite(seconds):  # nan would pass the clamp below and never finish
+        return message.answer("Usage: /profile [seconds]")
+    seconds = min(max(seconds, 1.0), app_config.PROFILE_MAX_SECONDS)
+    task = loop_monitor.start_profile(seconds)
+    if task is None:
+        return message.answer("A profiling session is already running.")
+    # The report follows in the background, so this handler does not stay in flight meanwhile
+    report = asyncio.create_task(_send_profile_result(message, task), name="profile-report")
+    _profile_reports.add(report)
+    report.add_done_callback(_profile_reports.discard)
+    return message.answer(f"Profiling for {seconds:g} s…")
+
+
+async def _send_profile_result(message: types.Message, task: asyncio.Task) -> None:
+    """Waits for the profiling session, then queues the report file for sending."""
+    await asyncio.wait([task])  # Not `await task`: cancelling this must not cancel the session
+    if task.cancelled() or task.exception() is not None:
+        text = (
+            "Profiling was stopped before it finished." if task.cancelled()
+            else f"Profiling failed: {html.escape(str(task.exception()))}"
+        )
+        outbound_scheduler.enqueue(message.answer(text), Priority.INTERACTIVE)
+        return
+    result: ProfileResult = task.result()
+    caption = f"Profile of {result.seconds:g} s\n\n<b>Hottest functions:</b>"
+    for number, entry in enumerate(result.hottest, 1):
+        line = f"\n{number}. {html.escape(entry)}"
+        if len(caption) + len(line) > CAPTION_LIMIT:
+            break
+        caption += line
+    outbound_scheduler.enqueue(
+        message.answer_document(FSInputFile(result.path), caption=caption), Priority.INTERACTIVE
+    )
+
+
+async def stop_profile_reports() -> None:
+    """Cancels the reports still waiting for their profiling session. Called at shutdown."""
+    for report in list(_profile_reports):
+        report.cancel()
+    if _profile_reports:
+        await asyncio.wait(list(_profile_reports))
+
+
+def register_owner_command_handlers(dp: Dispatcher):
+    dp.include_router(router)
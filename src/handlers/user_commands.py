@@ -5,7 +5,7 @@ import logging
 from keyboards.inline_keyboards import get_tourism_main_inline_keyboard
 
 # Create a new Router instance
-router = Router()
+router = Router(name="user_commands")
 
 @router.message(CommandStart(deep_link=True, deep_link_encoded=False))
 async def start_command_deeplink(message: types.Message, command: CommandObject):
@@ -32,16 +32,16 @@ async def start_command_deeplink(message: types.Message, command: CommandObject)
             await message.answer("Welcome to the Business Bot! Invalid deep link format.")
     else:
         # Standard /start command without specific deep link
-        await start_command(message) # Call the non-deeplink version
+        return await start_command(message) # Call the non-deeplink version
 
 @router.message(CommandStart())
 async def start_command(message: types.Message):
     """Handles /start command without deep link."""
-    await message.answer("Welcome to the Business Bot! How can I assist you today?")
+    return message.answer("Welcome to the Business Bot! How can I assist you today?")
 
 @router.message(Command("help"))
 async def help_command(message: types.Message):
-    await message.answer(
+    return message.answer(
         "Here are the commands you can use:\n"
         "/start - Start the bot\n"
         "/help - Get help\n"
@@ -52,7 +52,7 @@ async def help_command(message: types.Message):
 @router.message(Command("menu"))
 async def menu_command(message: types.Message):
     """Handles /menu command and returns the main inline keyboard."""
-    await message.answer(
+    return message.answer(
         "Главное меню:",
         reply_markup=get_tourism_main_inline_keyboard()
     )
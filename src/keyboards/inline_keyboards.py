@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 def build_keyboard_from_config(buttons_config: list[list[dict]]) -> InlineKeyboardMarkup:
@@ -18,6 +20,42 @@ def build_keyboard_from_config(buttons_config: list[list[dict]]) -> InlineKeyboa
     return InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
 
 
+@lru_cache(maxsize=256)
+def get_content_nav_keyboard(back_to: str) -> InlineKeyboardMarkup:
+    """
+    Returns the shared "Back / Home" keyboard shown under content nodes.
+    The markup is built once per back_to target and reused; callers must not mutate it.
+    """
+    if back_to == "main_menu":
+        # If "back" is the main menu, just show one button to go there.
+        nav_buttons = [{"text": "🏠 Главное меню", "target": "main_menu"}]
+    else:
+        # For deeper menus, show both "Back" and "Home".
+        nav_buttons = [
+            {"text": "⬅️ Назад", "target": back_to},
+            {"text": "🏠 Главное меню", "target": "main_menu"}
+        ]
+    return build_keyboard_from_config([nav_buttons])
+
+
+@lru_cache(maxsize=4096)
+def get_pager_keyboard(node_key: str, page: int, total: int, back_to: str | None = None) -> InlineKeyboardMarkup:
+    """
+    Returns the "◀ 2/3 ▶" keyboard of one page of a long content node, above its "Back / Home" row.
+    The arrows wrap around; the counter re-requests the current page. Built once per page and cached.
+    """
+    previous_page = page - 1 if page > 1 else total
+    next_page = page + 1 if page < total else 1
+    rows = [[
+        InlineKeyboardButton(text="◀", callback_data=f"{node_key}|p{previous_page}"),
+        InlineKeyboardButton(text=f"{page}/{total}", callback_data=f"{node_key}|p{page}"),
+        InlineKeyboardButton(text="▶", callback_data=f"{node_key}|p{next_page}"),
+    ]]
+    if back_to:
+        rows.extend(get_content_nav_keyboard(back_to).inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def get_tourism_main_inline_keyboard():
     """
     Возвращает основную встроенную клавиатуру для туристического бота с измененным порядком кнопок.
@@ -1,159 +1,414 @@
 """Main entry point for the Telegram bot using Aiogram framework."""
 
+import time
+
+_PROCESS_STARTED = time.perf_counter()  # Taken before the heavy imports, for the startup breakdown
+
 import asyncio
+import hashlib
+import json
 import logging
-import sys
+import os
+from contextlib import asynccontextmanager
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from aiogram.exceptions import TelegramAPIError
 
 import config as app_config  # Use an alias to avoid potential conflicts and clarify origin
 from handlers import register_all_handlers
+from handlers.owner_commands import stop_profile_reports
 from middlewares.auth_middleware import AuthMiddleware
+from middlewares.dedup_middleware import DeduplicationMiddleware
+from middlewares.inflight_middleware import InFlightMiddleware
+from middlewares.throttling_middleware import ThrottlingMiddleware
+from menu_graph import client_menus, compile_all_menus
+from services.content_store import content_store
+from services.media_cache import media_cache
+from services.faq_index import faq_index
+from services.pagination import page_cache
+from services.render_cache import render_cache
+from services.templates import template_renderer
+from services.owner_notifications import owner_notifier
+from services.interaction_log import interaction_log
+from services.analytics import menu_analytics
+from services.outbound import OutboundRateLimitMiddleware, outbound_scheduler
+from services.connection_registry import connection_registry
+from services.loop_monitor import loop_monitor
+from services.metrics import registry as metrics_registry, start_metrics_server, stats_collector
+from middlewares.metrics_middleware import ApiMetricsMiddleware, install_metrics
+from middlewares.log_context_middleware import install_log_context
+from utils.logging_setup import configure_logging, logging_stats
 
-log_format = "%(asctime)s - %(levelname)s - %(name)s - %(filename)s:%(lineno)d - %(message)s"
+# Records are queued on the event loop and written to stdout by a background thread
+configure_logging(
+    level=app_config.LOG_LEVEL,
+    json_format=app_config.LOG_FORMAT == "json",
+    rate=app_config.LOG_RATE_LIMIT,
+    burst=app_config.LOG_RATE_BURST,
+    queue_size=app_config.LOG_QUEUE_SIZE,
+)
 
-# More explicit setup:
-root_logger = logging.getLogger() # Get the root logger
+# Now, get your module-specific logger. It will inherit from the root logger's setup.
+logger = logging.getLogger(__name__) # __name__ will be 'src.main' or '__main__'
 
-# Clear any existing handlers from the root logger
-if root_logger.hasHandlers():
-    root_logger.handlers.clear()
+# Test log immediately after setup
+logger.info("Logging explicitly configured in main.py. Application starting...")
+# --- End of Logging Setup ---
 
-# Set the desired level on the root logger
-root_logger.setLevel(logging.INFO)
+_IMPORTS_DONE = time.perf_counter()
 
-# Create a stream handler to output to stdout (or stderr)
-stream_handler = logging.StreamHandler(sys.stdout) # Change to sys.stderr if preferred
-stream_handler.setLevel(logging.INFO) # Set level on handler as well
 
-# Create a formatter
-formatter = logging.Formatter(log_format) # The formatter uses the updated log_format
-stream_handler.setFormatter(formatter)
+class StartupTimer:
+    """Collects how long each startup step took, for one summary log line."""
 
-# Add the handler to the root logger
-root_logger.addHandler(stream_handler)
+    def __init__(self):
+        self.steps: list[tuple[str, float]] = [("imports", _IMPORTS_DONE - _PROCESS_STARTED)]
+        self._last = time.perf_counter()
 
-# Now, get your module-specific logger. It will inherit from the root logger's setup.
-logger = logging.getLogger(__name__) # __name__ will be 'src.main' or '__main__'
+    def mark(self, step: str) -> None:
+        now = time.perf_counter()
+        self.steps.append((step, now - self._last))
+        self._last = now
 
-# Test log immediately after setup
-logger.info("Logging explicitly configured in main.py. Application starting...")
-# --- End of Logging Setup ---
+    def summary(self) -> str:
+        total = sum(duration for _, duration in self.steps)
+        return f"{total * 1000:.0f} ms (" + ", ".join(f"{step} {duration * 1000:.0f} ms" for step, duration in self.steps) + ")"
 
 
 async def main():
-    # Initialize bot and dispatcher
+    if app_config.SHARD_WORKERS > 1:
+        # Front process: receives updates and routes them to worker processes
+        from sharding import run_front
+
+        await run_front(app_config.SHARD_WORKERS)
+        return
+
+    timer = StartupTimer()
+    async with bot_runtime(metrics_port=app_config.METRICS_PORT, timer=timer) as (bot, dp):
+        # Set up business info for the bot (skipped when nothing changed since the last start)
+        await setup_business_info(bot)
+        timer.mark("business_info")
+        logging.info(f"Startup finished in {timer.summary()}")
+
+        # Start receiving updates
+        logging.info(f"Starting bot in {app_config.BOT_MODE} mode")
+        if app_config.BOT_MODE == "webhook":
+            from webhook import run_webhook
+
+            await run_webhook(dp, bot)
+        else:
+            # A leftover webhook would make getUpdates fail
+            await bot.delete_webhook()
+            # The session stays open for the handlers still running; bot_runtime() closes it
+            await dp.start_polling(bot, close_bot_session=False)
+
+
+def create_bot() -> Bot:
+    """Creates the Bot with the outbound rate limiter and API metrics installed."""
     default_props = DefaultBotProperties(parse_mode=ParseMode.HTML)
     # Use app_config for clarity if you aliased the import
     bot = Bot(token=app_config.BOT_TOKEN, default=default_props)
+    # Every chat-bound API call waits for the global and per-chat rate limits and retries on RetryAfter
+    bot.session.middleware(
+        OutboundRateLimitMiddleware(outbound_scheduler, max_retries=app_config.OUTBOUND_MAX_RETRIES)
+    )
+    # Registered after the rate limiter, so API latency is measured without queueing time
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
+
+
+@asynccontextmanager
+async def bot_runtime(metrics_port: int = 0, timer: StartupTimer | None = None, shard: int | None = None):
+    """
+    Starts the bot, the dispatcher and every background service, and shuts them down in order on exit.
+    Used by main() and by each shard worker process (shard is the worker index, which keeps the
+    local state files of workers apart). Step durations are recorded in timer.
+
+    Shutdown: new updates are refused, running handlers get SHUTDOWN_TIMEOUT seconds to finish,
+    pending sends are flushed, and the update high-water mark and a memory FSM storage are saved
+    (DEDUP_STATE_FILE, FSM_SNAPSHOT_FILE), from where the next start restores them.
+    """
+    if timer is None:
+        timer = StartupTimer()
+    bot = create_bot()
+
+    # Create missing tables when a database is configured. SQLAlchemy is only imported in that case.
+    use_db = bool(app_config.Config.DATABASE_URL)
+    if use_db:
+        from models.database import init_db
+
+        await init_db()
+        timer.mark("init_db")
+    storage = await build_fsm_storage()
+    snapshot_path = _local_state_path(app_config.FSM_SNAPSHOT_FILE, shard) if isinstance(storage, MemoryStorage) else ""
+    if snapshot_path:
+        await restore_fsm_snapshot(storage, snapshot_path)
+        timer.mark("fsm_snapshot")
+    inflight = InFlightMiddleware()
+    dedup = DeduplicationMiddleware(state_path=_local_state_path(app_config.DEDUP_STATE_FILE, shard))
+    await asyncio.to_thread(dedup.load, bot.id)
+    dp = build_dispatcher(storage, inflight, dedup)
+    register_metrics_collectors()
+    timer.mark("dispatcher")
+    metrics_runner = None
+    if metrics_port:
+        metrics_runner = await start_metrics_server(app_config.METRICS_HOST, metrics_port)
+    if app_config.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()  # Started early, so slow startup steps are caught too
+
+    # Validate and pre-build every menu; a broken config fails here, not on a click
+    compile_all_menus()
+    timer.mark("menus")
+
+    # Warm up the response content cache and watch for file changes
+    if app_config.RESPONSE_CACHE_PRELOAD:
+        await content_store.preload()
+    content_store.start()
+    timer.mark("content")
+
+    # Record menu clicks and messages in the background
+    if use_db and app_config.INTERACTION_LOG_ENABLED:
+        from models.database import get_engine
+
+        interaction_log.start(get_engine())
+
+    # Roll menu analytics up into hourly and daily counts in the background
+    if use_db and app_config.ANALYTICS_ENABLED:
+        from models.database import get_engine
+
+        menu_analytics.start(get_engine())
+
+    try:
+        yield bot, dp
+    finally:
+        inflight.stop_accepting()
+        await inflight.wait_idle(app_config.SHUTDOWN_TIMEOUT)
+        try:
+            await asyncio.to_thread(dedup.save)
+        except OSError as e:
+            logging.error(f"Could not save the update high-water mark: {e}")
+        await stop_profile_reports()
+        await owner_notifier.flush_all()  # Deliver buffered owner digests before the session closes
+        await outbound_scheduler.drain(timeout=10)
+        logging.info(f"Outbound scheduler stats: {outbound_scheduler.stats()}")
+        await content_store.stop()
+        if snapshot_path:
+            await save_fsm_snapshot(storage, snapshot_path)
+        await storage.close()  # Flushes pending FSM writes
+        await interaction_log.close()
+        await menu_analytics.close()
+        if use_db:
+            from models.database import close_db
+
+            await close_db()
+        await loop_monitor.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()  # Gracefully close bot session
 
-    dp = Dispatcher(storage=MemoryStorage())
+
+def build_dispatcher(
+    storage: BaseStorage,
+    inflight: InFlightMiddleware | None = None,
+    dedup: DeduplicationMiddleware | None = None,
+    throttle: bool | None = None,
+) -> Dispatcher:
+    """
+    Creates the Dispatcher with its middleware and all handlers registered.
+    Flood control is installed when throttle is true (defaults to THROTTLE_ENABLED).
+    """
+    dp = Dispatcher(storage=storage)
 
     # Register middleware
+    if inflight is not None:
+        dp.update.outer_middleware(inflight)  # First, so it covers everything that runs for an update
+    if dedup is not None:
+        # Before anything else runs, so a redelivered update costs one set lookup
+        dp.update.outer_middleware(dedup)
+        metrics_registry.register_collector(stats_collector("replybot_dedup", dedup.stats))
     # If AuthMiddleware required arguments (e.g., db_pool), they would be passed here.
     dp.update.outer_middleware(AuthMiddleware())
+    if app_config.THROTTLE_ENABLED if throttle is None else throttle:
+        # After auth, so owners are recognised and exempt; floods are dropped before any handler
+        throttling = ThrottlingMiddleware()
+        dp.update.outer_middleware(throttling)
+        metrics_registry.register_collector(stats_collector("replybot_throttling", throttling.stats))
 
     # Register all handlers
     register_all_handlers(dp)
 
-    # Set up business info for the bot
-    await setup_business_info(bot)
+    # Time every update and every router/handler (after registration, so all routers are included)
+    install_metrics(dp)
+    if app_config.LOG_FORMAT == "json":
+        install_log_context(dp)  # Adds update, chat and handler fields to every record
+    return dp
+
+
+def register_metrics_collectors() -> None:
+    """Exposes the counters of the long-lived services on the metrics endpoint."""
+    metrics_registry.register_collector(stats_collector("replybot_logging", logging_stats))
+    metrics_registry.register_collector(stats_collector("replybot_loop", loop_monitor.stats))
+    metrics_registry.register_collector(stats_collector("replybot_content_cache", content_store.stats))
+    metrics_registry.register_collector(stats_collector("replybot_media_cache", media_cache.stats))
+    metrics_registry.register_collector(stats_collector("replybot_client_menus", client_menus.stats))
+    metrics_registry.register_collector(stats_collector("replybot_render_cache", render_cache.stats))
+    metrics_registry.register_collector(stats_collector("replybot_templates", template_renderer.stats))
+    metrics_registry.register_collector(stats_collector("replybot_pages", page_cache.stats))
+    metrics_registry.register_collector(stats_collector("replybot_faq", faq_index.stats))
+    metrics_registry.register_collector(stats_collector("replybot_outbound", outbound_scheduler.stats))
+    metrics_registry.register_collector(stats_collector("replybot_owner_notifications", owner_notifier.stats))
+    metrics_registry.register_collector(stats_collector("replybot_interaction_log", interaction_log.stats))
+    metrics_registry.register_collector(stats_collector("replybot_analytics", menu_analytics.stats))
+    metrics_registry.register_collector(stats_collector("replybot_connections", connection_registry.stats))
+
+
+async def build_fsm_storage() -> BaseStorage:
+    """Creates the FSM storage selected by FSM_STORAGE ("memory" or "sql")."""
+    if app_config.FSM_STORAGE == "sql":
+        from models.database import get_engine
+        from storage.sql_storage import SQLStorage
+
+        logging.info("Using SQL FSM storage with write-behind batching")
+        return SQLStorage(
+            get_engine(),
+            flush_interval=app_config.FSM_FLUSH_INTERVAL,
+            flush_batch_size=app_config.FSM_FLUSH_BATCH_SIZE,
+            cache_size=app_config.FSM_CACHE_SIZE,
+        )
+    return MemoryStorage()
+
+
+def _local_state_path(path: str, shard: int | None) -> str:
+    """Path of a local state file for this process: one per shard worker, "" when disabled."""
+    if not path or shard is None:
+        return path
+    return f"{path}.shard{shard}"
+
+
+async def restore_fsm_snapshot(storage: MemoryStorage, path: str) -> None:
+    """Loads the FSM state saved by the previous shutdown, if any."""
+    from storage.snapshot import read_snapshot, restore_snapshot
 
-    # Start polling
-    logging.info("Starting bot")
     try:
-        await dp.start_polling(bot)
-    finally:
-        await bot.session.close()  # Gracefully close bot session
+        records = await asyncio.to_thread(read_snapshot, path)
+    except (OSError, EOFError, KeyError, ValueError, TypeError) as e:
+        logging.warning(f"Could not restore the FSM snapshot {path}, starting with empty state: {e}")
+        return
+    restore_snapshot(storage, records)
+    if records:
+        logging.info(f"Restored {len(records)} FSM record(s) from {path}")
+
+
+async def save_fsm_snapshot(storage: MemoryStorage, path: str) -> None:
+    """Writes the FSM state to path for the next start."""
+    from storage.snapshot import snapshot_rows, write_snapshot
+
+    rows = snapshot_rows(storage)  # Taken on the loop, so no handler can change the storage meanwhile
+    try:
+        count = await asyncio.to_thread(write_snapshot, path, rows)
+    except OSError as e:
+        logging.error(f"Could not save the FSM snapshot {path}: {e}")
+        return
+    logging.info(f"Saved {count} FSM record(s) to {path}")
+
+
+def _fingerprint(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _load_setup_state(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read {path}, all business info calls will be made: {e}")
+        return {}
+
+
+def _save_setup_state(path: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
 
 
 async def setup_business_info(bot: Bot):
     """
     Setup comprehensive business information for the bot using Bot API.
     Ensure the corresponding variables are defined in your config.py (or .env).
+
+    The calls are independent, so they run concurrently. A fingerprint of every value that was
+    applied successfully is kept in BOT_SETUP_STATE_FILE (per bot), and calls whose value has
+    not changed since are skipped, so a restart usually makes no API calls at all.
     """
-    try:
-        # Basic Info
-        if (
-            hasattr(app_config, "BUSINESS_DESCRIPTION")
-            and app_config.BUSINESS_DESCRIPTION
-        ):
-            await bot.set_my_description(description=app_config.BUSINESS_DESCRIPTION)
-            logging.info("Business description set.")
-        business_short_desc_val = getattr(
-            app_config, "BUSINESS_SHORT_DESCRIPTION", None
+    # name -> (value, call that applies it)
+    calls = {}
+
+    # Basic Info
+    if hasattr(app_config, "BUSINESS_DESCRIPTION") and app_config.BUSINESS_DESCRIPTION:
+        calls["description"] = (
+            app_config.BUSINESS_DESCRIPTION,
+            lambda value: bot.set_my_description(description=value),
+        )
+    business_short_desc_val = getattr(app_config, "BUSINESS_SHORT_DESCRIPTION", None)
+    if business_short_desc_val:
+        calls["short_description"] = (
+            business_short_desc_val,
+            lambda value: bot.set_my_short_description(short_description=value),
         )
-        if business_short_desc_val:
-            await bot.set_my_short_description(
-                short_description=business_short_desc_val
-            )
-            logging.info("Business short description set.")
-
-        # Business Intro (Example)
-        # To use this, define BUSINESS_INTRO_TITLE, BUSINESS_INTRO_MESSAGE,
-        # and optionally BUSINESS_INTRO_STICKER_FILE_ID in your config
-        # business_intro_title_val = getattr(app_config, "BUSINESS_INTRO_TITLE", None)
-        # business_intro_message_val = getattr(app_config, "BUSINESS_INTRO_MESSAGE", None)
-
-        # if business_intro_title_val and business_intro_message_val:
-        #     intro_sticker_obj = None
-        #     business_intro_sticker_file_id_val = getattr(
-        #         app_config, "BUSINESS_INTRO_STICKER_FILE_ID", None
-        #     )
-        #     if business_intro_sticker_file_id_val:
-        #         # Assuming 'tgs' format and a generic emoji. Adjust as needed.
-        #         intro_sticker_obj = InputSticker(
-        #             sticker=business_intro_sticker_file_id_val,
-        #             format="tgs",
-        #             emoji_list=["⭐"],
-        #         )
-
-        #     business_intro = BusinessIntro(
-        #         title=business_intro_title_val,
-        #         message=business_intro_message_val,
-        #         sticker=intro_sticker_obj,
-        #     )
-        #     await bot.set_my_business_intro(intro=business_intro)
-        #     logging.info("Business intro set.")
-
-        # Business Location (Example)
-        # To use this, define BUSINESS_LOCATION_LATITUDE, BUSINESS_LOCATION_LONGITUDE,
-        # and BUSINESS_LOCATION_ADDRESS in your config
-        # if (
-        #     hasattr(app_config, "BUSINESS_LOCATION_LATITUDE")
-        #     and hasattr(app_config, "BUSINESS_LOCATION_LONGITUDE")
-        #     and hasattr(app_config, "BUSINESS_LOCATION_ADDRESS")
-        # ):
-        #     business_location = BusinessLocation(
-        #         latitude=float(app_config.BUSINESS_LOCATION_LATITUDE),
-        #         longitude=float(app_config.BUSINESS_LOCATION_LONGITUDE),
-        #         address=app_config.BUSINESS_LOCATION_ADDRESS,
-        #     )
-        #     await bot.set_my_business_location(location=business_location)
-        #     logging.info("Business location set.")
-
-        # Business Opening Hours (Example - more complex structure)
-        # To use this, define BUSINESS_OPENING_HOURS_TIME_ZONE and BUSINESS_OPENING_HOURS_INTERVALS (a list of dicts)
-        # e.g., BUSINESS_OPENING_HOURS_INTERVALS = [{"opening_minute": 540, "closing_minute": 1080}] # 9 AM to 6 PM
-        # See https://core.telegram.org/bots/api#businessopeninghoursinterval
-        # if hasattr(app_config, "BUSINESS_OPENING_HOURS_TIME_ZONE") and hasattr(
-        #     app_config, "BUSINESS_OPENING_HOURS_INTERVALS"
-        # ):
-        #     opening_hours = BusinessOpeningHours(
-        #         time_zone_name=app_config.BUSINESS_OPENING_HOURS_TIME_ZONE,
-        #         opening_hours=app_config.BUSINESS_OPENING_HOURS_INTERVALS,  # This should be a list of BusinessOpeningHoursInterval objects
-        #     )
-        #     # Note: You'll need to construct BusinessOpeningHoursInterval objects for the list above.
-        #     # For simplicity, this example assumes app_config.BUSINESS_OPENING_HOURS_INTERVALS is already correctly formatted.
-        #     # A more robust implementation would involve creating these objects from your config data.
-        #     logging.info("Business opening hours set.")
-
-        logging.info("Business information setup process completed.")
-    except TelegramAPIError as e:
-        logging.error(f"Failed to set up some business information: {e}", exc_info=True)
+
+    # Business Intro / Location / Opening Hours (Examples)
+    # Add further settings the same way, with a JSON-serialisable value, e.g.:
+    # if getattr(app_config, "BUSINESS_INTRO_TITLE", None) and getattr(app_config, "BUSINESS_INTRO_MESSAGE", None):
+    #     calls["intro"] = (
+    #         {"title": app_config.BUSINESS_INTRO_TITLE, "message": app_config.BUSINESS_INTRO_MESSAGE},
+    #         lambda value: bot.set_my_business_intro(intro=BusinessIntro(**value)),
+    #     )
+    # if getattr(app_config, "BUSINESS_LOCATION_ADDRESS", None):
+    #     calls["location"] = (
+    #         {
+    #             "latitude": float(app_config.BUSINESS_LOCATION_LATITUDE),
+    #             "longitude": float(app_config.BUSINESS_LOCATION_LONGITUDE),
+    #             "address": app_config.BUSINESS_LOCATION_ADDRESS,
+    #         },
+    #         lambda value: bot.set_my_business_location(location=BusinessLocation(**value)),
+    #     )
+    # Opening hours (BUSINESS_OPENING_HOURS_TIME_ZONE and a list of BusinessOpeningHoursInterval dicts)
+    # follow the same pattern; see https://core.telegram.org/bots/api#businessopeninghoursinterval
+
+    started = time.perf_counter()
+    state_path = app_config.BOT_SETUP_STATE_FILE
+    state = await asyncio.to_thread(_load_setup_state, state_path)
+    applied = state.setdefault(str(bot.id), {})
+    pending = {name: call for name, call in calls.items() if applied.get(name) != _fingerprint(call[0])}
+
+    results = await asyncio.gather(*(call(value) for value, call in pending.values()), return_exceptions=True)
+    changed = False
+    for name, result in zip(pending, results):
+        if isinstance(result, TelegramAPIError):
+            logging.error(f"Failed to set business {name}: {result}")
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            applied[name] = _fingerprint(pending[name][0])
+            changed = True
+            logging.info(f"Business {name} set.")
+    if changed:
+        try:
+            await asyncio.to_thread(_save_setup_state, state_path, state)
+        except OSError as e:
+            logging.warning(f"Could not save {state_path}: {e}")
+
+    logging.info(
+        f"Business information setup process completed: {len(pending)} call(s) made, "
+        f"{len(calls) - len(pending)} unchanged, in {(time.perf_counter() - started) * 1000:.0f} ms."
+    )
 
 
 if __name__ == "__main__":
@@ -39,6 +39,8 @@ DEFAULT_MENU_STRUCTURE = {
     # --- Content Nodes (pointing to HTML files) ---
     # The `text_path` is relative. The final path will be constructed as:
     # static/responses/<business_connection_id>/<text_path>
+    # A node may also show a photo: either a Telegram `file_id`, or a `media_path` to a local
+    # image in the same directory, which is uploaded once and then re-sent by its cached file_id.
     "prices":     {"type": "content", "text_path": "prices.html", "back_to": "main_menu"},
     "faq":        {"type": "content", "text_path": "faq.html", "back_to": "main_menu"},
     "excursions": {"type": "content", "text_path": "excursions.html", "back_to": "main_menu"},
@@ -0,0 +1,384 @@
+"""
+Compiled, validated form of the menu configuration.
+The dict structures in menu_config.py are checked and turned into immutable
+MenuNode objects once, with their keyboards pre-built, so a callback only needs
+a dict lookup to find everything it has to send.
+Clients can also define their menu in a menu.json/menu.yaml file next to their
+response files; those are loaded on first use and reloaded when the file changes.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from aiogram.types import InlineKeyboardMarkup
+
+import config as app_config
+from menu_config import CLIENT_MENUS, DEFAULT_MENU_STRUCTURE
+from keyboards.inline_keyboards import build_keyboard_from_config, get_content_nav_keyboard
+
+ROOT_NODE = "main_menu"
+NODE_TYPES = ("menu", "content")
+# Telegram limits callback_data to 64 bytes; page buttons append "|p<page>" to the node key.
+MAX_CALLBACK_DATA_BYTES = 64
+PAGE_SUFFIX_BYTES = len("|p999")
+# Looked up in static/responses/<business_connection_id>/, first match wins.
+MENU_FILE_NAMES = ("menu.json", "menu.yaml", "menu.yml")
+
+
+class MenuConfigError(ValueError):
+    """Raised when a menu structure cannot be compiled."""
+
+
+@dataclass(frozen=True, slots=True)
+class MenuNode:
+    """A single compiled menu node."""
+
+    key: str
+    type: str
+    text: str | None = None
+    text_path: str | None = None
+    file_id: str | None = None
+    media_path: str | None = None
+    back_to: str | None = None
+    is_final: bool = False
+    keyboard: InlineKeyboardMarkup | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledMenu:
+    """All nodes of one menu structure, keyed by callback data."""
+
+    nodes: Mapping[str, MenuNode]
+    client_id: str | None = None
+
+    def get(self, key: str) -> MenuNode | None:
+        return self.nodes.get(key)
+
+
+def _validate(structure: dict, client_dir: str | None) -> list[str]:
+    """Returns a list of human-readable problems found in a menu structure."""
+    problems = []
+    if ROOT_NODE not in structure:
+        problems.append(f"missing root node '{ROOT_NODE}'")
+
+    edges: dict[str, list[str]] = {}
+    for key, node in structure.items():
+        if not isinstance(key, str):
+            problems.append(f"node {key!r}: key must be a string")
+            continue
+        if not isinstance(node, dict):
+            problems.append(f"node '{key}': must be an object, not {type(node).__name__}")
+            continue
+        if len(key.encode("utf-8")) > MAX_CALLBACK_DATA_BYTES - PAGE_SUFFIX_BYTES:
+            problems.append(f"node '{key}': key is longer than {MAX_CALLBACK_DATA_BYTES - PAGE_SUFFIX_BYTES} bytes")
+        if "|" in key:
+            problems.append(f"node '{key}': key must not contain '|'")
+        node_type = node.get("type")
+        if node_type not in NODE_TYPES:
+            problems.append(f"node '{key}': unknown type {node_type!r}")
+            continue
+
+        targets = []
+        if node_type == "menu":
+            buttons = node.get("buttons")
+            if not buttons:
+                problems.append(f"node '{key}': menu has no buttons")
+            elif not isinstance(buttons, list):
+                problems.append(f"node '{key}': 'buttons' must be a list of rows")
+                buttons = []
+            for row in buttons or []:
+                if not isinstance(row, list):
+                    problems.append(f"node '{key}': button row {row!r} must be a list of buttons")
+                    continue
+                for button in row:
+                    if not isinstance(button, dict) or "text" not in button or "target" not in button:
+                        problems.append(f"node '{key}': button {button!r} needs 'text' and 'target'")
+                        continue
+                    targets.append(button["target"])
+            if "text" not in node and "text_path" not in node:
+                problems.append(f"node '{key}': menu needs 'text' or 'text_path'")
+        elif "text_path" not in node:
+            problems.append(f"node '{key}': content needs 'text_path'")
+
+        if node.get("back_to"):
+            targets.append(node["back_to"])
+        for target in targets:
+            if not isinstance(target, str):
+                problems.append(f"node '{key}': target {target!r} must be a node key")
+            elif target not in structure:
+                problems.append(f"node '{key}': target '{target}' does not exist")
+        edges[key] = [target for target in targets if isinstance(target, str)]
+
+        if node.get("media_path") and node.get("file_id"):
+            problems.append(f"node '{key}': use either 'file_id' or 'media_path', not both")
+        for path_key in ("text_path", "media_path"):
+            if node.get(path_key) and not isinstance(node[path_key], str):
+                problems.append(f"node '{key}': {path_key} must be a string")
+            elif client_dir and node.get(path_key):
+                path = os.path.join(client_dir, node[path_key])
+                if not os.path.isfile(path):
+                    problems.append(f"node '{key}': {path_key} file not found: {path}")
+
+    # Every node must be reachable from the root menu
+    seen = set()
+    pending = [ROOT_NODE] if ROOT_NODE in structure else []
+    while pending:
+        key = pending.pop()
+        if key in seen:
+            continue
+        seen.add(key)
+        pending.extend(target for target in edges.get(key, []) if target in structure)
+    for key in structure:
+        if ROOT_NODE in structure and key not in seen:
+            problems.append(f"node '{key}': not reachable from '{ROOT_NODE}'")
+    return problems
+
+
+def compile_menu(structure: dict, client_id: str | None = None) -> CompiledMenu:
+    """
+    Validates a menu structure and builds its immutable nodes.
+    When client_id is given, every text_path and media_path is also checked on disk.
+    Raises MenuConfigError listing every problem found.
+    """
+    client_dir = os.path.join(app_config.RESPONSES_DIR, client_id) if client_id else None
+    problems = _validate(structure, client_dir)
+    if problems:
+        raise MenuConfigError(
+            f"Invalid menu for client '{client_id or 'default'}':\n  " + "\n  ".join(problems)
+        )
+
+    nodes = {}
+    for key, node in structure.items():
+        is_final = node.get("is_final", False)
+        back_to = node.get("back_to")
+        if node["type"] == "menu":
+            keyboard = build_keyboard_from_config(node["buttons"])
+        elif not is_final and back_to:
+            keyboard = get_content_nav_keyboard(back_to)
+        else:
+            keyboard = None
+        nodes[key] = MenuNode(
+            key=key,
+            type=node["type"],
+            text=node.get("text"),
+            text_path=node.get("text_path"),
+            file_id=node.get("file_id"),
+            media_path=node.get("media_path"),
+            back_to=back_to,
+            is_final=is_final,
+            keyboard=keyboard,
+        )
+    return CompiledMenu(nodes=MappingProxyType(nodes), client_id=client_id)
+
+
+_default_menu: CompiledMenu | None = None
+_client_menus: dict[str, CompiledMenu] = {}
+
+
+def compile_all_menus() -> None:
+    """
+    Compiles the default menu and every client menu configured in code (CLIENT_MENUS).
+    Called at startup so that a broken configuration stops the bot before it serves anyone.
+    The default menu's files are also checked in every client directory that uses it.
+    Menus from files are not loaded here; see ClientMenuCache.
+    """
+    global _default_menu
+    _default_menu = compile_menu(DEFAULT_MENU_STRUCTURE)
+    for client_id, structure in CLIENT_MENUS.items():
+        if not client_id:  # e.g. HC_BUSINESS_CONNECTION_ID is not set
+            continue
+        _client_menus[client_id] = compile_menu(structure, client_id)
+    # The default menu's files are looked up in each client's directory. A client found on
+    # disk is only reported, not fatal: the other clients can still be served.
+    default_clients = _default_menu_clients(app_config.RESPONSES_DIR)
+    for client_id in default_clients:
+        problems = _validate(DEFAULT_MENU_STRUCTURE, os.path.join(app_config.RESPONSES_DIR, client_id))
+        if problems:
+            details = "\n  ".join(problems)
+            logging.error(f"Default menu for client '{client_id}' is incomplete:\n  {details}")
+    logging.info(
+        f"Compiled {len(_client_menus)} client menu(s) and the default menu, "
+        f"checked against {len(default_clients)} client directory(ies)."
+    )
+
+
+def _default_menu_clients(root: str) -> list[str]:
+    """Client directories under root that are served the default menu (no menu in code or in a file)."""
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+    return [
+        name for name in names
+        if name not in CLIENT_MENUS
+        and os.path.isdir(os.path.join(root, name))
+        and _find_menu_file(os.path.join(root, name)) is None
+    ]
+
+
+def _static_menu(business_connection_id: str) -> CompiledMenu:
+    """Returns the menu configured in code for a client, or the default menu."""
+    menu = _client_menus.get(business_connection_id)
+    if menu is not None:
+        return menu
+    if _default_menu is None:
+        compile_all_menus()
+    return _client_menus.get(business_connection_id) or _default_menu
+
+
+# --- Per-client menu files (static/responses/<business_connection_id>/menu.json) ---
+
+def _find_menu_file(client_dir: str) -> tuple[str, int] | None:
+    """Returns (path, mtime_ns) of the client's menu file, or None. Runs in a worker thread."""
+    for name in MENU_FILE_NAMES:
+        path = os.path.join(client_dir, name)
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def _load_menu_file(path: str, client_id: str) -> CompiledMenu:
+    """Parses and compiles a menu file. Runs in a worker thread."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            structure = json.load(f)
+        else:
+            try:  # Optional, and only imported once a client has a menu.yaml
+                import yaml
+            except ImportError:
+                raise MenuConfigError(f"{path}: YAML menus need PyYAML (pip install pyyaml)") from None
+            try:
+                structure = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise MenuConfigError(f"{path}: {e}") from e
+    if not isinstance(structure, dict):
+        raise MenuConfigError(f"{path}: the top level must be an object of nodes")
+    return compile_menu(structure, client_id)
+
+
+@dataclass(slots=True)
+class _MenuEntry:
+    menu: CompiledMenu
+    path: str | None  # None: the client has no menu file
+    mtime_ns: int
+    checked_at: float
+
+
+class ClientMenuCache:
+    """
+    Lazily loaded, size-bounded LRU of per-client menus from files.
+
+    A client's menu file is read and compiled on its first interaction. Afterwards the
+    file is stat()ed at most once per check_interval; a changed file is compiled in a
+    worker thread and swapped in only if it is valid, so a broken edit keeps the previous
+    menu. Clients without a file get the menu from CLIENT_MENUS or the default menu.
+    """
+
+    def __init__(self, root: str, max_entries: int, check_interval: float):
+        self.root = root
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries: OrderedDict[str, _MenuEntry] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.errors = 0
+        self.evictions = 0
+
+    async def get(self, business_connection_id: str) -> CompiledMenu:
+        entry = self._entries.get(business_connection_id)
+        if entry is not None:
+            self._entries.move_to_end(business_connection_id)
+            if time.monotonic() - entry.checked_at < self.check_interval:
+                self.hits += 1
+                return entry.menu
+        # Concurrent first clicks of one client share a single load
+        task = self._loading.get(business_connection_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(business_connection_id, entry))
+            self._loading[business_connection_id] = task
+            task.add_done_callback(lambda _t: self._loading.pop(business_connection_id, None))
+        return await asyncio.shield(task)
+
+    def invalidate(self, business_connection_id: str | None = None) -> None:
+        """Forces a re-check of one client's menu file, or of all of them."""
+        if business_connection_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(business_connection_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+    async def _refresh(self, business_connection_id: str, entry: _MenuEntry | None) -> CompiledMenu:
+        client_dir = os.path.join(self.root, business_connection_id)
+        now = time.monotonic()
+        found = await asyncio.to_thread(_find_menu_file, client_dir)
+
+        if found is None:
+            if entry is not None and entry.path is not None:
+                logging.info(f"Menu file for client '{business_connection_id}' was removed. Using the configured menu.")
+            menu = _static_menu(business_connection_id)
+            self._put(business_connection_id, _MenuEntry(menu, None, 0, now))
+            return menu
+
+        path, mtime_ns = found
+        if entry is not None and entry.path == path and entry.mtime_ns == mtime_ns:
+            entry.checked_at = now
+            return entry.menu
+
+        try:
+            menu = await asyncio.to_thread(_load_menu_file, path, business_connection_id)
+        except (OSError, ValueError) as e:  # MenuConfigError and JSON errors are ValueErrors
+            self.errors += 1
+            logging.error(f"Could not load menu file {path}: {e}")
+            # Keep serving the last good menu; retry after the next change of the file
+            menu = entry.menu if entry is not None else _static_menu(business_connection_id)
+            self._put(business_connection_id, _MenuEntry(menu, path, mtime_ns, now))
+            return menu
+
+        if entry is not None and entry.path is not None:
+            self.reloads += 1
+            logging.info(f"Reloaded menu for client '{business_connection_id}' from {path}")
+        else:
+            self.loads += 1
+        self._put(business_connection_id, _MenuEntry(menu, path, mtime_ns, now))
+        return menu
+
+    def _put(self, business_connection_id: str, entry: _MenuEntry) -> None:
+        self._entries[business_connection_id] = entry
+        self._entries.move_to_end(business_connection_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+client_menus = ClientMenuCache(
+    root=app_config.RESPONSES_DIR,
+    max_entries=app_config.MENU_CACHE_SIZE,
+    check_interval=app_config.MENU_RELOAD_INTERVAL,
+)
+
+
+async def get_compiled_menu(business_connection_id: str) -> CompiledMenu:
+    """
+    Returns the compiled menu for a client: from its menu file if it has one,
+    otherwise from CLIENT_MENUS, falling back to the default menu.
+    """
+    return await client_menus.get(business_connection_id)
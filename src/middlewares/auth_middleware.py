@@ -1,10 +1,15 @@
 """Auth Middleware for Aiogram 3.x
 This middleware checks if the user is authenticated based on the event's 'from_user' attribute.
-It sets 'is_authenticated' in the data dictionary for further processing.
+It sets 'is_authenticated' and 'is_owner' in the data dictionary for further processing.
+
+Users are matched by ID against a frozenset allowlist (AUTHORIZED_USER_IDS). Matching by
+full name is kept only as an opt-in fallback (AUTH_NAME_FALLBACK). Decisions are cached
+per user ID, and logging is lazy and at debug level, since this runs on every update.
 """
 
 import logging
-from typing import Callable, Dict, Any, Awaitable
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Awaitable, Iterable
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, User
 
@@ -15,6 +20,29 @@ logger = logging.getLogger(__name__)
 
 
 class AuthMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        allowed_ids: Iterable[int] | None = None,
+        authorized_full_name: str | None = None,
+        name_fallback: bool | None = None,
+        cache_size: int | None = None,
+    ):
+        """
+        :param allowed_ids: Owner user IDs. Defaults to AUTHORIZED_USER_IDS from config;
+                            pass IDs loaded from the database here to extend or replace them.
+        :param authorized_full_name: Full name for the legacy fallback (defaults to config).
+        :param name_fallback: Enables the full-name fallback (defaults to AUTH_NAME_FALLBACK).
+        """
+        self.allowed_ids = frozenset(app_config.AUTHORIZED_USER_IDS if allowed_ids is None else allowed_ids)
+        self.name_fallback = app_config.AUTH_NAME_FALLBACK if name_fallback is None else name_fallback
+        if authorized_full_name is None:
+            authorized_full_name = app_config.AUTHORIZED_FULL_NAME
+        self.authorized_full_name = authorized_full_name if self.name_fallback else None
+        # With nothing configured every user is treated as authenticated (but not as an owner)
+        self.restricted = bool(self.allowed_ids or self.authorized_full_name)
+        self.cache_size = app_config.AUTH_CACHE_SIZE if cache_size is None else cache_size
+        self._decisions: OrderedDict[int, bool] = OrderedDict()
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -24,46 +52,33 @@ class AuthMiddleware(BaseMiddleware):
         user: User | None = data.get("event_from_user")
 
         if user:
-            # Pass the full user object to check_user_auth
-            data["is_authenticated"] = await self.check_user_auth(user, data)
+            is_owner = self._decisions.get(user.id)
+            if is_owner is None:
+                is_owner = self.is_allowed(user)
+                self._decisions[user.id] = is_owner
+                if len(self._decisions) > self.cache_size:
+                    self._decisions.popitem(last=False)
+            else:
+                self._decisions.move_to_end(user.id)  # Evict the least recently seen user first
+            data["is_owner"] = is_owner
+            data["is_authenticated"] = is_owner or not self.restricted
             data["user_id"] = user.id
-            logger.debug(
-                f"AuthMiddleware: User ID {user.id} ({user.full_name}), "
-                f"is_authenticated: {data['is_authenticated']}"
-            )
+            logger.debug("AuthMiddleware: user %s, is_owner=%s", user.id, is_owner)
         else:
+            data["is_owner"] = False
             data["is_authenticated"] = False
-            logger.debug("AuthMiddleware: No user found in event, is_authenticated: False")
+            logger.debug("AuthMiddleware: no user in event, is_authenticated=False")
 
         return await handler(event, data)
 
-    async def check_user_auth(self, user: User, data: Dict[str, Any]) -> bool:
-        """
-        Checks if the user is authenticated.
-        Prioritizes checking against AUTHORIZED_FULL_NAME if set in config.
-        """
-        # Check against the configured full name if it's set
-        if app_config.AUTHORIZED_FULL_NAME:
-            if user.full_name == app_config.AUTHORIZED_FULL_NAME:
-                logger.info(
-                    f"User '{user.full_name}' (ID: {user.id}) MATCHES configured AUTHORIZED_FULL_NAME. Authenticated."
-                )
-                return True
-            else:
-                logger.warning(
-                    f"User '{user.full_name}' (ID: {user.id}) does NOT MATCH configured "
-                    f"AUTHORIZED_FULL_NAME ('{app_config.AUTHORIZED_FULL_NAME}'). Not authenticated by this rule."
-                )
-                return False  # If AUTHORIZED_FULL_NAME is set, it's the sole criteria by this logic
-
-        # If AUTHORIZED_FULL_NAME is not set, fall back to other logic or default to True.
-        # For now, let's default to True if no specific name is configured for restriction.
-        # In a real scenario, you might have database lookups or other checks here.
-        logger.debug(
-            f"AUTHORIZED_FULL_NAME not set in config. Defaulting user '{user.full_name}' (ID: {user.id}) "
-            f"to authenticated (or apply other auth rules here)."
-        )
-        return True  # Default to authenticated if no specific full name is configured for restriction
+    def is_allowed(self, user: User) -> bool:
+        """Returns True if the user is on the allowlist (or matches the opt-in name fallback)."""
+        if user.id in self.allowed_ids:
+            return True
+        if self.authorized_full_name and user.full_name == self.authorized_full_name:
+            logger.debug("AuthMiddleware: user %s matched by full name fallback", user.id)
+            return True
+        return False
 
 
 # No need to instantiate it here (auth_middleware = AuthMiddleware())
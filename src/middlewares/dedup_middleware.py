@@ -0,0 +1,148 @@
+"""Deduplication Middleware for Aiogram 3.x
+Drops updates that were already processed, which happens after webhook retries,
+overlapping pollers or a restart. Without it a client gets the main menu twice and the
+owner is notified twice.
+
+The last DEDUP_WINDOW update_ids (and callback query ids) are remembered in a fixed-size
+ring buffer backed by a set: checking and recording an id is O(1) and the memory used
+never grows. Optionally, the highest update_id processed (the high-water mark) is saved
+on shutdown and loaded at startup, which covers redeliveries that reach a freshly started
+process with an empty window: the DEDUP_WINDOW update_ids up to the mark are dropped.
+Only those: Telegram may start update_ids over at a random value after a week without
+updates, and everything below a stale mark must still get through. A mark older than
+Telegram's 24 hours of update storage is ignored.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Any, Awaitable, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import config as app_config
+from services.metrics import updates_duplicate
+
+logger = logging.getLogger(__name__)
+
+# Telegram keeps unconfirmed updates for 24 hours; an older mark cannot match a redelivery
+MAX_MARK_AGE = 24 * 3600
+
+
+class SeenWindow:
+    """The last `size` keys seen, in a ring buffer plus a set for O(1) membership."""
+
+    __slots__ = ("_ring", "_position", "_seen")
+
+    def __init__(self, size: int):
+        self._ring: list[Hashable | None] = [None] * size
+        self._position = 0
+        self._seen: set[Hashable] = set()
+
+    def add(self, key: Hashable) -> bool:
+        """Records key; returns False if it is already in the window."""
+        if key in self._seen:
+            return False
+        evicted = self._ring[self._position]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._ring[self._position] = key
+        self._position = (self._position + 1) % len(self._ring)
+        self._seen.add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    def __init__(self, window: int | None = None, state_path: str | None = None):
+        """
+        :param window: How many recent update_ids and callback query ids to remember (DEDUP_WINDOW).
+        :param state_path: File for the high-water mark, or "" to keep it in memory only.
+                           Defaults to DEDUP_STATE_FILE.
+        """
+        self.window = app_config.DEDUP_WINDOW if window is None else window
+        self.state_path = app_config.DEDUP_STATE_FILE if state_path is None else state_path
+        self._updates = SeenWindow(self.window)
+        self._callbacks = SeenWindow(self.window)
+        self.high_water_mark = -1  # Highest update_id accepted in this run
+        self._restored_mark = -1  # Highest update_id of the previous run
+        self.bot_id: int | None = None
+        self.passed = 0
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        update_id = event.update_id
+        if self._restored_mark - self.window < update_id <= self._restored_mark:
+            return self._drop(update_id, "before_restart")
+        if not self._updates.add(update_id):
+            return self._drop(update_id, "update_id")
+        callback_query = event.callback_query
+        if callback_query is not None and not self._callbacks.add(callback_query.id):
+            return self._drop(update_id, "callback_query")
+
+        if update_id > self.high_water_mark:
+            self.high_water_mark = update_id
+        self.passed += 1
+        return await handler(event, data)
+
+    def _drop(self, update_id: int, reason: str) -> None:
+        self.duplicates += 1
+        updates_duplicate.inc(reason)
+        logger.debug("Dropped duplicate update %s (%s)", update_id, reason)
+        return None
+
+    def load(self, bot_id: int) -> None:
+        """Loads the high-water mark saved by the previous run of this bot. Blocking."""
+        self.bot_id = bot_id
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read %s, starting without a high-water mark: %s", self.state_path, e)
+            return
+        if state.get("bot_id") != bot_id:  # A different token means different update_ids
+            return
+        age = time.time() - float(state.get("saved_at", 0))
+        if age > MAX_MARK_AGE:
+            logger.info("Ignoring the high-water mark in %s, saved %.0f hours ago", self.state_path, age / 3600)
+            return
+        self._restored_mark = int(state.get("update_id", -1))
+        logger.info(
+            "Dropping update_ids %s to %s, already processed before the restart",
+            max(self._restored_mark - self.window + 1, 0), self._restored_mark,
+        )
+
+    def save(self) -> None:
+        """Saves the high-water mark of this run atomically, if any update was processed. Blocking."""
+        if not self.state_path or self.high_water_mark < 0:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"bot_id": self.bot_id, "update_id": self.high_water_mark, "saved_at": time.time()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def stats(self) -> dict:
+        return {
+            "passed": self.passed,
+            "duplicates": self.duplicates,
+            "window_update_ids": len(self._updates),
+            "window_callback_ids": len(self._callbacks),
+            "high_water_mark": self.high_water_mark,
+        }
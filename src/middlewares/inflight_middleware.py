@@ -0,0 +1,56 @@
+"""In-flight Middleware for Aiogram 3.x
+Counts the updates currently being processed, so a graceful shutdown can stop taking
+new updates and wait for the running handlers to finish before the services they use
+(outbound sends, FSM storage, the bot session) are closed.
+
+Registered first on dp.update, so it wraps every other middleware and handler.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightMiddleware(BaseMiddleware):
+    def __init__(self):
+        self.active = 0
+        self.accepting = True
+        self.rejected = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self.accepting:
+            self.rejected += 1
+            return None
+        self.active += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.active -= 1
+            if not self.active:
+                self._idle.set()
+
+    def stop_accepting(self) -> None:
+        """Updates arriving from now on are dropped without running any handler."""
+        self.accepting = False
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for the running updates to finish. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%d update(s) still running after %.0f s, shutting down anyway", self.active, timeout)
+            return False
+        return True
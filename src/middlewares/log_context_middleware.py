@@ -0,0 +1,68 @@
+"""Log Context Middlewares for Aiogram 3.x
+Bind the update being processed to every log record written while handling it, for the
+JSON log format: UpdateLogContextMiddleware (outer middleware on dp.update) binds the
+update, chat, user and business connection; HandlerLogContextMiddleware (inner middleware
+on every router observer) adds the handler.
+"""
+
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from utils.logging_setup import log_context
+
+# Observers that never run regular handlers
+_SKIPPED_OBSERVERS = ("update", "error")
+
+
+class UpdateLogContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        context = {}
+        if isinstance(event, Update):
+            context["update_id"] = event.update_id
+        chat = data.get("event_chat")
+        if chat is not None:
+            context["chat_id"] = chat.id
+        user = data.get("event_from_user")
+        if user is not None:
+            context["user_id"] = user.id
+        business_connection_id = getattr(data.get("event_context"), "business_connection_id", None)
+        if business_connection_id:
+            context["business_connection_id"] = business_connection_id
+        token = log_context.set(context)
+        try:
+            return await handler(event, data)
+        finally:
+            log_context.reset(token)
+
+
+class HandlerLogContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        token = log_context.set({**(log_context.get() or {}), "handler": f"{data['event_router'].name}.{name}"})
+        try:
+            return await handler(event, data)
+        finally:
+            log_context.reset(token)
+
+
+def install_log_context(dp: Dispatcher) -> None:
+    """Adds the log context middlewares. Call after register_all_handlers(), like install_metrics()."""
+    dp.update.outer_middleware(UpdateLogContextMiddleware())
+    handler_middleware = HandlerLogContextMiddleware()
+    for router in dp.chain_tail:
+        for event_name, observer in router.observers.items():
+            if event_name not in _SKIPPED_OBSERVERS:
+                observer.middleware(handler_middleware)
@@ -0,0 +1,84 @@
+"""Metrics middlewares for Aiogram 3.x
+UpdateMetricsMiddleware times whole updates (outer middleware on dp.update),
+HandlerMetricsMiddleware times each router/handler pair (inner middleware on every
+router observer), and ApiMetricsMiddleware times each Bot API method (session middleware).
+"""
+
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import CancelHandler, SkipHandler
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from services.metrics import api_duration, api_errors, handler_duration, handler_errors, update_duration
+
+# Observers that never run regular handlers
+_SKIPPED_OBSERVERS = ("update", "error")
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+            update_duration.observe(time.perf_counter() - started, event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        router = data["event_router"].name
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except (SkipHandler, CancelHandler):
+            raise
+        except Exception as e:
+            handler_errors.inc(router, name, type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, router, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_duration.observe(time.perf_counter() - started, name)
+
+
+def install_metrics(dp: Dispatcher, bot: Bot | None = None) -> None:
+    """
+    Adds the metrics middlewares to the dispatcher, every included router and, if given, the bot session.
+    Call after register_all_handlers() so every router is already included.
+    """
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_middleware = HandlerMetricsMiddleware()
+    for router in dp.chain_tail:
+        for event_name, observer in router.observers.items():
+            if event_name not in _SKIPPED_OBSERVERS:
+                observer.middleware(handler_middleware)
+    if bot is not None:
+        bot.session.middleware(ApiMetricsMiddleware())
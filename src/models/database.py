@@ -0,0 +1,72 @@
+"""Async database engine shared by the persistence layers (FSM storage, registries, logs)."""
+
+import logging
+
+from sqlalchemy import Table
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+import config as app_config
+from models.db_models import Base
+
+logger = logging.getLogger(__name__)
+
+_engine: AsyncEngine | None = None
+
+
+def _async_url(url: str) -> str:
+    """Adds the async driver to plain postgresql:// and sqlite:// URLs."""
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+def get_engine() -> AsyncEngine | None:
+    """Returns the shared engine, or None when DATABASE_URL is not configured."""
+    global _engine
+    if _engine is None and app_config.Config.DATABASE_URL:
+        _engine = create_async_engine(_async_url(app_config.Config.DATABASE_URL), pool_pre_ping=True)
+    return _engine
+
+
+def upsert_statement(
+    engine: AsyncEngine,
+    table: Table,
+    rows: list[dict],
+    index_elements: list[str],
+    update_columns: list[str],
+    increment_columns: list[str] = (),
+):
+    """
+    Builds a multi-row INSERT ... ON CONFLICT DO UPDATE for PostgreSQL or SQLite.
+    Only update_columns are overwritten when the row already exists; increment_columns
+    are added to the stored values instead.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported for the '{engine.dialect.name}' dialect")
+    stmt = insert(table).values(rows)
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    set_.update({column: table.c[column] + stmt.excluded[column] for column in increment_columns})
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+
+
+async def init_db() -> None:
+    """Creates missing tables. Safe to call on every start."""
+    engine = get_engine()
+    if engine is None:
+        return
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    logger.info("Database schema is ready (%s).", engine.dialect.name)
+
+
+async def close_db() -> None:
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
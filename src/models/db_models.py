@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -18,6 +18,40 @@ class Interaction(Base):
     __tablename__ = 'interactions'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, nullable=False)
-    command = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    user_id = Column(BigInteger, nullable=False)  # Telegram user IDs do not fit in 32 bits
+    command = Column(String, nullable=False)  # Menu node key for callbacks, "message" or "/menu" for messages
+    event_type = Column(String, nullable=True)  # "callback" or "message"
+    business_connection_id = Column(String, nullable=True, index=True)
+    chat_id = Column(BigInteger, nullable=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+class InteractionRollup(Base):
+    """Interaction counts per business connection, menu node and hour or day, updated incrementally."""
+    __tablename__ = 'interaction_rollups'
+
+    business_connection_id = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)  # "hour" or "day"
+    period_start = Column(DateTime, primary_key=True)  # UTC
+    node_key = Column(String, primary_key=True)  # "*" for all events of the connection
+    event_type = Column(String, primary_key=True)  # "callback", "faq", "message" or "*"
+    count = Column(BigInteger, nullable=False, default=0)
+    unique_clients = Column(Integer, nullable=False, default=0)
+
+class FSMRecord(Base):
+    """Persisted aiogram FSM state and data, one row per storage key."""
+    __tablename__ = 'fsm_states'
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON-encoded dict
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BusinessConnectionRecord(Base):
+    """A Telegram Business connection and the chat of the business owner who made it."""
+    __tablename__ = 'business_connections'
+
+    id = Column(String, primary_key=True)  # business_connection_id
+    user_chat_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=True)
+    is_enabled = Column(Boolean, default=True, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,304 @@
+"""Per-client menu analytics: which nodes clients open, how often, and how many clients.
+
+Handlers call ``menu_analytics.record(...)``, which increments in-memory counters for the
+current hour and the current day: events per (connection, node, event type), plus the
+set of clients seen, so unique clients are counted once per period. A background task
+adds the increments since the last write to the ``interaction_rollups`` table (hourly and
+daily rows, upserted with ``count = count + delta``), so the rollups are maintained
+incrementally and never rebuilt from the raw ``interactions`` table.
+
+``report()`` answers the owner's /stats from the daily rollups: a handful of rows per
+connection and day. Rollups only store client counts, so there a client who writes to two
+of the owner's connections, or opens a node both from the menu and through the FAQ, is
+counted once for each (``StatsReport.clients_per_connection``); a restart within an hour
+or day may count a returning client once more for that period. Without a database the
+report comes from today's in-memory counters, which count every client once.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+import config as app_config
+
+if TYPE_CHECKING:  # SQLAlchemy is only imported once a database is configured
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# node_key and event_type of the per-connection totals
+TOTAL = "*"
+# Event types that mean a client opened a node
+OPEN_EVENTS = ("callback", "faq")
+REPORT_DAYS = 7
+_ROLLUP_KEY = ("business_connection_id", "period", "period_start", "node_key", "event_type")
+_RETRY_DELAY = 1.0
+_MAX_RETRY_DELAY = 300.0
+
+
+class _Period:
+    """Counters of one hour or day: (connection, node, event type) -> events and clients."""
+
+    __slots__ = ("kind", "start", "counts", "clients", "pending")
+
+    def __init__(self, kind: str, start: datetime):
+        self.kind = kind
+        self.start = start
+        self.counts: dict[tuple, int] = {}  # Events in this process
+        self.clients: dict[tuple, set[int]] = {}
+        self.pending: dict[tuple, list[int]] = {}  # [events, new clients] not written yet
+
+    def add(self, key: tuple, user_id: int) -> None:
+        self.counts[key] = self.counts.get(key, 0) + 1
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = [0, 0]
+        pending[0] += 1
+        clients = self.clients.get(key)
+        if clients is None:
+            clients = self.clients[key] = set()
+        if user_id not in clients:
+            clients.add(user_id)
+            pending[1] += 1
+
+    def take_pending(self, into: dict[tuple, list[int]]) -> None:
+        """Moves the unwritten increments into `into`, keyed by rollup primary key."""
+        pending, self.pending = self.pending, {}
+        for (connection_id, node_key, event_type), (events, new_clients) in pending.items():
+            totals = into.setdefault((connection_id, self.kind, self.start, node_key, event_type), [0, 0])
+            totals[0] += events
+            totals[1] += new_clients
+
+
+@dataclass(slots=True)
+class NodeStats:
+    node_key: str
+    opens: int = 0  # Over REPORT_DAYS days
+    opens_today: int = 0
+    clients_today: int = 0
+
+
+@dataclass(slots=True)
+class StatsReport:
+    days: int
+    clients_today: int = 0
+    events_today: int = 0
+    events: int = 0
+    messages: int = 0
+    nodes: list[NodeStats] = field(default_factory=list)  # Most opened first
+    from_database: bool = False
+    # Client counts are sums over connections and event types rather than distinct clients
+    clients_per_connection: bool = False
+
+
+class MenuAnalytics:
+    """In-memory hourly and daily counters, rolled up into the database in the background."""
+
+    def __init__(self, flush_interval: float, enabled: bool = True):
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._engine: "AsyncEngine | None" = None
+        self._hour: _Period | None = None
+        self._day: _Period | None = None
+        self._closed: list[_Period] = []  # Finished periods with increments still to write
+        self._retry: dict[tuple, list[int]] = {}  # Increments of a failed write, by rollup primary key
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.recorded = 0
+        self.rows_written = 0
+        self.flush_errors = 0
+
+    def start(self, engine: "AsyncEngine") -> None:
+        """Starts writing rollups to the database."""
+        self._engine = engine
+        self._task = asyncio.create_task(self._run(), name="analytics-rollup")
+
+    def record(self, business_connection_id: str, event_type: str, node_key: str, user_id: int) -> None:
+        """Counts one event of a client. Never blocks."""
+        if not self.enabled:
+            return
+        now = datetime.utcnow()
+        hour = self._current("hour", now.replace(minute=0, second=0, microsecond=0))
+        day = self._current("day", now.replace(hour=0, minute=0, second=0, microsecond=0))
+        key = (business_connection_id, node_key, event_type)
+        total_key = (business_connection_id, TOTAL, TOTAL)
+        for period in (hour, day):
+            period.add(key, user_id)
+            period.add(total_key, user_id)
+        self.recorded += 1
+
+    def _current(self, kind: str, start: datetime) -> _Period:
+        period = self._hour if kind == "hour" else self._day
+        if period is not None and period.start == start:
+            return period
+        if period is not None and self._engine is not None and period.pending:
+            self._closed.append(period)
+        period = _Period(kind, start)
+        if kind == "hour":
+            self._hour = period
+        else:
+            self._day = period
+        return period
+
+    async def flush(self) -> None:
+        """Adds the increments recorded since the last flush to the rollup table."""
+        if self._engine is None:
+            return
+        async with self._flush_lock:
+            # Merged by primary key: one statement must not upsert the same row twice
+            increments, self._retry = self._retry, {}
+            for period in (*self._closed, self._hour, self._day):
+                if period is not None:
+                    period.take_pending(increments)
+            self._closed = []
+            if not increments:
+                return
+            rows = [
+                dict(zip(_ROLLUP_KEY, key), count=events, unique_clients=new_clients)
+                for key, (events, new_clients) in increments.items()
+            ]
+            from models.database import upsert_statement
+            from models.db_models import InteractionRollup
+
+            try:
+                async with self._engine.begin() as conn:
+                    await conn.execute(upsert_statement(
+                        self._engine, InteractionRollup.__table__, rows,
+                        index_elements=list(_ROLLUP_KEY),
+                        update_columns=[], increment_columns=["count", "unique_clients"],
+                    ))
+            except asyncio.CancelledError:
+                self._keep_for_retry(increments)  # Not a failure: written by the next (final) flush
+                raise
+            except Exception:
+                self.flush_errors += 1
+                self._keep_for_retry(increments)
+                raise
+            self.rows_written += len(rows)
+
+    def _keep_for_retry(self, increments: dict[tuple, list[int]]) -> None:
+        """Keeps unwritten increments for the next flush, merged with what was recorded meanwhile."""
+        for key, (events, new_clients) in self._retry.items():
+            totals = increments.setdefault(key, [0, 0])
+            totals[0] += events
+            totals[1] += new_clients
+        self._retry = increments
+
+    async def close(self) -> None:
+        """Stops the background task and writes what is left."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Could not write the final analytics rollups: %s", e)
+
+    async def report(self, connection_ids: list[str], days: int = REPORT_DAYS) -> StatsReport:
+        """Summary of the given connections over the last days (today included)."""
+        if self._engine is not None:
+            await self.flush()  # Include the last minute
+            return await self._report_from_database(connection_ids, days)
+        return self._report_from_memory(connection_ids, days)
+
+    def _report_from_memory(self, connection_ids: list[str], days: int) -> StatsReport:
+        report = StatsReport(days=days)
+        day = self._day
+        if day is None or day.start != datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0):
+            return report
+        rows = [
+            (day.start, key[1], key[2], count, 0)
+            for key, count in day.counts.items()
+            if key[0] in connection_ids
+        ]
+        _build_report(report, rows, day.start)
+        # The client sets are at hand: count each client once across connections and event types
+        report.clients_today = len(_union(day.clients, connection_ids, TOTAL, (TOTAL,)))
+        for node in report.nodes:
+            node.clients_today = len(_union(day.clients, connection_ids, node.node_key, OPEN_EVENTS))
+        return report
+
+    async def _report_from_database(self, connection_ids: list[str], days: int) -> StatsReport:
+        from sqlalchemy import func, select
+        from models.db_models import InteractionRollup as R
+
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        query = (
+            select(R.period_start, R.node_key, R.event_type, func.sum(R.count), func.sum(R.unique_clients))
+            .where(
+                R.business_connection_id.in_(connection_ids),
+                R.period == "day",
+                R.period_start >= today - timedelta(days=days - 1),
+            )
+            .group_by(R.period_start, R.node_key, R.event_type)
+        )
+        async with self._engine.connect() as conn:
+            rows = (await conn.execute(query)).all()
+        report = StatsReport(days=days, from_database=True, clients_per_connection=True)
+        return _build_report(report, rows, today)
+
+    def stats(self) -> dict:
+        pending = len(self._retry) + sum(len(p.pending) for p in (*self._closed, self._hour, self._day) if p is not None)
+        return {
+            "recorded": self.recorded,
+            "pending_rows": pending,
+            "rows_written": self.rows_written,
+            "flush_errors": self.flush_errors,
+        }
+
+    async def _run(self) -> None:
+        delay = _RETRY_DELAY
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                delay = _RETRY_DELAY
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Failed to write analytics rollups, will retry: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RETRY_DELAY)
+
+
+def _union(clients: dict[tuple, set[int]], connection_ids: list[str], node_key: str, event_types) -> set[int]:
+    union: set[int] = set()
+    for connection_id in connection_ids:
+        for event_type in event_types:
+            union.update(clients.get((connection_id, node_key, event_type), ()))
+    return union
+
+
+def _build_report(report: StatsReport, rows, today: datetime) -> StatsReport:
+    """Fills report from daily rollup rows (period_start, node_key, event_type, count, unique_clients)."""
+    nodes: dict[str, NodeStats] = {}
+    for period_start, node_key, event_type, count, clients in rows:
+        is_today = period_start == today
+        if node_key == TOTAL:
+            report.events += count
+            if is_today:
+                report.events_today += count
+                report.clients_today += clients
+        elif event_type == "message":
+            report.messages += count
+        elif event_type in OPEN_EVENTS:
+            node = nodes.get(node_key)
+            if node is None:
+                node = nodes[node_key] = NodeStats(node_key)
+            node.opens += count
+            if is_today:
+                node.opens_today += count
+                node.clients_today += clients
+    report.nodes = sorted(nodes.values(), key=lambda node: node.opens, reverse=True)
+    return report
+
+
+menu_analytics = MenuAnalytics(
+    flush_interval=app_config.ANALYTICS_FLUSH_INTERVAL,
+    enabled=app_config.ANALYTICS_ENABLED,
+)
@@ -0,0 +1,228 @@
+"""Registry of Telegram Business connections.
+
+Connections are persisted in the ``business_connections`` table (when DATABASE_URL is
+configured) and loaded lazily into a bounded in-memory cache. A lookup for an ID that
+is neither cached nor stored falls back to ``bot.get_business_connection``; concurrent
+lookups for the same ID share one request, and IDs Telegram does not know are kept in
+a short-lived negative cache so they do not trigger a request on every message.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import BusinessConnection
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectionInfo:
+    connection_id: str
+    user_chat_id: int
+    user_id: int | None = None
+    is_enabled: bool = True
+
+    @classmethod
+    def from_business_connection(cls, business_connection: BusinessConnection) -> "ConnectionInfo":
+        return cls(
+            connection_id=business_connection.id,
+            user_chat_id=business_connection.user_chat_id,
+            user_id=business_connection.user.id if business_connection.user else None,
+            is_enabled=business_connection.is_enabled,
+        )
+
+
+class BusinessConnectionRegistry:
+    """Bounded, DB-backed cache of business connections with a negative cache for unknown IDs."""
+
+    def __init__(self, cache_size: int, negative_ttl: float, negative_cache_size: int = 10_000):
+        self.cache_size = cache_size
+        self.negative_ttl = negative_ttl
+        self.negative_cache_size = negative_cache_size
+        self._cache: OrderedDict[str, ConnectionInfo] = OrderedDict()
+        self._pinned: dict[str, ConnectionInfo] = {}  # Configured connections, never evicted
+        self._negative: dict[str, float] = {}  # connection_id -> expiry (monotonic)
+        self._lookups: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.db_loads = 0
+        self.api_lookups = 0
+
+    def pin(self, info: ConnectionInfo) -> None:
+        """Registers a connection from configuration (e.g. HC_BUSINESS_CONNECTION_ID)."""
+        self._pinned[info.connection_id] = info
+
+    async def get(self, bot: Bot, connection_id: str) -> ConnectionInfo | None:
+        """Returns the connection, looking in memory, then the database, then the Bot API."""
+        info = self._pinned.get(connection_id)
+        if info is None:
+            info = self._cache.get(connection_id)
+            if info is not None:
+                self._cache.move_to_end(connection_id)
+        if info is not None:
+            self.hits += 1
+            return info
+
+        expires = self._negative.get(connection_id)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.negative_hits += 1
+                return None
+            del self._negative[connection_id]
+
+        task = self._lookups.get(connection_id)
+        if task is None:
+            task = self._lookups[connection_id] = asyncio.create_task(self._lookup(bot, connection_id))
+            task.add_done_callback(lambda _t: self._lookups.pop(connection_id, None))
+        # Shield so one cancelled caller does not cancel the lookup shared with others
+        return await asyncio.shield(task)
+
+    async def update(self, business_connection: BusinessConnection) -> ConnectionInfo | None:
+        """
+        Stores a connection from a BusinessConnection update.
+        Returns the previously known state (from memory or the database), if any.
+        """
+        info = ConnectionInfo.from_business_connection(business_connection)
+        previous = self._pinned.get(info.connection_id) or self._cache.get(info.connection_id)
+        if previous is None:
+            previous = await self._load(info.connection_id)
+        if info.connection_id in self._pinned:
+            self._pinned[info.connection_id] = info
+        self._remember(info)
+        await self._save(info)
+        return previous
+
+    async def owned_by(self, user_chat_id: int) -> list[str]:
+        """IDs of the connections whose owner chats with the bot in user_chat_id."""
+        ids = {
+            info.connection_id
+            for info in (*self._pinned.values(), *self._cache.values())
+            if info.user_chat_id == user_chat_id
+        }
+        if app_config.Config.DATABASE_URL:
+            from sqlalchemy import select
+            from models.database import get_engine
+            from models.db_models import BusinessConnectionRecord
+
+            try:
+                async with get_engine().connect() as conn:
+                    result = await conn.execute(
+                        select(BusinessConnectionRecord.id).where(BusinessConnectionRecord.user_chat_id == user_chat_id)
+                    )
+                    ids.update(result.scalars())
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Could not load the business connections of chat %s: %s", user_chat_id, e)
+        return sorted(ids)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "negative": len(self._negative),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "db_loads": self.db_loads,
+            "api_lookups": self.api_lookups,
+        }
+
+    def _remember(self, info: ConnectionInfo) -> None:
+        self._negative.pop(info.connection_id, None)
+        self._cache[info.connection_id] = info
+        self._cache.move_to_end(info.connection_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _forget(self, connection_id: str) -> None:
+        if len(self._negative) >= self.negative_cache_size:
+            # Oldest entries first (dicts keep insertion order)
+            for stale in list(self._negative)[: self.negative_cache_size // 10 or 1]:
+                del self._negative[stale]
+        self._negative[connection_id] = time.monotonic() + self.negative_ttl
+
+    async def _lookup(self, bot: Bot, connection_id: str) -> ConnectionInfo | None:
+        info = await self._load(connection_id)
+        if info is None:
+            self.api_lookups += 1
+            try:
+                business_connection = await bot.get_business_connection(business_connection_id=connection_id)
+            except TelegramBadRequest as e:
+                logger.warning("Unknown business connection %s: %s", connection_id, e)
+                self._forget(connection_id)
+                return None
+            except TelegramAPIError as e:
+                # Transient failure: do not cache, the next message will try again
+                logger.error("Could not fetch business connection %s: %s", connection_id, e)
+                return None
+            info = ConnectionInfo.from_business_connection(business_connection)
+            await self._save(info)
+        self._remember(info)
+        return info
+
+    async def _load(self, connection_id: str) -> ConnectionInfo | None:
+        if not app_config.Config.DATABASE_URL:
+            return None
+        # Deferred so that SQLAlchemy is only imported when a database is configured
+        from sqlalchemy import select
+        from models.database import get_engine
+        from models.db_models import BusinessConnectionRecord
+
+        engine = get_engine()
+        self.db_loads += 1
+        try:
+            async with engine.connect() as conn:
+                result = await conn.execute(
+                    select(BusinessConnectionRecord).where(BusinessConnectionRecord.id == connection_id)
+                )
+                row = result.first()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Could not load business connection %s from the database: %s", connection_id, e)
+            return None
+        if row is None:
+            return None
+        return ConnectionInfo(
+            connection_id=row.id, user_chat_id=row.user_chat_id, user_id=row.user_id, is_enabled=row.is_enabled
+        )
+
+    async def _save(self, info: ConnectionInfo) -> None:
+        if not app_config.Config.DATABASE_URL:
+            return
+        from models.database import get_engine, upsert_statement
+        from models.db_models import BusinessConnectionRecord
+
+        engine = get_engine()
+        row = {
+            "id": info.connection_id,
+            "user_chat_id": info.user_chat_id,
+            "user_id": info.user_id,
+            "is_enabled": info.is_enabled,
+            "updated_at": datetime.utcnow(),
+        }
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(upsert_statement(
+                    engine, BusinessConnectionRecord.__table__, [row],
+                    index_elements=["id"], update_columns=["user_chat_id", "user_id", "is_enabled", "updated_at"],
+                ))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Could not save business connection %s: %s", info.connection_id, e)
+
+
+connection_registry = BusinessConnectionRegistry(
+    cache_size=app_config.CONNECTION_CACHE_SIZE,
+    negative_ttl=app_config.CONNECTION_NEGATIVE_TTL,
+)
+
+# --- Hardcoded Business Connection Details (Loaded from Config) ---
+if app_config.HC_BUSINESS_CONNECTION_ID and app_config.HC_BUSINESS_OWNER_CHAT_ID:
+    connection_registry.pin(ConnectionInfo(
+        connection_id=app_config.HC_BUSINESS_CONNECTION_ID,
+        user_chat_id=app_config.HC_BUSINESS_OWNER_CHAT_ID,
+        user_id=app_config.HC_BUSINESS_OWNER_CHAT_ID,
+    ))
+    logging.info(f"Initialized with business connection from config: ID='{app_config.HC_BUSINESS_CONNECTION_ID}'")
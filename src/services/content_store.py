@@ -0,0 +1,196 @@
+"""In-memory store for the response files under static/responses.
+
+Response files are read once (at startup or on first use) and then served from
+memory. A size-bounded LRU keeps memory in check, and a background watcher polls
+the modification time of every cached file so edits on disk are picked up
+without a restart. Missing files are cached too, so a broken ``text_path`` does
+not turn every click into a disk lookup.
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+# File types picked up by preload(); other files are only loaded on demand.
+PRELOAD_SUFFIXES = (".html", ".htm", ".txt")
+
+
+@dataclass(slots=True)
+class ContentEntry:
+    """A cached file. ``text`` is None when the file does not exist."""
+
+    text: str | None
+    mtime_ns: int
+    size: int
+
+
+def _load_file(path: str) -> ContentEntry:
+    """Reads a file from disk. Runs in a worker thread."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ContentEntry(text=None, mtime_ns=0, size=0)
+    with open(path, mode="r", encoding="utf-8") as f:
+        text = f.read()
+    return ContentEntry(text=text, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+
+def _scan_changes(snapshot: list[tuple[str, int]]) -> dict[str, ContentEntry]:
+    """Stats every cached path and reloads those that changed. Runs in a worker thread."""
+    changed = {}
+    for path, mtime_ns in snapshot:
+        try:
+            current = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            current = 0
+        except OSError as e:
+            logger.warning("Could not stat response file %s: %s", path, e)
+            continue
+        if current == mtime_ns:
+            continue
+        try:
+            changed[path] = _load_file(path)
+        except OSError as e:
+            logger.error("Could not reload response file %s: %s", path, e)
+    return changed
+
+
+def _walk_files(root: str) -> list[str]:
+    """Lists preloadable files under root. Runs in a worker thread."""
+    paths = []
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(PRELOAD_SUFFIXES):
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+
+class ContentStore:
+    """Size-bounded LRU of response file contents with mtime-based invalidation."""
+
+    def __init__(self, root: str, max_bytes: int, poll_interval: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._entries: OrderedDict[str, ContentEntry] = OrderedDict()
+        self._bytes = 0
+        self._watch_task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    async def read(self, path: str) -> str:
+        """
+        Returns the content of a response file.
+        Raises FileNotFoundError (or OSError) the same way open() would.
+        """
+        entry = self._entries.get(path)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(path)
+        else:
+            self.misses += 1
+            entry = await asyncio.to_thread(_load_file, path)
+            self._put(path, entry)
+        if entry.text is None:
+            raise FileNotFoundError(path)
+        return entry.text
+
+    def version(self, path: str) -> int | None:
+        """Returns the mtime of the cached copy of path, or None if it is not cached."""
+        entry = self._entries.get(path)
+        return entry.mtime_ns if entry is not None else None
+
+    async def preload(self) -> None:
+        """Loads every response file under the root directory into memory."""
+        if not os.path.isdir(self.root):
+            logger.warning("Responses directory %s does not exist. Nothing to preload.", self.root)
+            return
+        paths = await asyncio.to_thread(_walk_files, self.root)
+        for path in paths:
+            if self._bytes >= self.max_bytes:
+                logger.warning("Response cache is full (%d bytes). Remaining files load on first use.", self._bytes)
+                break
+            try:
+                self._put(path, await asyncio.to_thread(_load_file, path))
+            except OSError as e:
+                logger.error("Could not preload response file %s: %s", path, e)
+        logger.info("Preloaded %d response files (%d bytes).", len(self._entries), self._bytes)
+
+    def start(self) -> None:
+        """Starts the background watcher that picks up file changes."""
+        if self.poll_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(), name="content-store-watch")
+
+    async def stop(self) -> None:
+        """Stops the watcher and logs the final counters."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        logger.info("Content store stats: %s", self.stats())
+
+    def invalidate(self, path: str | None = None) -> None:
+        """Drops one cached file, or everything when path is None."""
+        if path is None:
+            self._entries.clear()
+            self._bytes = 0
+            return
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _put(self, path: str, entry: ContentEntry) -> None:
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[path] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            snapshot = [(path, entry.mtime_ns) for path, entry in self._entries.items()]
+            if not snapshot:
+                continue
+            try:
+                changed = await asyncio.to_thread(_scan_changes, snapshot)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Response file watcher failed: %s", e, exc_info=True)
+                continue
+            for path, entry in changed.items():
+                if path in self._entries:  # Skip files evicted while we were scanning
+                    self._put(path, entry)
+                    self.reloads += 1
+                    logger.info("Response file changed on disk, reloaded: %s", path)
+
+
+content_store = ContentStore(
+    root=app_config.RESPONSES_DIR,
+    max_bytes=app_config.RESPONSE_CACHE_MAX_BYTES,
+    poll_interval=app_config.RESPONSE_CACHE_POLL_INTERVAL,
+)
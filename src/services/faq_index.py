@@ -0,0 +1,237 @@
+"""Answers free-text questions in business chats from the client's own content nodes.
+
+For every client, an inverted index maps stemmed terms to the content nodes whose
+response text (and button labels) contain them. It is built on the client's first
+message and kept up to date incrementally: at most once per refresh interval the
+rendered texts are compared with the indexed ones (by identity, so this is cheap
+while nothing changed) and only changed nodes are re-indexed. A message is scored
+with BM25 against the postings of its few terms, which takes microseconds. Only a
+confident match (a high enough score, clearly ahead of the runner-up) is returned.
+Final nodes (``is_final``, e.g. "help") hand the client over to the owner, so they are
+never indexed: such a question reaches the owner instead of getting canned text.
+
+Stemming is a light suffix stripper for Russian and English, good enough to match
+"лодки"/"лодка" or "boats"/"boat" without an external dependency.
+"""
+
+import asyncio
+import html
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+import config as app_config
+from services.templates import template_renderer
+
+logger = logging.getLogger(__name__)
+
+_TAGS = re.compile(r"<[^>]*>")
+_WORD = re.compile(r"[a-zа-яё0-9]+")
+_MIN_STEM = 3
+# Button labels describe a node better than its body text
+_TITLE_BOOST = 3
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+_STOPWORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от
+    меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж
+    вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без
+    будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один
+    почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой хоть после
+    над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед
+    иногда лучше чуть том нельзя такой им более всегда конечно всю между здравствуйте привет добрый день
+    a an the and or but if of to in on at for with by from as is are was were be been it this that these
+    those i you he she we they me my your our their do does did have has had can could would should will
+    what which who whom how when where why please hi hello thanks thank there here about any some
+    """.split()
+)
+
+_RU_ENDINGS = tuple(sorted(
+    """
+    иями ями ами иях ях ах ией ей ий ой ый ая яя ое ее ые ие ого его ому ему ыми ими ом ем ам ям ую юю ов ев
+    ться ется ится ете ите ешь ишь ет ют ут ит ат ят ть им ия ья ье а я о е ы и у ю ь й
+    """.split(), key=len, reverse=True))
+_EN_ENDINGS = ("ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ied", "ed", "es", "ly", "s", "e")
+
+
+def stem(word: str) -> str:
+    """Strips the longest known inflectional ending, keeping a stem of at least three letters."""
+    endings = _RU_ENDINGS if "а" <= word[0] <= "я" or word[0] == "ё" else _EN_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[: -len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased, stemmed terms of a text, without stopwords."""
+    words = _WORD.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if word not in _STOPWORDS and len(word) > 1]
+
+
+def html_to_text(source: str) -> str:
+    return html.unescape(_TAGS.sub(" ", source))
+
+
+@dataclass(slots=True)
+class FaqMatch:
+    node_key: str
+    score: float
+
+
+@dataclass(slots=True)
+class _Document:
+    source: str | None  # The rendered text this was built from
+    terms: Counter
+    length: int
+
+
+@dataclass(slots=True)
+class _ClientIndex:
+    menu: object  # The CompiledMenu the index belongs to
+    documents: dict[str, _Document] = field(default_factory=dict)
+    postings: dict[str, dict[str, int]] = field(default_factory=dict)
+    total_length: int = 0
+    checked_at: float = 0.0
+
+    def add(self, node_key: str, document: _Document) -> None:
+        self.remove(node_key)
+        self.documents[node_key] = document
+        self.total_length += document.length
+        for term, count in document.terms.items():
+            self.postings.setdefault(term, {})[node_key] = count
+
+    def remove(self, node_key: str) -> None:
+        document = self.documents.pop(node_key, None)
+        if document is None:
+            return
+        self.total_length -= document.length
+        for term in document.terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(node_key, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, terms: list[str]) -> list[tuple[float, str]]:
+        count = len(self.documents)
+        if not count or not terms:
+            return []
+        average_length = self.total_length / count or 1.0
+        scores: dict[str, float] = {}
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for node_key, frequency in posting.items():
+                length = self.documents[node_key].length
+                norm = frequency * (_K1 + 1) / (frequency + _K1 * (1 - _B + _B * length / average_length))
+                scores[node_key] = scores.get(node_key, 0.0) + idf * norm
+        return sorted(((score, key) for key, score in scores.items()), reverse=True)[:2]
+
+
+class FaqIndex:
+    """Per-client inverted indexes over content nodes, matched against free-text messages."""
+
+    def __init__(self, root: str, min_score: float, min_margin: float, refresh_interval: float):
+        self.root = root
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.refresh_interval = refresh_interval
+        self._indexes: dict[str, _ClientIndex] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self.queries = 0
+        self.matches = 0
+        self.reindexed = 0
+
+    async def match(self, business_connection_id: str, menu, text: str) -> FaqMatch | None:
+        """Returns the content node that confidently answers text, or None."""
+        terms = tokenize(text)
+        if not terms:
+            return None
+        index = await self._index(business_connection_id, menu)
+        self.queries += 1
+        best = index.search(terms)
+        if not best or best[0][0] < self.min_score:
+            return None
+        if len(best) > 1 and best[0][0] < best[1][0] * self.min_margin:
+            return None  # Ambiguous: let the owner answer
+        self.matches += 1
+        return FaqMatch(node_key=best[0][1], score=best[0][0])
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "matches": self.matches,
+            "reindexed_documents": self.reindexed,
+            "clients": len(self._indexes),
+        }
+
+    async def _index(self, business_connection_id: str, menu) -> _ClientIndex:
+        index = self._indexes.get(business_connection_id)
+        if index is not None and index.menu is menu and time.monotonic() - index.checked_at < self.refresh_interval:
+            return index
+        task = self._refreshing.get(business_connection_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(business_connection_id, menu, index))
+            self._refreshing[business_connection_id] = task
+            task.add_done_callback(lambda _t: self._refreshing.pop(business_connection_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, business_connection_id: str, menu, index: _ClientIndex | None) -> _ClientIndex:
+        if index is None or index.menu is not menu:
+            index = _ClientIndex(menu=menu)  # New client or a reloaded menu: build from scratch
+        titles = _button_titles(menu)
+        content_keys = set()
+        for node_key, node in menu.nodes.items():
+            if node.type != "content" or not node.text_path or node.is_final:
+                continue
+            content_keys.add(node_key)
+            path = os.path.join(self.root, business_connection_id, node.text_path)
+            try:
+                source = await template_renderer.render(business_connection_id, path)
+            except OSError:
+                source = None
+            document = index.documents.get(node_key)
+            if document is not None and document.source is source:
+                continue  # Unchanged since it was indexed
+            terms = Counter(tokenize(html_to_text(source))) if source else Counter()
+            for title in titles.get(node_key, ()):
+                for term in tokenize(title):
+                    terms[term] += _TITLE_BOOST
+            index.add(node_key, _Document(source=source, terms=terms, length=sum(terms.values())))
+            self.reindexed += 1
+        for node_key in set(index.documents) - content_keys:
+            index.remove(node_key)
+        index.checked_at = time.monotonic()
+        self._indexes[business_connection_id] = index
+        return index
+
+
+def _button_titles(menu) -> dict[str, list[str]]:
+    """Maps node keys to the labels of the buttons that lead to them."""
+    titles: dict[str, list[str]] = {}
+    for node in menu.nodes.values():
+        if node.type != "menu" or node.keyboard is None:
+            continue
+        for row in node.keyboard.inline_keyboard:
+            for button in row:
+                if button.callback_data:
+                    titles.setdefault(button.callback_data, []).append(button.text)
+    return titles
+
+
+faq_index = FaqIndex(
+    root=app_config.RESPONSES_DIR,
+    min_score=app_config.FAQ_MIN_SCORE,
+    min_margin=app_config.FAQ_MIN_MARGIN,
+    refresh_interval=app_config.FAQ_REFRESH_INTERVAL,
+)
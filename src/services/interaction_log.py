@@ -0,0 +1,139 @@
+"""Asynchronous, batched writer for the ``interactions`` table.
+
+Handlers call ``interaction_log.record(...)``, which only appends a tuple to a bounded
+in-memory queue. A background task writes the queue to the database with multi-row
+INSERTs whenever a batch fills up or the flush interval passes. If the database falls
+behind and the queue is full, new events are dropped and counted rather than making
+handlers wait.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import TYPE_CHECKING
+
+import config as app_config
+
+if TYPE_CHECKING:  # SQLAlchemy is only imported once a database is configured
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ("user_id", "command", "event_type", "business_connection_id", "chat_id", "timestamp")
+# Wait this long (doubling up to the maximum) after a failed flush
+_RETRY_DELAY = 1.0
+_MAX_RETRY_DELAY = 60.0
+
+
+class InteractionLogger:
+    """Bounded queue of interaction events flushed to the database in bulk."""
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._engine: "AsyncEngine | None" = None
+        self._queue: deque[tuple] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flush_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._engine is not None
+
+    def start(self, engine: "AsyncEngine") -> None:
+        """Starts the background writer. Until then record() is a no-op."""
+        self._engine = engine
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="interaction-log-flush")
+
+    def record(
+        self,
+        user_id: int,
+        event_type: str,
+        command: str,
+        business_connection_id: str | None = None,
+        chat_id: int | None = None,
+    ) -> None:
+        """Queues one interaction. Never blocks and never touches the database."""
+        if self._engine is None:
+            return
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((user_id, command, event_type, business_connection_id, chat_id, datetime.utcnow()))
+        self.recorded += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        """Stops the writer and flushes what is left in the queue."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._queue:
+            if not await self._flush_batch():
+                break
+        logger.info("Interaction log closed: %s", self.stats())
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flush_errors": self.flush_errors,
+        }
+
+    async def _run(self) -> None:
+        delay = _RETRY_DELAY
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if not await self._flush_batch():
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, _MAX_RETRY_DELAY)
+                    break
+                delay = _RETRY_DELAY
+
+    async def _flush_batch(self) -> bool:
+        """Writes up to batch_size queued events. Returns False if the write failed."""
+        count = min(len(self._queue), self.batch_size)
+        from sqlalchemy import insert
+        from models.db_models import Interaction
+
+        rows = [dict(zip(_COLUMNS, event)) for event in islice(self._queue, count)]
+        try:
+            async with self._engine.begin() as conn:
+                await conn.execute(insert(Interaction.__table__).values(rows))
+        except Exception as e:  # pylint: disable=broad-except
+            self.flush_errors += 1
+            logger.error("Failed to write %d interactions, will retry: %s", count, e)
+            return False
+        # Only remove the rows once they are committed
+        for _ in range(count):
+            self._queue.popleft()
+        self.written += count
+        return True
+
+
+interaction_log = InteractionLogger(
+    max_queue=app_config.INTERACTION_LOG_QUEUE_SIZE,
+    batch_size=app_config.INTERACTION_LOG_BATCH_SIZE,
+    flush_interval=app_config.INTERACTION_LOG_FLUSH_INTERVAL,
+)
@@ -0,0 +1,224 @@
+"""Event loop lag watchdog and on-demand profiling.
+
+A heartbeat task wakes up every LOOP_MONITOR_INTERVAL seconds and records how late it
+woke up (the loop lag) in the ``bot_event_loop_lag_seconds`` histogram. A watchdog
+thread checks the heartbeat; when the loop has not come back for LOOP_LAG_THRESHOLD
+seconds, it logs the stack of the loop thread, the handler in that stack and the
+running task while the loop is still blocked, so the culprit is caught in the act.
+
+``start_profile()`` (the owner's /profile command, or SIGUSR1) runs cProfile on the loop
+thread for a few seconds and writes the hottest functions and a snapshot of the pending
+asyncio tasks to a report in PROFILE_DIR.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import config as app_config
+from services.metrics import loop_lag
+
+if TYPE_CHECKING:  # The profilers are only imported when a profiling session starts
+    import cProfile
+
+logger = logging.getLogger(__name__)
+
+_HANDLERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "handlers") + os.sep
+# Functions listed in a profile report (per sort order) and in its summary
+_REPORT_FUNCTIONS = 40
+_SUMMARY_FUNCTIONS = 5
+_TASK_STACK_LIMIT = 8
+
+
+@dataclass(slots=True)
+class ProfileResult:
+    path: str
+    seconds: float
+    hottest: list[str]  # "function (file:line): self ms, total ms", hottest first
+
+
+class LoopMonitor:
+    """Measures loop lag, reports blocking code and runs time-boxed profiling sessions."""
+
+    def __init__(self, interval: float, threshold: float, profile_dir: str):
+        self.interval = interval
+        self.threshold = threshold
+        self.profile_dir = profile_dir
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._last_beat = 0.0
+        self._heartbeat: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._profile: asyncio.Task | None = None
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.profiles = 0
+
+    def start(self) -> None:
+        """Starts the heartbeat and the watchdog thread, and installs the SIGUSR1 profiling trigger."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._beat(), name="loop-monitor-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+        try:
+            self._loop.add_signal_handler(signal.SIGUSR1, self._on_profile_signal)
+        except (AttributeError, NotImplementedError, RuntimeError):  # No SIGUSR1 on Windows
+            pass
+
+    async def stop(self) -> None:
+        if self._heartbeat is None:
+            return
+        self._stopping.set()
+        self._heartbeat.cancel()
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+        self._heartbeat = None
+        if self._profile is not None:
+            self._profile.cancel()
+        try:
+            self._loop.remove_signal_handler(signal.SIGUSR1)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass
+
+    def stats(self) -> dict:
+        return {"max_lag_seconds": self.max_lag, "stalls": self.stalls, "profiles": self.profiles}
+
+    async def _beat(self) -> None:
+        while True:
+            self._last_beat = started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        """Watchdog thread: reports a stall once, while it is happening."""
+        reported = None
+        while not self._stopping.wait(self.interval):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.threshold and beat != reported:
+                reported = beat
+                self._report_stall(blocked)
+
+    def _report_stall(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+        if frame is None:
+            return
+        handler = None
+        innermost = frame
+        while innermost is not None:
+            code = innermost.f_code
+            if code.co_filename.startswith(_HANDLERS_DIR):
+                handler = f"{os.path.basename(code.co_filename)[:-3]}.{code.co_name}"
+                break
+            innermost = innermost.f_back
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        logger.warning(
+            "Event loop blocked for %.0f ms so far, in handler %s (task %s). Loop thread stack:\n%s",
+            blocked * 1000, handler or "-", task.get_name() if task else "-", "".join(traceback.format_stack(frame)),
+        )
+
+    def start_profile(self, seconds: float) -> asyncio.Task | None:
+        """Starts a profiling session; returns its task (resulting in a ProfileResult), or None if one is running."""
+        if self._profile is not None and not self._profile.done():
+            return None
+        self._profile = asyncio.create_task(self._run_profile(seconds), name="loop-monitor-profile")
+        return self._profile
+
+    def _on_profile_signal(self) -> None:
+        task = self.start_profile(app_config.PROFILE_SECONDS)
+        if task is None:
+            logger.warning("SIGUSR1: a profiling session is already running")
+            return
+        logger.info("SIGUSR1: profiling for %s s", app_config.PROFILE_SECONDS)
+        task.add_done_callback(_log_profile_result)
+
+    async def _run_profile(self, seconds: float) -> ProfileResult:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        tasks = _snapshot_tasks()  # On the loop: tasks are not thread-safe
+        path = os.path.join(self.profile_dir, time.strftime("profile-%Y%m%d-%H%M%S.txt"))
+        hottest = await asyncio.to_thread(_write_report, path, profiler, tasks, seconds)
+        self.profiles += 1
+        logger.info("Profile of %s s written to %s", seconds, path)
+        return ProfileResult(path=path, seconds=seconds, hottest=hottest)
+
+
+def _snapshot_tasks() -> list[str]:
+    """One entry per pending task: its name, coroutine and where it is suspended."""
+    entries = []
+    for task in sorted(asyncio.all_tasks(), key=lambda t: t.get_name()):
+        lines = [f"{task.get_name()}: {task.get_coro()!r}"]
+        for frame in task.get_stack(limit=_TASK_STACK_LIMIT):
+            lines.append(f"    {frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}")
+        entries.append("\n".join(lines))
+    return entries
+
+
+def _write_report(path: str, profiler: "cProfile.Profile", tasks: list[str], seconds: float) -> list[str]:
+    """Writes the profile report and returns a summary of the hottest functions. Blocking."""
+    import pstats
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stream.write(f"Profile of the event loop thread over {seconds} s\n\n=== By own time ===\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(_REPORT_FUNCTIONS)
+    stream.write("\n=== By cumulative time ===\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(_REPORT_FUNCTIONS)
+    stream.write(f"\n=== Pending asyncio tasks ({len(tasks)}) ===\n")
+    stream.write("\n\n".join(tasks))
+    stream.write("\n")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(stream.getvalue())
+
+    hottest = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:_SUMMARY_FUNCTIONS]
+    return [
+        f"{name} ({os.path.basename(filename)}:{line}): {own * 1000:.0f} ms self, {total * 1000:.0f} ms total"
+        for (filename, line, name), (_calls, _primitive, own, total, _callers) in hottest
+    ]
+
+
+def _log_profile_result(task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error("Profiling failed: %s", task.exception())
+        return
+    result = task.result()
+    logger.info("Hottest functions:\n%s", "\n".join(result.hottest))
+
+
+loop_monitor = LoopMonitor(
+    interval=app_config.LOOP_MONITOR_INTERVAL,
+    threshold=app_config.LOOP_LAG_THRESHOLD,
+    profile_dir=app_config.PROFILE_DIR,
+)
@@ -0,0 +1,172 @@
+"""Telegram file_id cache for local media files.
+
+Content nodes can point to an image under the client's responses directory
+(``media_path``). The first send uploads the file; the file_id Telegram returns
+is stored under the SHA-256 of the file content and reused for every later
+send, so after warm-up a click costs no upload bandwidth. The mapping is kept
+in a small JSON file, so it survives restarts. A changed file has a new hash
+and is uploaded once more; identical files shared by several clients are
+uploaded only once.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputFile, Message
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+# Parts of the errors Telegram returns for a file_id it no longer accepts (e.g. after the bot token changed)
+_FILE_ID_ERRORS = ("wrong file identifier", "file reference")
+
+
+@dataclass(slots=True)
+class _Fingerprint:
+    """SHA-256 of a file, valid while its mtime and size are unchanged."""
+
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+def _hash_file(path: str) -> _Fingerprint:
+    """Hashes a media file. Runs in a worker thread."""
+    stat = os.stat(path)
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return _Fingerprint(mtime_ns=stat.st_mtime_ns, size=stat.st_size, digest=sha.hexdigest())
+
+
+def _load_index(path: str) -> dict[str, str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error("Could not read media cache %s, starting empty: %s", path, e)
+        return {}
+    return {str(digest): str(file_id) for digest, file_id in data.items()}
+
+
+def _save_index(path: str, index: dict[str, str]) -> None:
+    """Writes the index atomically. Runs in a worker thread."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _is_file_id_error(error: TelegramBadRequest) -> bool:
+    message = str(error).lower().replace("_", " ")  # e.g. FILE_REFERENCE_EXPIRED
+    return any(part in message for part in _FILE_ID_ERRORS)
+
+
+def _sent_file_id(message: Message) -> str | None:
+    """Returns the file_id of the media in a sent message."""
+    if message.photo:
+        return message.photo[-1].file_id  # Largest size
+    for media in (message.document, message.video, message.animation, message.audio):
+        if media is not None:
+            return media.file_id
+    return None
+
+
+class MediaCache:
+    """Maps content hashes of local media files to Telegram file_ids."""
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._index: dict[str, str] | None = None  # Loaded on first use
+        self._fingerprints: dict[str, _Fingerprint] = {}
+        self._upload_locks: dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.stale_ids = 0
+
+    async def send(self, path: str, send: Callable[[str | InputFile], Awaitable[Message]]) -> Message:
+        """
+        Sends a local media file through send(media), which gets either a cached file_id or
+        an upload. Raises FileNotFoundError if the file does not exist.
+        """
+        fingerprint = await self._fingerprint(path)
+        index = await self._load()
+        file_id = index.get(fingerprint.digest)
+        if file_id is not None:
+            try:
+                self.hits += 1
+                return await send(file_id)
+            except TelegramBadRequest as e:
+                if not _is_file_id_error(e):  # e.g. a bad caption: the file_id is fine
+                    raise
+                # The file_id is no longer accepted; upload again
+                logger.warning("Cached file_id for %s was rejected, re-uploading: %s", path, e)
+                self.stale_ids += 1
+                if index.get(fingerprint.digest) == file_id:
+                    del index[fingerprint.digest]
+
+        # One upload per file, even when several clients click at the same time
+        lock = self._upload_locks.setdefault(fingerprint.digest, asyncio.Lock())
+        async with lock:
+            file_id = index.get(fingerprint.digest)
+            if file_id is not None:
+                self.hits += 1
+                return await send(file_id)
+            message = await send(FSInputFile(path))
+            self.uploads += 1
+            self.uploaded_bytes += fingerprint.size
+            file_id = _sent_file_id(message)
+            if file_id:
+                index[fingerprint.digest] = file_id
+                await self._save()
+                logger.info("Uploaded %s, cached its file_id", path)
+        self._upload_locks.pop(fingerprint.digest, None)
+        return message
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "uploaded_bytes": self.uploaded_bytes,
+            "stale_ids": self.stale_ids,
+            "entries": len(self._index or {}),
+        }
+
+    async def _fingerprint(self, path: str) -> _Fingerprint:
+        # A stat per send is cheap; the file is only hashed again when it changed
+        stat = await asyncio.to_thread(os.stat, path)
+        cached = self._fingerprints.get(path)
+        if cached is not None and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            return cached
+        fingerprint = await asyncio.to_thread(_hash_file, path)
+        self._fingerprints[path] = fingerprint
+        return fingerprint
+
+    async def _load(self) -> dict[str, str]:
+        if self._index is None:
+            index = await asyncio.to_thread(_load_index, self.index_path)
+            if self._index is None:
+                self._index = index
+                logger.info("Loaded %d cached media file_ids from %s", len(index), self.index_path)
+        return self._index
+
+    async def _save(self) -> None:
+        try:
+            await asyncio.to_thread(_save_index, self.index_path, dict(self._index))
+        except OSError as e:
+            logger.error("Could not save media cache %s: %s", self.index_path, e)
+
+
+media_cache = MediaCache(app_config.MEDIA_CACHE_FILE)
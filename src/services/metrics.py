@@ -0,0 +1,199 @@
+"""In-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects updated from the event loop thread,
+so they need no locks: an observation is a dict lookup, a bisect and a few integer
+additions. Other components (caches, queues) expose their own counters through
+collectors, which are only called when /metrics is scraped.
+"""
+
+import logging
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:  # aiohttp.web is only imported when the metrics server is started
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond handlers to slow Telegram calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples
+Sample = tuple[dict, float]
+Collector = Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {value}")
+        return lines
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets) + 1)
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {series.sum}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._collectors: list[Collector] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Counter(name, documentation, labelnames)
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for name, metric_type, documentation, samples in collector():
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Metrics collector %r failed: %s", collector, e)
+        return "\n".join(lines) + "\n"
+
+
+def stats_collector(prefix: str, stats: Callable[[], dict]) -> Collector:
+    """
+    Exposes a component's stats() dict as gauges named <prefix>_<key>.
+    A nested dict ({"lanes": {"interactive": {"queued": 1}}}) becomes <prefix>_lanes_queued{name="interactive"}.
+    """
+    def collect():
+        grouped: dict[str, list[Sample]] = {}
+        for key, value in stats().items():
+            if isinstance(value, dict):
+                for name, inner in value.items():
+                    for inner_key, inner_value in (inner.items() if isinstance(inner, dict) else [("value", inner)]):
+                        grouped.setdefault(f"{prefix}_{key}_{inner_key}", []).append(({"name": name}, inner_value))
+            elif isinstance(value, (int, float)):
+                grouped.setdefault(f"{prefix}_{key}", []).append(({}, value))
+        return [(name, "gauge", f"{prefix} {name[len(prefix) + 1:]}", samples) for name, samples in grouped.items()]
+    return collect
+
+
+registry = MetricsRegistry()
+
+# --- Shared metrics ---
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds", "Time spent in a handler, including inner middlewares.", ("router", "handler")
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handlers that raised an exception.", ("router", "handler", "error")
+)
+update_duration = registry.histogram(
+    "bot_update_duration_seconds", "Time to process one update end to end.", ("event_type",)
+)
+api_duration = registry.histogram(
+    "bot_api_request_duration_seconds", "Bot API call latency (after rate limiting).", ("method",)
+)
+api_errors = registry.counter(
+    "bot_api_errors_total", "Bot API calls that failed.", ("method", "error")
+)
+api_calls_saved = registry.counter(
+    "bot_api_calls_saved_total", "Bot API calls skipped because they would not have changed anything.", ("method",)
+)
+api_inline_answers = registry.counter(
+    "bot_api_inline_answers_total", "Bot API methods sent in the webhook response instead of a request.", ("method",)
+)
+loop_lag = registry.histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop heartbeat woke up.", ()
+)
+updates_duplicate = registry.counter(
+    "bot_updates_duplicate_total", "Updates dropped because they were already processed.", ("reason",)
+)
+updates_throttled = registry.counter(
+    "bot_updates_throttled_total", "Updates dropped by flood control before any handler ran.", ("event_type", "scope")
+)
+
+
+async def _handle_metrics(_request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> "web.AppRunner":
+    """Serves the registry in Prometheus text format at http://host:port/metrics."""
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,285 @@
+"""Rate-limit-aware scheduling of outbound Bot API calls.
+
+Every message send (send*, forward* and copy* methods) passes through
+OutboundRateLimitMiddleware, which waits for a token from the global bucket (~30 msg/s) and from the chat's own bucket
+before the call goes out. Waiting requests are served by priority lane, so interactive
+callback replies go ahead of owner digests and broadcasts. ``TelegramRetryAfter`` is
+honoured by pausing the affected chat (or everything) and retrying the call.
+
+Handlers keep calling ``bot.send_message`` & co. as usual, which awaits delivery.
+To fire and forget, hand the coroutine to ``outbound_scheduler.enqueue()``.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Outbound lanes, served in this order."""
+
+    INTERACTIVE = 0  # Replies to a user's click or message
+    NOTIFICATION = 1  # Owner digests
+    BROADCAST = 2  # Bulk / background sends
+
+
+# Bot API methods that post a message to a chat, which is what Telegram's flood limits count
+_SEND_PREFIXES = ("send", "forward", "copy")
+_NOT_SENDS = frozenset({"sendChatAction"})
+
+
+def is_message_send(method: TelegramMethod) -> bool:
+    api_method = method.__api_method__
+    return api_method.startswith(_SEND_PREFIXES) and api_method not in _NOT_SENDS
+
+
+_current_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def outbound_priority(priority: Priority):
+    """Sends every Bot API call made inside the block on the given lane."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class _Waiter:
+    __slots__ = ("chat_id", "future", "enqueued_at")
+
+    def __init__(self, chat_id: Any, future: asyncio.Future, enqueued_at: float):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class _LaneStats:
+    __slots__ = ("granted", "delayed", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.granted = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class OutboundScheduler:
+    """Token buckets per chat and globally, with priority lanes for waiting requests."""
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, max_chat_buckets: int = 10_000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chat_buckets = max_chat_buckets
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[Any, TokenBucket] = {}
+        self._lanes: list[deque[_Waiter]] = [deque() for _ in Priority]
+        self._lane_stats = [_LaneStats() for _ in Priority]
+        self._wakeup = asyncio.Event()
+        self._pump_task: asyncio.Task | None = None
+        self._background: set[asyncio.Task] = set()
+        self.retry_after_events = 0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                now = time.monotonic()
+                for idle_chat in [c for c, b in self._chats.items() if b.is_idle(now)]:
+                    del self._chats[idle_chat]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def set_global_rate(self, rate: float) -> None:
+        """Changes the limit across all chats, e.g. to this process's share of the bot's limit."""
+        self._global = TokenBucket(rate, rate)
+
+    async def acquire(self, chat_id: Any, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Waits until a request to chat_id may be sent. Returns the time spent waiting."""
+        stats = self._lane_stats[priority]
+        now = time.monotonic()
+        chat = self._chat_bucket(chat_id)
+        # Fast path: nobody is queued and both buckets have a token
+        if not any(self._lanes) and self._global.wait_time(now) == 0 and chat.wait_time(now) == 0:
+            self._global.consume()
+            chat.consume()
+            stats.granted += 1
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(_Waiter(chat_id, future, now))
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name="outbound-scheduler")
+        waited = await future
+        stats.granted += 1
+        stats.delayed += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        return waited
+
+    def penalize(self, chat_id: Any, retry_after: float) -> None:
+        """Applies a RetryAfter to one chat, or to all traffic when chat_id is None."""
+        self.retry_after_events += 1
+        bucket = self._global if chat_id is None else self._chat_bucket(chat_id)
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+        self._wakeup.set()
+
+    def enqueue(self, coro: Awaitable, priority: Priority = Priority.BROADCAST) -> asyncio.Task:
+        """Schedules a Bot API call in the background on the given lane."""
+        task = asyncio.create_task(self._run_enqueued(coro, priority))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _run_enqueued(self, coro: Awaitable, priority: Priority) -> Any:
+        _current_priority.set(priority)  # Tasks run in their own context copy
+        try:
+            return await coro
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Background send failed: %s", e)
+            return None
+
+    async def drain(self, timeout: float | None = None) -> None:
+        """Waits for enqueued background sends to finish."""
+        if self._background:
+            await asyncio.wait(list(self._background), timeout=timeout)
+
+    async def _pump(self) -> None:
+        while any(self._lanes):
+            self._wakeup.clear()
+            now = time.monotonic()
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+
+            next_ready = None
+            granted = False
+            for lane in self._lanes:
+                index = 0
+                while index < len(lane):
+                    waiter = lane[index]
+                    if waiter.future.done():  # Caller was cancelled
+                        del lane[index]
+                        continue
+                    chat = self._chat_bucket(waiter.chat_id)
+                    chat_wait = chat.wait_time(now)
+                    if chat_wait == 0:
+                        del lane[index]
+                        self._global.consume()
+                        chat.consume()
+                        waiter.future.set_result(now - waiter.enqueued_at)
+                        granted = True
+                        break
+                    next_ready = chat_wait if next_ready is None else min(next_ready, chat_wait)
+                    index += 1
+                if granted:
+                    break
+
+            if granted:
+                await asyncio.sleep(0)  # Let the granted caller run
+                continue
+            if next_ready is None:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_ready)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        lanes = {}
+        for priority in Priority:
+            stats = self._lane_stats[priority]
+            lanes[priority.name.lower()] = {
+                "queued": len(self._lanes[priority]),
+                "granted": stats.granted,
+                "delayed": stats.delayed,
+                "wait_avg": stats.wait_total / stats.delayed if stats.delayed else 0.0,
+                "wait_max": stats.wait_max,
+            }
+        return {
+            "lanes": lanes,
+            "retry_after_events": self.retry_after_events,
+            "chat_buckets": len(self._chats),
+            "background_tasks": len(self._background),
+        }
+
+
+class OutboundRateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that routes message sends through the scheduler."""
+
+    def __init__(self, scheduler: OutboundScheduler, max_retries: int = 3):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not is_message_send(method):
+            # getChat, edits, answerCallbackQuery, getUpdates, ... are not message sends
+            return await make_request(bot, method)
+
+        priority = _current_priority.get()
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.scheduler.penalize(chat_id, e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    "%s to chat %s hit RetryAfter %ss, retry %d/%d",
+                    type(method).__name__, chat_id, e.retry_after, attempt, self.max_retries,
+                )
+
+
+outbound_scheduler = OutboundScheduler(
+    global_rate=app_config.OUTBOUND_GLOBAL_RATE,
+    chat_rate=app_config.OUTBOUND_CHAT_RATE,
+    chat_burst=app_config.OUTBOUND_CHAT_BURST,
+)
@@ -0,0 +1,160 @@
+"""Coalesced notifications to business owners.
+
+Instead of one Telegram message per incoming client message, notifications are
+buffered per owner for a short window and sent as a single digest grouped by
+client. A burst from one client collapses into one entry, which keeps the owner's
+chat well below Telegram's per-chat rate limit.
+"""
+
+import asyncio
+import html
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import User
+
+import config as app_config
+from services.outbound import Priority, outbound_priority
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+# Longer client messages are shortened in the digest
+MAX_QUOTED_TEXT = 300
+
+
+@dataclass(slots=True)
+class _ClientEntry:
+    client_id: int
+    client_name: str
+    chat_id: int
+    count: int = 0
+    texts: deque = field(default_factory=deque)
+
+
+def _quote(text: str | None) -> str:
+    text = text or "[No Text]"
+    if len(text) > MAX_QUOTED_TEXT:
+        text = text[:MAX_QUOTED_TEXT - 1] + "…"
+    return f"<i>{html.escape(text)}</i>"
+
+
+def _render_entry(entry: _ClientEntry) -> str:
+    client_name_html = f"<a href='tg://user?id={entry.client_id}'>{html.escape(entry.client_name)}</a>"
+    if entry.count == 1:
+        return (
+            f"Received message from {client_name_html} (Chat ID: {entry.chat_id}):\n"
+            f"{_quote(entry.texts[0])}"
+        )
+    lines = [f"{client_name_html} (Chat ID: {entry.chat_id}) — {entry.count} messages:"]
+    skipped = entry.count - len(entry.texts)
+    if skipped:
+        lines.append(f"… {skipped} earlier")
+    lines.extend(_quote(text) for text in entry.texts)
+    return "\n".join(lines)
+
+
+def render_digest(entries: list[_ClientEntry]) -> list[str]:
+    """Renders buffered entries into one or more messages within Telegram's length limit."""
+    blocks = [_render_entry(entry) for entry in entries]
+    total = sum(entry.count for entry in entries)
+    if len(entries) > 1:
+        blocks.insert(0, f"📨 {total} new messages from {len(entries)} clients:")
+
+    messages, current = [], ""
+    for block in blocks:
+        if len(block) > MAX_MESSAGE_LENGTH:
+            block = block[:MAX_MESSAGE_LENGTH]  # Cannot happen with MAX_QUOTED_TEXT, kept as a guard
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            candidate = block
+        current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+
+class OwnerNotifier:
+    """Buffers client-message notifications per owner and sends them as digests."""
+
+    def __init__(self, window: float, texts_per_client: int = 3):
+        self.window = window
+        self.texts_per_client = texts_per_client
+        self._buffers: dict[int, OrderedDict[int, _ClientEntry]] = {}
+        self._bots: dict[int, Bot] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.notifications = 0
+        self.digests_sent = 0
+        self.send_failures = 0
+
+    def notify(self, bot: Bot, owner_chat_id: int, client_user: User, client_chat_id: int, text: str | None) -> None:
+        """Queues a notification about a client message. Never blocks the caller."""
+        self.notifications += 1
+        buffer = self._buffers.setdefault(owner_chat_id, OrderedDict())
+        entry = buffer.get(client_user.id)
+        if entry is None:
+            entry = buffer[client_user.id] = _ClientEntry(
+                client_id=client_user.id,
+                client_name=client_user.full_name,
+                chat_id=client_chat_id,
+                texts=deque(maxlen=self.texts_per_client),
+            )
+        entry.count += 1
+        entry.texts.append(text)
+        self._bots[owner_chat_id] = bot
+
+        if self.window <= 0:
+            self._start_flush(owner_chat_id)
+        elif owner_chat_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[owner_chat_id] = loop.call_later(self.window, self._start_flush, owner_chat_id)
+
+    def _start_flush(self, owner_chat_id: int) -> None:
+        task = asyncio.create_task(self._flush(owner_chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, owner_chat_id: int) -> None:
+        timer = self._timers.pop(owner_chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        buffer = self._buffers.pop(owner_chat_id, None)
+        bot = self._bots.pop(owner_chat_id, None)
+        if not buffer or bot is None:
+            return
+        with outbound_priority(Priority.NOTIFICATION):  # Client-facing replies go first
+            for text in render_digest(list(buffer.values())):
+                try:
+                    await bot.send_message(
+                        chat_id=owner_chat_id,
+                        text=text,
+                        parse_mode="HTML",
+                        disable_web_page_preview=True
+                    )
+                    self.digests_sent += 1
+                except TelegramAPIError as e:
+                    self.send_failures += 1
+                    logger.error("Failed to notify business owner %s: %s", owner_chat_id, e)
+
+    async def flush_all(self) -> None:
+        """Sends every buffered digest now. Used on shutdown."""
+        for owner_chat_id in list(self._buffers):
+            self._start_flush(owner_chat_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "notifications": self.notifications,
+            "digests_sent": self.digests_sent,
+            "send_failures": self.send_failures,
+            "owners_pending": len(self._buffers),
+        }
+
+
+owner_notifier = OwnerNotifier(window=app_config.OWNER_NOTIFY_WINDOW)
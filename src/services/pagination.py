@@ -0,0 +1,168 @@
+"""Splits long HTML responses into pages that Telegram accepts.
+
+Telegram rejects message texts over 4096 characters (1024 for captions), counted
+after HTML parsing in UTF-16 code units. split_html() cuts a response at paragraph,
+line or word boundaries, never inside a tag or an entity, and closes the tags open
+at a cut and reopens them on the next page, so every page is valid HTML on its own.
+
+Splitting happens once per rendered text: PageCache keeps the pages of the current
+version of each (client, node) and hands them out until the text changes, so a page
+switch is a dict lookup. Texts are split on their first view, not when the content
+store loads the file: the pages depend on the rendered text (template variables differ
+per client) and on the limit (message or caption, minus an appended link), which are
+only known when the node is sent.
+"""
+
+import html
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+# Callback data of a page button: "<node_key>|p<page>"
+PAGE_SEPARATOR = "|p"
+
+_TOKEN = re.compile(r"(<[^>]*>)")
+_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)")
+# One visible character: an HTML entity or a single code point
+_UNIT = re.compile(r"&(?:#\d+|#[xX][0-9a-fA-F]+|[a-zA-Z]+);|.", re.S)
+_MAX_PAGE_CACHE = 10_000
+
+
+def _weight(unit: str) -> int:
+    """Length of a visible character in UTF-16 code units, as Telegram counts it."""
+    if len(unit) > 1:
+        unit = html.unescape(unit)
+    return sum(2 if ord(ch) > 0xFFFF else 1 for ch in unit)
+
+
+def visible_length(text: str) -> int:
+    """Length of an HTML text as Telegram counts it (tags excluded, entities as one character)."""
+    return sum(_weight(unit) for part in _TOKEN.split(text) if part and not part.startswith("<") for unit in _UNIT.findall(part))
+
+
+def _cut(units: list[str], room: int) -> int:
+    """
+    Returns how many units fit into room, preferring to end after a paragraph break,
+    then a line break, then a space. Breaks in the first half of the room are ignored.
+    """
+    used = 0
+    fit = 0
+    for unit in units:
+        weight = _weight(unit)
+        if used + weight > room:
+            break
+        used += weight
+        fit += 1
+    if fit == len(units):
+        return fit
+    floor = fit // 2
+    for separator in ("\n\n", "\n", " "):
+        for i in range(fit, floor, -1):
+            if separator == "\n\n":
+                if i >= 2 and units[i - 1] == "\n" and units[i - 2] == "\n":
+                    return i
+            elif units[i - 1] == separator:
+                return i
+    return fit
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> tuple[str, ...]:
+    """Splits Telegram HTML into pages of at most limit visible characters each."""
+    if visible_length(text) <= limit:
+        return (text,)
+
+    pages: list[str] = []
+    open_tags: list[tuple[str, str]] = []  # (name, opening tag as written)
+    current: list[str] = []
+    used = 0
+
+    def close_page() -> None:
+        nonlocal used
+        body = "".join(current)
+        if used:
+            pages.append(body + "".join(f"</{name}>" for name, _ in reversed(open_tags)))
+        current.clear()
+        current.extend(tag for _, tag in open_tags)
+        used = 0
+
+    for token in _TOKEN.split(text):
+        if not token:
+            continue
+        if token.startswith("<"):
+            match = _TAG.match(token)
+            if match:
+                name = match.group(2).lower()
+                if match.group(1):
+                    for i in range(len(open_tags) - 1, -1, -1):
+                        if open_tags[i][0] == name:
+                            del open_tags[i]
+                            break
+                elif not token.endswith("/>"):
+                    open_tags.append((name, token))
+            current.append(token)
+            continue
+
+        units = _UNIT.findall(token)
+        while units:
+            if not used:
+                # No leading blank lines on a new page
+                while units and units[0] in ("\n", " "):
+                    units.pop(0)
+                if not units:
+                    break
+            count = _cut(units, limit - used)
+            if count == 0 or (used and count < len(units) and units[count - 1] not in ("\n", " ")):
+                # Nothing fits, or only part of a word: start the word on the next page instead
+                close_page()
+                continue
+            chunk = units[:count]
+            current.append("".join(chunk))
+            used += sum(_weight(unit) for unit in chunk)
+            units = units[count:]
+            if units:
+                close_page()
+    close_page()
+    return tuple(pages)
+
+
+def parse_page(callback_data: str) -> tuple[str, int | None]:
+    """Splits "<node_key>|p<page>" into the node key and the 1-based page (None without a page)."""
+    node_key, separator, page = callback_data.partition(PAGE_SEPARATOR)
+    if separator and page.isdigit():
+        return node_key, max(int(page), 1)
+    return callback_data, None
+
+
+class PageCache:
+    """Pages of the current text of each (client, node), split once per text version."""
+
+    def __init__(self, max_entries: int = _MAX_PAGE_CACHE):
+        self.max_entries = max_entries
+        self._pages: dict[tuple, tuple[str, tuple[str, ...]]] = {}
+        self.splits = 0
+        self.hits = 0
+
+    def pages(self, key: tuple, text: str, limit: int = MESSAGE_LIMIT) -> tuple[str, ...]:
+        cache_key = (*key, limit)
+        entry = self._pages.get(cache_key)
+        # Rendered texts are cached objects, so an unchanged text is the very same string
+        if entry is not None and (entry[0] is text or entry[0] == text):
+            self.hits += 1
+            return entry[1]
+        pages = split_html(text, limit)
+        self.splits += 1
+        if len(pages) > 1:
+            logger.debug("Split %s into %d pages", key, len(pages))
+        self._pages[cache_key] = (text, pages)
+        if len(self._pages) > self.max_entries:
+            del self._pages[next(iter(self._pages))]
+        return pages
+
+    def stats(self) -> dict:
+        return {"splits": self.splits, "hits": self.hits, "entries": len(self._pages)}
+
+
+page_cache = PageCache()
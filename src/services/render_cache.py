@@ -0,0 +1,94 @@
+"""Tracks what each bot message currently shows, to skip edits that would change nothing.
+
+Impatient users often tap the same button several times. Without this, every tap
+costs an editMessageText round trip that Telegram answers with "message is not
+modified". The cache maps (chat_id, message_id) to a render signature (node key,
+text, keyboard content) in a bounded LRU; an edit with the same signature is skipped.
+Skipped calls never reach the outbound rate limiter, and are counted in
+bot_api_calls_saved_total.
+"""
+
+import logging
+from collections import OrderedDict
+
+import config as app_config
+from services.metrics import api_calls_saved
+
+logger = logging.getLogger(__name__)
+
+
+# Keyboards whose JSON is remembered; they are pre-built, so a few thousand cover every menu
+KEYBOARD_CACHE_SIZE = 4096
+_keyboard_json: OrderedDict[int, tuple[object, str]] = OrderedDict()  # id -> (keyboard, JSON)
+
+
+def _keyboard_content(keyboard) -> str | None:
+    """
+    The keyboard's JSON, computed once per keyboard object. The cache keeps the keyboard
+    alive, so its id cannot be reused by another object while the entry exists.
+    """
+    if keyboard is None:
+        return None
+    cached = _keyboard_json.get(id(keyboard))
+    if cached is not None and cached[0] is keyboard:
+        _keyboard_json.move_to_end(id(keyboard))
+        return cached[1]
+    content = keyboard.model_dump_json(exclude_none=True)
+    _keyboard_json[id(keyboard)] = (keyboard, content)
+    if len(_keyboard_json) > KEYBOARD_CACHE_SIZE:
+        _keyboard_json.popitem(last=False)
+    return content
+
+
+def render_signature(node_key: str, text: str, keyboard=None) -> tuple:
+    """
+    Identifies a render by content, so two renders are only equal if Telegram would show
+    the same message. Comparing texts is cheap in the common case: strings served by the
+    content store and the page cache are the same objects until the file changes.
+    """
+    return node_key, text, _keyboard_content(keyboard)
+
+
+class RenderCache:
+    """Bounded LRU of (chat_id, message_id) -> render signature."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._renders: OrderedDict[tuple[int, int], tuple] = OrderedDict()
+        self.saved = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_current(self, chat_id: int, message_id: int, signature: tuple, method: str = "EditMessageText") -> bool:
+        """Returns True (and counts a saved call) if the message already shows this render."""
+        key = (chat_id, message_id)
+        if self._renders.get(key) == signature:
+            self._renders.move_to_end(key)
+            self.saved += 1
+            api_calls_saved.inc(method)
+            logger.debug("Skipped %s for message %s: already up to date", method, key)
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, chat_id: int, message_id: int, signature: tuple) -> None:
+        key = (chat_id, message_id)
+        self._renders[key] = signature
+        self._renders.move_to_end(key)
+        if len(self._renders) > self.max_entries:
+            self._renders.popitem(last=False)
+            self.evictions += 1
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        self._renders.pop((chat_id, message_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "saved": self.saved,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._renders),
+        }
+
+
+render_cache = RenderCache(max_entries=app_config.RENDER_CACHE_SIZE)
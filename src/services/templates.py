@@ -0,0 +1,181 @@
+"""Response templates with per-client business variables.
+
+Response files may contain placeholders such as ``{{ business_hours }}`` or
+``{{ price_boat1 }}``. Each file is compiled once per version into literal parts
+and variable names; a click then only joins strings, and only when the output is
+not cached yet. Values come from the bot-wide settings in config.py, overridden by
+the client's ``variables.json`` next to its response files. Both files are read
+through the content store, so edits are picked up by its watcher. When a client's
+variables change, only outputs that use a changed variable are rendered again.
+Values are HTML-escaped, as responses are sent with parse_mode=HTML.
+"""
+
+import html
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+import config as app_config
+from services.content_store import content_store
+
+logger = logging.getLogger(__name__)
+
+VARIABLES_FILE = "variables.json"
+# Rendered outputs kept in memory; the oldest are dropped first.
+MAX_RENDERED_OUTPUTS = 20_000
+_PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+def _global_variables() -> dict[str, str]:
+    """Bot-wide defaults; clients override them in variables.json."""
+    values = {
+        "business_hours": app_config.BUSINESS_HOURS,
+        "contact_email": app_config.BUSINESS_CONTACT_EMAIL,
+        "business_description": app_config.BUSINESS_DESCRIPTION,
+        "address": app_config.BUSINESS_LOCATION_ADDRESS,
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTemplate:
+    """A template split into literal parts (even indices) and variable names (odd indices)."""
+
+    parts: tuple[str, ...]
+    source: str
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        return self.parts[1::2]
+
+    def render(self, values: dict[str, str]) -> str:
+        if len(self.parts) == 1:
+            return self.source  # No placeholders: reuse the cached string itself
+        out = list(self.parts)
+        for i in range(1, len(out), 2):
+            name = out[i]
+            value = values.get(name)
+            out[i] = value if value is not None else "{{" + name + "}}"
+        return "".join(out)
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    # re.split with one group alternates literal, name, literal, ...
+    return CompiledTemplate(parts=tuple(_PLACEHOLDER.split(source)), source=source)
+
+
+@dataclass(slots=True)
+class _ClientVariables:
+    source: str | None  # Raw variables.json text, None if the client has none
+    values: dict[str, str]  # HTML-escaped
+    generation: int
+    version: int | None  # mtime of variables.json in the content store (0 while it does not exist)
+
+
+@dataclass(slots=True)
+class _Rendered:
+    template: CompiledTemplate
+    version: int | None
+    generation: int
+    used_values: tuple
+    output: str
+
+
+class TemplateRenderer:
+    """Renders response files for a client, caching compiled templates and outputs."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._globals = {name: html.escape(str(value), quote=False) for name, value in _global_variables().items()}
+        self._variables: dict[str, _ClientVariables] = {}
+        self._rendered: dict[tuple[str, str], _Rendered] = {}
+        self.compiles = 0
+        self.renders = 0
+        self.hits = 0
+
+    async def render(self, client_id: str, path: str) -> str:
+        """
+        Returns the rendered content of a response file for a client.
+        Raises FileNotFoundError (or OSError) like ContentStore.read().
+        """
+        source = await content_store.read(path)
+        version = content_store.version(path)
+        variables = await self._client_variables(client_id)
+        key = (client_id, path)
+        entry = self._rendered.get(key)
+
+        if entry is not None and entry.template.source is source and entry.version == version:
+            if entry.generation == variables.generation:
+                self.hits += 1
+                return entry.output
+            # The client's variables changed: re-render only if one this template uses did
+            used_values = tuple(variables.values.get(name) for name in entry.template.variables)
+            entry.generation = variables.generation
+            if used_values == entry.used_values:
+                self.hits += 1
+                return entry.output
+            template = entry.template
+        else:
+            template = compile_template(source)
+            self.compiles += 1
+            used_values = tuple(variables.values.get(name) for name in template.variables)
+
+        output = template.render(variables.values)
+        self.renders += 1
+        unknown = [name for name, value in zip(template.variables, used_values) if value is None]
+        if unknown:
+            logger.warning("Template %s uses undefined variables for client %s: %s", path, client_id, ", ".join(unknown))
+        self._rendered[key] = _Rendered(template, version, variables.generation, used_values, output)
+        if len(self._rendered) > MAX_RENDERED_OUTPUTS:
+            del self._rendered[next(iter(self._rendered))]
+        return output
+
+    def stats(self) -> dict:
+        return {
+            "compiles": self.compiles,
+            "renders": self.renders,
+            "hits": self.hits,
+            "outputs": len(self._rendered),
+            "clients": len(self._variables),
+        }
+
+    async def _client_variables(self, client_id: str) -> _ClientVariables:
+        path = os.path.join(self.root, client_id, VARIABLES_FILE)
+        current = self._variables.get(client_id)
+        version = content_store.version(path)
+        # Unchanged since the last click, including a variables.json that does not exist:
+        # skip the read, which would raise and catch FileNotFoundError every time
+        if current is not None and version is not None and current.version == version:
+            return current
+        try:
+            source = await content_store.read(path)
+        except FileNotFoundError:
+            source = None
+        except OSError as e:
+            logger.error("Could not read %s: %s", path, e)
+            source = None
+
+        version = content_store.version(path)
+        # The content store hands out the same string object until the file changes or is evicted
+        if current is not None and (current.source is source or current.source == source):
+            current.version = version
+            return current
+
+        values = dict(self._globals)
+        if source is not None:
+            try:
+                client_values = json.loads(source)
+                if not isinstance(client_values, dict):
+                    raise ValueError("the top level must be an object")
+                values.update((str(k), html.escape(str(v), quote=False)) for k, v in client_values.items())
+            except ValueError as e:
+                logger.error("Invalid %s, using bot-wide values only: %s", path, e)
+        generation = current.generation + 1 if current is not None else 0
+        variables = _ClientVariables(source=source, values=values, generation=generation, version=version)
+        self._variables[client_id] = variables
+        return variables
+
+
+template_renderer = TemplateRenderer(root=app_config.RESPONSES_DIR)
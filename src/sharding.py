@@ -0,0 +1,351 @@
+"""
+Multi-process runtime: one front process, N worker processes.
+
+The front process receives updates (long polling or webhook) and routes each one by
+a stable hash of its business_connection_id (or chat id) to a worker over a Unix
+socket, one JSON update per line. Every worker runs the normal handler stack via
+bot_runtime(), so all updates of one business connection, and with them its FSM
+state, owner digests and ordering, stay in one process. Within a worker, updates
+with the same key are processed in order; different keys run concurrently.
+
+The owner's commands (/stats, /profile) arrive in the owner's private chat with the bot,
+not through the business connection. The front remembers which connection each owner
+chat belongs to (from business_connection updates, the configured connection and the
+database) and routes the owner's private messages to that connection's worker. An owner
+with several connections is routed by the first one; /stats then sees the others'
+events once their workers have flushed their analytics (with a database).
+
+Telegram's global send limit applies to the bot token, not the process, so each worker
+sends at most OUTBOUND_GLOBAL_RATE / SHARD_WORKERS messages per second.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import tempfile
+import zlib
+from collections import OrderedDict, deque
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+
+import config as app_config
+
+logger = logging.getLogger(__name__)
+
+# Updates kept per shard while its worker is (re)starting
+MAX_BUFFERED_UPDATES = 10_000
+# Private chats whose owner connection (or lack of one) the front remembers
+MAX_OWNER_CHATS = 10_000
+WORKER_CONNECT_TIMEOUT = 30.0
+
+
+def shard_key(update: dict):
+    """Returns the value that decides which worker handles an update."""
+    if "business_connection" in update:
+        return update["business_connection"]["id"]
+    for event_type in ("business_message", "edited_business_message", "deleted_business_messages"):
+        if event_type in update:
+            return update[event_type]["business_connection_id"]
+    callback = update.get("callback_query")
+    if callback is not None:
+        message = callback.get("message") or {}
+        return message.get("business_connection_id") or message.get("chat", {}).get("id") or callback["from"]["id"]
+    for event in update.values():
+        if isinstance(event, dict):
+            if "chat" in event:
+                return event["chat"]["id"]
+            if "from" in event:
+                return event["from"]["id"]
+    return update.get("update_id", 0)
+
+
+def private_chat_id(update: dict) -> int | None:
+    """Chat id of a message in a private chat with the bot (where owners send commands), else None."""
+    for event_type in ("message", "edited_message"):
+        message = update.get(event_type)
+        if message is not None and message.get("chat", {}).get("type") == "private":
+            return message["chat"]["id"]
+    return None
+
+
+def shard_for(key, shards: int) -> int:
+    # crc32 rather than hash(): it must be identical in every process and across restarts
+    return zlib.crc32(str(key).encode()) % shards
+
+
+# --- Worker side ---
+
+def worker_entry(index: int, socket_path: str, global_rate: float) -> None:
+    """Process target for a shard worker."""
+    # The front process coordinates shutdown by closing the socket; a Ctrl+C or a service
+    # manager's SIGTERM sent to the whole process group must not cut workers short.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, socket_path, global_rate))
+
+
+async def _run_worker(index: int, socket_path: str, global_rate: float) -> None:
+    from main import bot_runtime
+    from services.outbound import outbound_scheduler
+
+    outbound_scheduler.set_global_rate(global_rate)
+
+    metrics_port = app_config.METRICS_PORT + 1 + index if app_config.METRICS_PORT else 0
+    async with bot_runtime(metrics_port=metrics_port, shard=index) as (bot, dp):
+        reader, _writer = await _connect(socket_path)
+        logger.info("Shard worker %d connected to %s", index, socket_path)
+        await _serve_shard(dp, bot, reader)
+        logger.info("Shard worker %d: front closed the connection, shutting down", index)
+
+
+async def _connect(socket_path: str):
+    deadline = asyncio.get_running_loop().time() + WORKER_CONNECT_TIMEOUT
+    while True:
+        try:
+            return await asyncio.open_unix_connection(socket_path, limit=2 ** 22)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if asyncio.get_running_loop().time() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def _serve_shard(dp: Dispatcher, bot: Bot, reader: asyncio.StreamReader) -> None:
+    tails: dict = {}  # key -> last task for that key
+
+    async def process(previous: asyncio.Task | None, update: dict) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])  # Keep per-key order
+        try:
+            result = await dp.feed_raw_update(bot, update)
+            if isinstance(result, TelegramMethod):  # A handler returned a Bot API method
+                await dp.silent_call_request(bot, result)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Failed to process update %s: %s", update.get("update_id"), e, exc_info=True)
+
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        update = json.loads(line)
+        key = shard_key(update)
+        task = asyncio.create_task(process(tails.get(key), update))
+        tails[key] = task
+        task.add_done_callback(lambda t, k=key: tails.pop(k, None) if tails.get(k) is t else None)
+
+    if tails:
+        await asyncio.wait(list(tails.values()))
+
+
+# --- Front side ---
+
+class _Shard:
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: multiprocessing.Process | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.buffer: deque[bytes] = deque()
+        self.dropped = 0
+
+
+class ShardRouter:
+    """Spawns the workers and routes raw updates to them."""
+
+    def __init__(self, workers: int, socket_dir: str | None = None):
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="replybot-shards-")
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.shards = [_Shard(i, os.path.join(self.socket_dir, f"shard-{i}.sock")) for i in range(workers)]
+        self._servers: list[asyncio.AbstractServer] = []
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = False
+        # Private chat id -> its owner's business connection id (None: not an owner); least recently used first
+        self._owner_connections: OrderedDict[int, str | None] = OrderedDict()
+
+    async def start(self) -> None:
+        for shard in self.shards:
+            if os.path.exists(shard.socket_path):
+                os.unlink(shard.socket_path)
+            server = await asyncio.start_unix_server(
+                lambda r, w, s=shard: self._on_worker_connected(s, r, w), path=shard.socket_path
+            )
+            self._servers.append(server)
+            self._spawn(shard)
+
+    def _spawn(self, shard: _Shard) -> None:
+        shard.process = self._context.Process(
+            target=worker_entry,
+            args=(shard.index, shard.socket_path, app_config.OUTBOUND_GLOBAL_RATE / len(self.shards)),
+            name=f"replybot-shard-{shard.index}",
+            daemon=False,
+        )
+        shard.process.start()
+        logger.info("Started shard worker %d (pid %s)", shard.index, shard.process.pid)
+
+    async def _on_worker_connected(self, shard: _Shard, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        shard.writer = writer
+        while shard.buffer:
+            writer.write(shard.buffer.popleft())
+        await writer.drain()
+        await reader.read()  # Workers never send anything; EOF means the worker went away
+        if shard.writer is writer:
+            shard.writer = None
+
+    async def route(self, update: dict, line: bytes | None = None) -> None:
+        """Sends one update to its worker. line may carry the already-encoded update."""
+        shard = self.shards[shard_for(await self.routing_key(update), len(self.shards))]
+        if line is None:
+            line = json.dumps(update, ensure_ascii=False, separators=(",", ":")).encode()
+        line = line.rstrip(b"\n") + b"\n"
+        if shard.writer is None:
+            if len(shard.buffer) >= MAX_BUFFERED_UPDATES:
+                shard.buffer.popleft()
+                shard.dropped += 1
+            shard.buffer.append(line)
+            return
+        shard.writer.write(line)
+        if shard.writer.transport.get_write_buffer_size() > 2 ** 20:
+            await shard.writer.drain()  # Backpressure from a busy worker
+
+    async def routing_key(self, update: dict):
+        """shard_key(), except that an owner's private messages follow the owner's connection."""
+        connection = update.get("business_connection")
+        if connection is not None:
+            if connection.get("is_enabled", True):
+                self._remember_owner(connection["user_chat_id"], connection["id"])
+            elif self._owner_connections.get(connection["user_chat_id"]) == connection["id"]:
+                del self._owner_connections[connection["user_chat_id"]]
+            return connection["id"]
+
+        chat_id = private_chat_id(update)
+        if chat_id is None:
+            return shard_key(update)
+        if chat_id in self._owner_connections:
+            self._owner_connections.move_to_end(chat_id)
+            connection_id = self._owner_connections[chat_id]
+        else:
+            from services.connection_registry import connection_registry
+
+            owned = await connection_registry.owned_by(chat_id)
+            connection_id = owned[0] if owned else None
+            self._remember_owner(chat_id, connection_id)
+        return connection_id or chat_id
+
+    def _remember_owner(self, chat_id: int, connection_id: str | None) -> None:
+        self._owner_connections[chat_id] = connection_id
+        self._owner_connections.move_to_end(chat_id)
+        if len(self._owner_connections) > MAX_OWNER_CHATS:
+            self._owner_connections.popitem(last=False)
+
+    async def supervise(self) -> None:
+        """Restarts workers that died."""
+        while not self._stopping:
+            await asyncio.sleep(1.0)
+            for shard in self.shards:
+                if shard.process is not None and not shard.process.is_alive() and not self._stopping:
+                    logger.error("Shard worker %d exited with code %s, restarting", shard.index, shard.process.exitcode)
+                    shard.writer = None
+                    self._spawn(shard)
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Closes the sockets (workers finish in-flight updates and shut down) and waits for the workers."""
+        self._stopping = True
+        for shard in self.shards:
+            if shard.writer is not None:
+                await shard.writer.drain()
+                shard.writer.close()
+        for server in self._servers:
+            server.close()
+        loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            await loop.run_in_executor(None, shard.process.join, timeout)
+            if shard.process.is_alive():
+                logger.warning("Shard worker %d did not stop in time, killing it", shard.index)
+                shard.process.kill()  # Workers ignore SIGTERM
+            if shard.dropped:
+                logger.warning("Shard %d dropped %d updates while its worker was down", shard.index, shard.dropped)
+
+
+async def _poll(bot: Bot, router: ShardRouter, allowed_updates: list[str], stop_event: asyncio.Event) -> None:
+    await bot.delete_webhook()
+    offset = None
+    while not stop_event.is_set():
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=25, allowed_updates=allowed_updates)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("getUpdates failed: %s", e)
+            await asyncio.sleep(1.0)
+            continue
+        for update in updates:
+            await router.route(update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+            offset = update.update_id + 1
+
+
+def _webhook_app(router: ShardRouter) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, app_config.WEBHOOK_SECRET):  # Always set in webhook mode
+            return web.Response(status=401, text="Unauthorized")
+        body = await request.read()
+        # Telegram sends compact JSON; newlines inside strings are escaped, so stripping raw ones is safe
+        await router.route(json.loads(body), body.replace(b"\n", b""))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(app_config.WEBHOOK_PATH, handle)
+    return app
+
+
+async def run_front(workers: int) -> None:
+    """Runs the front process until SIGINT/SIGTERM."""
+    from main import build_dispatcher, setup_business_info
+
+    bot = Bot(token=app_config.BOT_TOKEN)
+    # Only used to find out which update types the handlers need
+    allowed_updates = build_dispatcher(MemoryStorage()).resolve_used_update_types()
+
+    router = ShardRouter(workers, app_config.SHARD_SOCKET_DIR)
+    await router.start()
+    supervisor = asyncio.create_task(router.supervise())
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await setup_business_info(bot)
+    logger.info("Sharded front started with %d workers in %s mode", workers, app_config.BOT_MODE)
+    runner = None
+    try:
+        if app_config.BOT_MODE == "webhook":
+            runner = web.AppRunner(_webhook_app(router))
+            await runner.setup()
+            await web.TCPSite(runner, host=app_config.WEBHOOK_LISTEN_HOST, port=app_config.WEBHOOK_LISTEN_PORT).start()
+            await bot.set_webhook(
+                url=app_config.WEBHOOK_URL.rstrip("/") + app_config.WEBHOOK_PATH,
+                secret_token=app_config.WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+            )
+            await stop_event.wait()
+        else:
+            poller = asyncio.create_task(_poll(bot, router, allowed_updates, stop_event))
+            await stop_event.wait()
+            poller.cancel()
+    finally:
+        logger.info("Stopping sharded front")
+        supervisor.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await router.stop()
+        await bot.session.close()
@@ -0,0 +1,82 @@
+"""Snapshots of aiogram's MemoryStorage, so FSM state survives a restart without a database.
+
+On shutdown every non-empty record is written as one compact row
+``[bot_id, chat_id, user_id, thread_id, business_connection_id, destiny, state, data]``
+into a gzip-compressed JSON file (atomically, via a temporary file). At startup the rows
+are turned back into storage records and loaded in one bulk update before the first
+update is processed. Records whose data is not JSON-serialisable are skipped.
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_rows(storage: MemoryStorage) -> list[list[Any]]:
+    """Returns the non-empty records of storage as compact rows."""
+    rows = []
+    for key, record in storage.storage.items():
+        if record.state is None and not record.data:
+            continue
+        rows.append([
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+            record.state, record.data or None,
+        ])
+    return rows
+
+
+def write_snapshot(path: str, rows: list[list[Any]]) -> int:
+    """Writes rows to path atomically and returns how many were written. Blocking."""
+    encoded = []
+    for row in rows:
+        try:
+            encoded.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        except (TypeError, ValueError) as e:
+            logger.warning("FSM record for chat %s not saved in the snapshot: %s", row[1], e)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+        f.write(f'{{"version":{SNAPSHOT_VERSION},"saved_at":{time.time():.0f},"records":[')
+        f.write(",".join(encoded))
+        f.write("]}")
+    os.replace(tmp_path, path)
+    return len(encoded)
+
+
+def read_snapshot(path: str) -> dict[StorageKey, MemoryStorageRecord]:
+    """Reads a snapshot into storage records. Returns {} if there is none. Blocking."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        logger.warning("Ignoring FSM snapshot %s with unknown version %r", path, snapshot.get("version"))
+        return {}
+    records = {}
+    for bot_id, chat_id, user_id, thread_id, business_connection_id, destiny, state, data in snapshot["records"]:
+        key = StorageKey(
+            bot_id=bot_id,
+            chat_id=chat_id,
+            user_id=user_id,
+            thread_id=thread_id,
+            business_connection_id=business_connection_id,
+            destiny=destiny,
+        )
+        records[key] = MemoryStorageRecord(data=data or {}, state=state)
+    return records
+
+
+def restore_snapshot(storage: MemoryStorage, records: dict[StorageKey, MemoryStorageRecord]) -> None:
+    """Loads records read by read_snapshot() into storage in one bulk update."""
+    storage.storage.update(records)
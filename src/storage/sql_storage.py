@@ -0,0 +1,232 @@
+"""Durable aiogram FSM storage on top of the SQLAlchemy async engine (PostgreSQL or SQLite).
+
+Reads are served from an in-process cache; a key is only fetched from the database
+the first time it is seen. Writes update the cache immediately and are flushed to
+the database in batches by a background task (write-behind), so ``state.set_state``
+and ``state.set_data`` never wait for a database round trip.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from models.database import upsert_statement
+from models.db_models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+# Marks a field whose value has not been loaded from the database yet.
+_MISSING: Any = object()
+
+
+class _CachedRecord:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: Any = _MISSING, data: Any = _MISSING):
+        self.state = state
+        self.data = data
+
+
+class SQLStorage(BaseStorage):
+    """aiogram FSM storage with an in-process read cache and batched write-behind."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        key_builder: Optional[KeyBuilder] = None,
+        flush_interval: float = 0.5,
+        flush_batch_size: int = 500,
+        cache_size: int = 50_000,
+    ) -> None:
+        self.engine = engine
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, _CachedRecord] = OrderedDict()
+        # Writes not yet handed to the database: key -> {"state": ..., "data": ...}
+        self._pending: dict[str, dict[str, Any]] = {}
+        # Writes currently being flushed; still authoritative for reads until committed
+        self._flushing: dict[str, dict[str, Any]] = {}
+        self._loads: dict[str, asyncio.Task] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+        self._closed = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_errors = 0
+        self.db_reads = 0
+
+    # --- BaseStorage interface ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._write(self.key_builder.build(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(self.key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._write(self.key_builder.build(key), "data", dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = await self._read(self.key_builder.build(key), "data")
+        return dict(data) if data else {}
+
+    async def close(self) -> None:
+        """Flushes every pending write and stops the background flusher."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        logger.info(
+            "SQL FSM storage closed: %d flushes, %d rows written, %d errors, %d DB reads",
+            self.flushes, self.rows_written, self.flush_errors, self.db_reads,
+        )
+
+    # --- Cache ---
+
+    def _cached(self, skey: str) -> _CachedRecord:
+        record = self._cache.get(skey)
+        if record is None:
+            record = self._cache[skey] = _CachedRecord()
+            self._evict()
+        else:
+            self._cache.move_to_end(skey)
+        return record
+
+    def _evict(self) -> None:
+        # Evicting is safe even for dirty keys: reads check the pending buffers first.
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _write(self, skey: str, field: str, value: Any) -> None:
+        if self._closed:
+            # Nothing would flush the write any more; failing loudly beats losing it silently
+            raise RuntimeError(f"SQL FSM storage is closed, cannot write the {field} of {skey}")
+        setattr(self._cached(skey), field, value)
+        self._pending.setdefault(skey, {})[field] = value
+        self._ensure_flusher()
+        if len(self._pending) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    async def _read(self, skey: str, field: str) -> Any:
+        record = self._cached(skey)
+        value = getattr(record, field)
+        if value is not _MISSING:
+            return value
+        for buffer in (self._pending, self._flushing):
+            if field in buffer.get(skey, ()):
+                value = buffer[skey][field]
+                setattr(record, field, value)
+                return value
+        # Cold key: one database read, shared by concurrent callers
+        task = self._loads.get(skey)
+        if task is None:
+            task = self._loads[skey] = asyncio.create_task(self._load(skey))
+            task.add_done_callback(lambda _t, k=skey: self._loads.pop(k, None))
+        state, data = await task
+        record = self._cached(skey)
+        # Do not overwrite values written locally while the load was in flight
+        if record.state is _MISSING:
+            record.state = state
+        if record.data is _MISSING:
+            record.data = data
+        return getattr(record, field)
+
+    async def _load(self, skey: str) -> tuple[Optional[str], dict]:
+        self.db_reads += 1
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == skey)
+            )
+            row = result.first()
+        if row is None:
+            return None, {}
+        return row.state, json.loads(row.data) if row.data else {}
+
+    # --- Write-behind ---
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None and not self._closed:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm-storage-flush")
+            self._flusher.add_done_callback(self._flusher_done)
+
+    def _flusher_done(self, task: asyncio.Task) -> None:
+        # Lets the next write start a new flusher, should this one ever stop
+        if self._flusher is task:
+            self._flusher = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("FSM flush task stopped: %s", task.exception())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                try:
+                    await self.flush()
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.exception("Unexpected error while flushing FSM records: %s", e)
+
+    async def flush(self) -> None:
+        """Writes all pending changes in one transaction."""
+        if not self._pending:
+            return
+        self._flushing, self._pending = self._pending, {}
+        now = datetime.utcnow()
+        committed = False
+        try:
+            # Group rows by the set of columns they touch so each group is one multi-row upsert
+            groups: dict[tuple[str, ...], list[dict]] = {}
+            for skey, fields in list(self._flushing.items()):
+                row = {"key": skey, "updated_at": now}
+                if "state" in fields:
+                    row["state"] = fields["state"]
+                if "data" in fields:
+                    try:
+                        row["data"] = json.dumps(fields["data"], ensure_ascii=False, separators=(",", ":"))
+                    except (TypeError, ValueError) as e:
+                        # Retrying would fail again; the record stays in the cache but is not persisted
+                        logger.warning("FSM record %s not saved, its data is not JSON-serialisable: %s", skey, e)
+                        del self._flushing[skey]
+                        continue
+                groups.setdefault(tuple(sorted(fields)), []).append(row)
+            async with self.engine.begin() as conn:
+                for columns, rows in groups.items():
+                    for start in range(0, len(rows), self.flush_batch_size):
+                        await conn.execute(upsert_statement(
+                            self.engine, FSMRecord.__table__, rows[start:start + self.flush_batch_size],
+                            index_elements=["key"], update_columns=[*columns, "updated_at"],
+                        ))
+            committed = True
+            self.flushes += 1
+            self.rows_written += len(self._flushing)
+        except Exception as e:  # pylint: disable=broad-except
+            self.flush_errors += 1
+            logger.error("Failed to flush %d FSM records, will retry: %s", len(self._flushing), e)
+        finally:
+            if not committed:
+                # Put the batch back (also on cancellation) without clobbering newer writes
+                for skey, fields in self._flushing.items():
+                    self._pending[skey] = {**fields, **self._pending.get(skey, {})}
+            self._flushing = {}
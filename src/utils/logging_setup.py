@@ -0,0 +1,158 @@
+"""Non-blocking logging for the bot.
+
+Loggers on the event loop only put records on a bounded in-memory queue
+(LoopQueueHandler); a QueueListener thread formats them and writes them to stdout, so a
+slow terminal or pipe never stalls the loop. When the queue is full, records are dropped
+and counted instead of waiting.
+
+Below WARNING, every logger is rate limited (LOG_RATE_LIMIT records per second, bursts of
+LOG_RATE_BURST); suppressed records are counted and reported with the next record that
+gets through. Warnings and errors always pass.
+
+With LOG_FORMAT=json each record is one JSON object, including the update context bound
+by LogContextMiddleware (update, chat, user, business connection and handler).
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(filename)s:%(lineno)d - %(message)s"
+
+_traceback_formatter = logging.Formatter()
+
+# Fields describing the update being processed, bound per update by LogContextMiddleware
+log_context: ContextVar[dict[str, Any] | None] = ContextVar("log_context", default=None)
+
+
+class LoopQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve on the loop thread what may change after this call: the arguments, the
+        # current update's context and the traceback (the live exception holds frames the
+        # loop keeps mutating). The copy leaves the caller's record and other handlers alone;
+        # the layout is still formatted by the listener thread.
+        record = copy.copy(record)
+        message = record.getMessage()
+        suppressed = getattr(record, "suppressed_before", 0)
+        if suppressed:
+            message = f"{message} [{suppressed} similar message(s) suppressed]"
+        record.msg = message
+        record.args = None
+        record.context = log_context.get()
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Per-logger token bucket for records below WARNING."""
+
+    def __init__(self, rate: float, burst: float):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        # logger name -> [tokens, last update, suppressed since the last record that passed]
+        self._buckets: dict[str, list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        bucket = self._buckets.get(record.name)
+        if bucket is None:
+            bucket = self._buckets[record.name] = [self.burst, record.created, 0]
+        tokens = min(self.burst, bucket[0] + (record.created - bucket[1]) * self.rate)
+        bucket[1] = record.created
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            self.suppressed += 1
+            return False
+        bucket[0] = tokens - 1
+        # Reported by LoopQueueHandler.prepare, after the message has been formatted
+        record.suppressed_before = bucket[2]
+        bucket[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the update context when there is one."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            entry.update(context)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_queue_handler: LoopQueueHandler | None = None
+_rate_limit: RateLimitFilter | None = None
+
+
+def configure_logging(
+    level: int | str = logging.INFO,
+    json_format: bool = False,
+    rate: float = 20.0,
+    burst: float = 100.0,
+    queue_size: int = 10_000,
+) -> None:
+    """Routes the root logger through a background writer thread. Replaces existing root handlers."""
+    global _queue_handler, _rate_limit
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.setLevel(level)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Writes out what is still queued
+
+    _queue_handler = LoopQueueHandler(log_queue)
+    _rate_limit = RateLimitFilter(rate, burst)
+    _queue_handler.addFilter(_rate_limit)
+    root_logger.addHandler(_queue_handler)
+
+
+def logging_stats() -> dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "suppressed": _rate_limit.suppressed if _rate_limit else 0,
+    }
@@ -0,0 +1,97 @@
+"""
+Webhook delivery mode.
+Runs a small aiohttp server that receives updates from Telegram and feeds them into
+the Dispatcher. Updates are processed while the request is open, so a handler that
+returns a Bot API method (e.g. ``return message.answer(...)``) is answered inline in
+the webhook response instead of costing a separate API call.
+
+An inline answer never passes through the bot session, so its middlewares do not see it.
+InlineAnswerRequestHandler makes up for that: the answer waits for the outbound rate
+limiter like any other send, and is counted in ``bot_api_inline_answers_total`` (not in
+the request latency and error metrics: Telegram does not report whether it succeeded).
+"""
+
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import config as app_config
+from services.metrics import api_inline_answers
+from services.outbound import OutboundScheduler, is_message_send, outbound_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class InlineAnswerRequestHandler(SimpleRequestHandler):
+    """Processes updates while the request is open and accounts for the methods answered inline."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, scheduler: OutboundScheduler | None = None, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, **kwargs)
+        self.scheduler = scheduler
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        result = await self.dispatcher.feed_webhook_update(
+            bot, await request.json(loads=bot.session.json_loads), **self.data
+        )
+        if result is not None:
+            chat_id = getattr(result, "chat_id", None)
+            if self.scheduler is not None and chat_id is not None and is_message_send(result):
+                await self.scheduler.acquire(chat_id)
+            api_inline_answers.inc(type(result).__name__)
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+
+def build_webhook_app(
+    dp: Dispatcher, bot: Bot, secret_token: str | None = None, scheduler: OutboundScheduler | None = None
+) -> web.Application:
+    """Creates the aiohttp application that feeds webhook updates into the dispatcher."""
+    app = web.Application()
+    InlineAnswerRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        scheduler=scheduler,
+        secret_token=secret_token,  # Requests without the matching header get 401
+    ).register(app, path=app_config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def _install_stop_signals(stop_event: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):  # e.g. on Windows
+            pass
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Starts the webhook server, registers it with Telegram and serves until SIGINT/SIGTERM."""
+    app = build_webhook_app(dp, bot, secret_token=app_config.WEBHOOK_SECRET, scheduler=outbound_scheduler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=app_config.WEBHOOK_LISTEN_HOST, port=app_config.WEBHOOK_LISTEN_PORT)
+    await site.start()
+
+    webhook_url = app_config.WEBHOOK_URL.rstrip("/") + app_config.WEBHOOK_PATH
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=app_config.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(
+        "Webhook server listening on %s:%s, registered as %s",
+        app_config.WEBHOOK_LISTEN_HOST, app_config.WEBHOOK_LISTEN_PORT, webhook_url,
+    )
+
+    stop_event = asyncio.Event()
+    _install_stop_signals(stop_event)
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Stopping webhook server")
+        await runner.cleanup()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config.py reads the environment at import; values already set win over a local .env
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+os.environ["DATABASE_URL"] = ""
+os.environ["BOT_MODE"] = "polling"
+os.environ["FSM_STORAGE"] = "memory"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
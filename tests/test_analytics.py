@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models.db_models import Base, InteractionRollup
+from services.analytics import TOTAL, MenuAnalytics, StatsReport, _build_report
+
+
+class BrokenEngine:
+    """Engine whose transactions fail with the given exception."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        raise self.error
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def sqlite_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'analytics.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def daily_rollups(engine) -> dict[tuple, tuple[int, int]]:
+    R = InteractionRollup
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(R.business_connection_id, R.node_key, R.event_type, R.count, R.unique_clients).where(R.period == "day")
+        )).all()
+    return {(row[0], row[1], row[2]): (row[3], row[4]) for row in rows}
+
+
+def test_memory_report_counts_each_client_once():
+    analytics = MenuAnalytics(flush_interval=60)
+    analytics.record("bc-1", "callback", "boats", 1)
+    analytics.record("bc-1", "callback", "boats", 1)
+    analytics.record("bc-2", "faq", "boats", 1)
+    analytics.record("bc-1", "callback", "fishing", 2)
+    analytics.record("bc-2", "message", "message", 3)
+    analytics.record("bc-3", "callback", "boats", 4)
+
+    report = asyncio.run(analytics.report(["bc-1", "bc-2"]))
+    assert (report.clients_today, report.events_today, report.messages) == (3, 5, 1)
+    assert not report.clients_per_connection
+    assert [(n.node_key, n.opens, n.opens_today, n.clients_today) for n in report.nodes] == [
+        ("boats", 3, 3, 1),
+        ("fishing", 1, 1, 1),
+    ]
+    assert asyncio.run(analytics.report(["bc-3"])).clients_today == 1
+
+
+def test_disabled_analytics_records_nothing():
+    analytics = MenuAnalytics(flush_interval=60, enabled=False)
+    analytics.record("bc-1", "callback", "boats", 1)
+    assert analytics.recorded == 0
+    assert asyncio.run(analytics.report(["bc-1"])).events_today == 0
+
+
+def test_build_report_from_rollup_rows():
+    today = datetime(2026, 10, 18)
+    yesterday = datetime(2026, 10, 17)
+    rows = [
+        (today, TOTAL, TOTAL, 5, 2),
+        (yesterday, TOTAL, TOTAL, 7, 4),
+        (today, "message", "message", 2, 1),
+        (today, "boats", "callback", 1, 1),
+        (yesterday, "boats", "faq", 2, 2),
+        (today, "fishing", "callback", 2, 2),
+        (today, "/menu", "unknown", 9, 9),
+    ]
+    report = _build_report(StatsReport(days=7), rows, today)
+    assert (report.clients_today, report.events_today, report.events, report.messages) == (2, 5, 12, 2)
+    assert [(n.node_key, n.opens, n.opens_today, n.clients_today) for n in report.nodes] == [
+        ("boats", 3, 1, 1),
+        ("fishing", 2, 2, 2),
+    ]
+
+
+def test_flush_adds_increments_to_rollups(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        analytics = MenuAnalytics(flush_interval=60)
+        analytics._engine = engine
+        analytics.record("bc-1", "callback", "boats", 1)
+        analytics.record("bc-1", "callback", "boats", 2)
+        await analytics.flush()
+        first = await daily_rollups(engine)
+        analytics.record("bc-1", "callback", "boats", 1)
+        analytics.record("bc-1", "callback", "boats", 3)
+        await analytics.flush()
+        await analytics.flush()  # Nothing new
+        second = await daily_rollups(engine)
+        report = await analytics.report(["bc-1"])
+        await engine.dispose()
+        return analytics, first, second, report
+
+    analytics, first, second, report = asyncio.run(run())
+    assert first[("bc-1", "boats", "callback")] == (2, 2)
+    assert second[("bc-1", "boats", "callback")] == (4, 3)
+    assert second[("bc-1", TOTAL, TOTAL)] == (4, 3)
+    assert analytics.stats()["pending_rows"] == 0
+    assert analytics.flush_errors == 0
+    assert report.from_database and report.clients_per_connection
+    assert (report.clients_today, report.events_today) == (3, 4)
+
+
+def test_failed_flush_is_retried_with_later_increments(tmp_path):
+    async def run():
+        analytics = MenuAnalytics(flush_interval=60)
+        analytics._engine = BrokenEngine(OSError("database is down"))
+        analytics.record("bc-1", "callback", "boats", 1)
+        with pytest.raises(OSError):
+            await analytics.flush()
+        pending = analytics.stats()["pending_rows"]
+        analytics.record("bc-1", "callback", "boats", 2)
+        analytics._engine = await sqlite_engine(tmp_path)
+        await analytics.flush()
+        rollups = await daily_rollups(analytics._engine)
+        await analytics._engine.dispose()
+        return analytics, pending, rollups
+
+    analytics, pending, rollups = asyncio.run(run())
+    assert analytics.flush_errors == 1
+    assert pending == 4  # hour and day rows of the node and the total
+    assert rollups[("bc-1", "boats", "callback")] == (2, 2)
+
+
+def test_cancelled_flush_is_not_a_flush_error(tmp_path):
+    async def run():
+        analytics = MenuAnalytics(flush_interval=60)
+        analytics._engine = BrokenEngine(asyncio.CancelledError())
+        analytics.record("bc-1", "callback", "boats", 1)
+        with pytest.raises(asyncio.CancelledError):
+            await analytics.flush()
+        analytics._engine = await sqlite_engine(tmp_path)
+        await analytics.flush()
+        rollups = await daily_rollups(analytics._engine)
+        await analytics._engine.dispose()
+        return analytics, rollups
+
+    analytics, rollups = asyncio.run(run())
+    assert analytics.flush_errors == 0
+    assert rollups[("bc-1", "boats", "callback")] == (1, 1)
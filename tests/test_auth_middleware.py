@@ -0,0 +1,29 @@
+import asyncio
+
+from aiogram.types import User
+
+from middlewares.auth_middleware import AuthMiddleware
+
+
+def authenticate(middleware: AuthMiddleware, user_id: int) -> dict:
+    data = {"event_from_user": User(id=user_id, is_bot=False, first_name="Client")}
+
+    async def handler(event, handler_data):
+        return handler_data
+
+    return asyncio.run(middleware(handler, None, data))
+
+
+def test_owner_and_client_flags():
+    middleware = AuthMiddleware(allowed_ids=[1], name_fallback=False, cache_size=10)
+    assert (authenticate(middleware, 1)["is_owner"], authenticate(middleware, 1)["is_authenticated"]) == (True, True)
+    assert (authenticate(middleware, 2)["is_owner"], authenticate(middleware, 2)["is_authenticated"]) == (False, False)
+    open_middleware = AuthMiddleware(allowed_ids=[], name_fallback=False, cache_size=10)
+    assert authenticate(open_middleware, 2)["is_authenticated"]
+
+
+def test_decision_cache_evicts_the_least_recently_seen_user():
+    middleware = AuthMiddleware(allowed_ids=[1], name_fallback=False, cache_size=2)
+    for user_id in (1, 2, 1, 3):
+        authenticate(middleware, user_id)
+    assert list(middleware._decisions) == [1, 3]
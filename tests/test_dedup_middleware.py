@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+from aiogram.types import Update
+
+from middlewares.dedup_middleware import DeduplicationMiddleware, SeenWindow
+
+BOT_ID = 42
+
+
+def message_update(update_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+    })
+
+
+def callback_update(update_id: int, callback_id: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": callback_id, "chat_instance": "x", "data": "prices",
+            "from": {"id": 1, "is_bot": False, "first_name": "Client"},
+        },
+    })
+
+
+def feed(middleware: DeduplicationMiddleware, *updates: Update) -> list[int]:
+    """Returns the update_ids that reached the handler."""
+    handled = []
+
+    async def handler(event, _data):
+        handled.append(event.update_id)
+
+    async def run():
+        for update in updates:
+            await middleware(handler, update, {})
+
+    asyncio.run(run())
+    return handled
+
+
+def test_seen_window_forgets_the_oldest_key():
+    window = SeenWindow(2)
+    assert window.add(1) and window.add(2)
+    assert not window.add(1)
+    assert window.add(3)  # Evicts 1
+    assert window.add(1)
+    assert len(window) == 2
+
+
+def test_duplicate_update_ids_are_dropped():
+    middleware = DeduplicationMiddleware(window=10, state_path="")
+    assert feed(middleware, message_update(1), message_update(2), message_update(1)) == [1, 2]
+    assert middleware.stats()["duplicates"] == 1
+
+
+def test_repeated_callback_query_is_dropped():
+    middleware = DeduplicationMiddleware(window=10, state_path="")
+    assert feed(middleware, callback_update(1, "cb-1"), callback_update(2, "cb-1"), callback_update(3, "cb-2")) == [1, 3]
+
+
+def restarted(tmp_path, previous_ids, window=100) -> DeduplicationMiddleware:
+    """A middleware started after a run that processed previous_ids and saved its mark."""
+    path = str(tmp_path / "mark.json")
+    before = DeduplicationMiddleware(window=window, state_path=path)
+    before.load(BOT_ID)
+    feed(before, *(message_update(update_id) for update_id in previous_ids))
+    before.save()
+    after = DeduplicationMiddleware(window=window, state_path=path)
+    after.load(BOT_ID)
+    return after
+
+
+def test_mark_drops_redeliveries_after_a_restart(tmp_path):
+    middleware = restarted(tmp_path, [1000, 1001])
+    assert feed(middleware, message_update(1001), message_update(1002)) == [1002]
+
+
+def test_mark_only_covers_the_window(tmp_path):
+    # e.g. Telegram started update_ids over at a lower value
+    middleware = restarted(tmp_path, [1000], window=100)
+    assert feed(middleware, message_update(900), message_update(950)) == [900]
+
+
+def test_new_run_saves_its_own_mark(tmp_path):
+    middleware = restarted(tmp_path, [1000], window=100)
+    feed(middleware, message_update(5))
+    middleware.save()
+    assert json.loads((tmp_path / "mark.json").read_text())["update_id"] == 5
+
+
+def test_stale_or_foreign_marks_are_ignored(tmp_path):
+    path = tmp_path / "mark.json"
+    for state in (
+        {"bot_id": BOT_ID, "update_id": 1000, "saved_at": time.time() - 2 * 24 * 3600},
+        {"bot_id": BOT_ID, "update_id": 1000},
+        {"bot_id": BOT_ID + 1, "update_id": 1000, "saved_at": time.time()},
+    ):
+        path.write_text(json.dumps(state))
+        middleware = DeduplicationMiddleware(window=100, state_path=str(path))
+        middleware.load(BOT_ID)
+        assert feed(middleware, message_update(1000)) == [1000]
+
@@ -0,0 +1,62 @@
+import asyncio
+
+from menu_graph import compile_menu
+from services.faq_index import FaqIndex, stem, tokenize
+
+MENU = compile_menu({
+    "main_menu": {"type": "menu", "text": "Меню", "buttons": [
+        [{"text": "🚤 Лодки", "target": "boats"}],
+        [{"text": "🎣 Рыбалка", "target": "fishing"}],
+        [{"text": "🆘 Помощь", "target": "help"}],
+    ]},
+    "boats": {"type": "content", "text_path": "boats.txt", "back_to": "main_menu"},
+    "fishing": {"type": "content", "text_path": "fishing.txt", "back_to": "main_menu"},
+    "help": {"type": "content", "text_path": "help.txt", "back_to": "main_menu", "is_final": True},
+})
+TEXTS = {
+    "boats.txt": "<b>Аренда лодок</b>: моторная лодка 3000 руб. в час, катер на весь день.",
+    "fishing.txt": "Рыбалка с гидом: снасти, наживка и катер на утреннюю рыбалку.",
+    "help.txt": "Помощь: напишите ваш вопрос, менеджер ответит.",
+}
+
+
+def make_index(tmp_path, min_score: float = 1.0, min_margin: float = 1.5) -> FaqIndex:
+    client_dir = tmp_path / "bc-faq"
+    client_dir.mkdir(exist_ok=True)
+    for name, text in TEXTS.items():
+        (client_dir / name).write_text(text, encoding="utf-8")
+    return FaqIndex(str(tmp_path), min_score=min_score, min_margin=min_margin, refresh_interval=60)
+
+
+def match(index: FaqIndex, text: str):
+    return asyncio.run(index.match("bc-faq", MENU, text))
+
+
+def test_stem_strips_russian_and_english_endings():
+    assert stem("лодки") == stem("лодка") == "лодк"
+    assert stem("boats") == stem("boat") == "boat"
+    assert stem("fishing") == "fish"
+    assert stem("дом") == "дом"  # Too short to strip
+
+
+def test_tokenize_drops_stopwords_and_short_words():
+    assert tokenize("Привет! Сколько стоят ЛОДКИ?") == ["скольк", "сто", "лодк"]
+    assert tokenize("ёлка") == tokenize("елка")
+    assert tokenize("a I и в") == []
+
+
+def test_matches_the_clearly_best_node(tmp_path):
+    found = match(make_index(tmp_path), "сколько стоит аренда лодки?")
+    assert found is not None and found.node_key == "boats"
+
+
+def test_below_threshold_or_ambiguous_is_not_matched(tmp_path):
+    assert match(make_index(tmp_path, min_score=100.0), "сколько стоит аренда лодки?") is None
+    assert match(make_index(tmp_path), "катер") is None  # In both nodes equally
+    assert match(make_index(tmp_path), "погода завтра") is None
+
+
+def test_final_nodes_are_left_to_the_owner(tmp_path):
+    index = make_index(tmp_path, min_score=0.1)
+    assert match(index, "помощь") is None
+    assert match(index, "help") is None
@@ -0,0 +1,63 @@
+import logging
+import queue
+import sys
+
+from utils.logging_setup import JsonFormatter, LoopQueueHandler, RateLimitFilter, log_context
+
+
+def make_record(msg="hello %s", args=("world",), level=logging.INFO, created=0.0, exc_info=None):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, exc_info)
+    record.created = created
+    return record
+
+
+def test_prepare_copies_the_record():
+    handler = LoopQueueHandler(queue.Queue())
+    record = make_record()
+    token = log_context.set({"update_id": 7})
+    try:
+        prepared = handler.prepare(record)
+    finally:
+        log_context.reset(token)
+    assert prepared is not record
+    assert (prepared.msg, prepared.args, prepared.context) == ("hello world", None, {"update_id": 7})
+    assert (record.msg, record.args) == ("hello %s", ("world",))
+
+
+def test_prepare_formats_the_traceback_on_the_calling_thread():
+    handler = LoopQueueHandler(queue.Queue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+    prepared = handler.prepare(record)
+    assert prepared.exc_info is None
+    assert "ValueError: boom" in prepared.exc_text
+    assert record.exc_info is not None
+    assert "ValueError: boom" in logging.Formatter().format(prepared)
+    assert "ValueError: boom" in JsonFormatter().format(prepared)
+
+
+def test_prepare_drops_records_when_the_queue_is_full():
+    handler = LoopQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.dropped == 1
+
+
+def test_rate_limit_reports_suppressed_records_after_formatting():
+    log_queue = queue.Queue()
+    handler = LoopQueueHandler(log_queue)
+    rate_limit = RateLimitFilter(rate=1.0, burst=1.0)
+    handler.addFilter(rate_limit)
+    for created in (0.0, 0.1, 0.2, 1.5):
+        handler.handle(make_record(msg="value %d%%", args=(int(created * 10),), created=created))
+    assert rate_limit.suppressed == 2
+    messages = [log_queue.get_nowait().msg for _ in range(log_queue.qsize())]
+    assert messages == ["value 0%", "value 15% [2 similar message(s) suppressed]"]
+
+
+def test_rate_limit_passes_warnings():
+    rate_limit = RateLimitFilter(rate=1.0, burst=1.0)
+    assert all(rate_limit.filter(make_record(level=logging.WARNING)) for _ in range(5))
+    assert rate_limit.suppressed == 0
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from aiogram.types import Document, FSInputFile, Message
+
+from services.media_cache import MediaCache
+
+
+def sent_document(file_id: str) -> Message:
+    return Message.model_validate({
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "document": {"file_id": file_id, "file_unique_id": file_id},
+    })
+
+
+def bad_request(text: str) -> TelegramBadRequest:
+    return TelegramBadRequest(method=SendPhoto(chat_id=1, photo="x"), message=text)
+
+
+def make_cache(tmp_path) -> tuple[MediaCache, str]:
+    media = tmp_path / "photo.jpg"
+    media.write_bytes(b"\xff\xd8 not really a jpeg")
+    return MediaCache(str(tmp_path / "media_cache.json")), str(media)
+
+
+def test_uploads_once_then_sends_file_id(tmp_path):
+    cache, path = make_cache(tmp_path)
+    sent = []
+
+    async def send(media):
+        sent.append(media)
+        return sent_document("file-1")
+
+    asyncio.run(cache.send(path, send))
+    asyncio.run(cache.send(path, send))
+    assert isinstance(sent[0], FSInputFile)
+    assert sent[1] == "file-1"
+    assert cache.stats()["uploads"] == 1
+
+
+def test_rejected_file_id_is_uploaded_again(tmp_path):
+    cache, path = make_cache(tmp_path)
+    sent = []
+
+    async def send(media):
+        sent.append(media)
+        if media == "file-1":
+            raise bad_request("Bad Request: wrong file identifier/HTTP URL specified")
+        return sent_document("file-2" if len(sent) > 1 else "file-1")
+
+    asyncio.run(cache.send(path, send))
+    asyncio.run(cache.send(path, send))
+    assert sent[1] == "file-1"
+    assert isinstance(sent[2], FSInputFile)
+    assert cache.stats()["stale_ids"] == 1
+
+
+def test_other_bad_requests_keep_the_file_id(tmp_path):
+    cache, path = make_cache(tmp_path)
+
+    async def upload(_media):
+        return sent_document("file-1")
+
+    async def too_long(_media):
+        raise bad_request("Bad Request: message caption is too long")
+
+    asyncio.run(cache.send(path, upload))
+    with pytest.raises(TelegramBadRequest):
+        asyncio.run(cache.send(path, too_long))
+    assert cache.stats()["stale_ids"] == 0
+    assert cache.stats()["entries"] == 1
+
+
+def test_missing_file_raises(tmp_path):
+    cache, _path = make_cache(tmp_path)
+
+    async def send(_media):
+        raise AssertionError("nothing should be sent")
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(cache.send(str(tmp_path / "missing.jpg"), send))
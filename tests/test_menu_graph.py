@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+import pytest
+
+import config as app_config
+from menu_config import DEFAULT_MENU_STRUCTURE
+from menu_graph import ClientMenuCache, MenuConfigError, compile_all_menus, compile_menu, _static_menu
+
+ROOT = {"type": "menu", "text": "Hi", "buttons": [[{"text": "About", "target": "about"}]]}
+ABOUT = {"type": "menu", "text": "About us", "buttons": [[{"text": "Back", "target": "main_menu"}]]}
+
+
+def problems_of(structure: dict) -> str:
+    with pytest.raises(MenuConfigError) as error:
+        compile_menu(structure)
+    return str(error.value)
+
+
+def test_compiles_a_valid_menu():
+    menu = compile_menu({"main_menu": ROOT, "about": ABOUT})
+    assert menu.get("about").text == "About us"
+    assert menu.get("main_menu").keyboard is not None
+
+
+def test_reports_nodes_that_are_not_objects():
+    assert "node 'about': must be an object, not list" in problems_of({"main_menu": ROOT, "about": ["oops"]})
+
+
+def test_reports_malformed_buttons():
+    problems = problems_of({
+        "main_menu": {**ROOT, "buttons": {"text": "About", "target": "about"}},
+        "about": {**ABOUT, "buttons": ["not a row", [["not a button"]]]},
+    })
+    assert "node 'main_menu': 'buttons' must be a list of rows" in problems
+    assert "node 'about': button row 'not a row' must be a list of buttons" in problems
+    assert "node 'about': button ['not a button'] needs 'text' and 'target'" in problems
+
+
+def test_reports_non_string_keys_and_targets():
+    problems = problems_of({
+        "main_menu": {**ROOT, "buttons": [[{"text": "About", "target": ["about"]}]]},
+        1: ABOUT,
+    })
+    assert "node 1: key must be a string" in problems
+    assert "node 'main_menu': target ['about'] must be a node key" in problems
+
+
+def test_broken_yaml_file_keeps_the_configured_menu(tmp_path):
+    pytest.importorskip("yaml")
+    (tmp_path / "bc-1").mkdir()
+    (tmp_path / "bc-1" / "menu.yaml").write_text("main_menu: [unclosed\n", encoding="utf-8")
+    cache = ClientMenuCache(str(tmp_path), max_entries=10, check_interval=60)
+
+    menu = asyncio.run(cache.get("bc-1"))
+
+    assert menu is _static_menu("bc-1")
+    assert cache.errors == 1
+
+
+def test_default_menu_files_are_checked_in_client_directories(tmp_path, monkeypatch, caplog):
+    paths = {node[key] for node in DEFAULT_MENU_STRUCTURE.values() for key in ("text_path", "media_path") if node.get(key)}
+    for client_id in ("bc-complete", "bc-partial", "bc-own-menu"):
+        (tmp_path / client_id).mkdir()
+    for path in paths:
+        (tmp_path / "bc-complete" / path).write_text("text", encoding="utf-8")
+    (tmp_path / "bc-own-menu" / "menu.json").write_text("{}", encoding="utf-8")
+    monkeypatch.setattr(app_config, "RESPONSES_DIR", str(tmp_path))
+
+    with caplog.at_level(logging.ERROR):
+        compile_all_menus()
+
+    errors = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert "client 'bc-partial'" in errors[0]
+    assert errors[0].count("file not found") == len(paths)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, GetChat, SendChatAction, SendMessage
+
+from services.outbound import (
+    OutboundRateLimitMiddleware,
+    OutboundScheduler,
+    Priority,
+    TokenBucket,
+    is_message_send,
+    outbound_priority,
+)
+
+
+def make_scheduler(**kwargs) -> OutboundScheduler:
+    return OutboundScheduler(**{"global_rate": 30, "chat_rate": 1, "chat_burst": 3, **kwargs})
+
+
+def test_only_message_sends_are_rate_limited():
+    assert is_message_send(SendMessage(chat_id=1, text="hi"))
+    assert not is_message_send(SendChatAction(chat_id=1, action="typing"))
+    assert not is_message_send(GetChat(chat_id=1))
+    assert not is_message_send(EditMessageText(chat_id=1, message_id=1, text="hi"))
+
+
+def test_middleware_skips_methods_that_are_not_sends():
+    scheduler = make_scheduler()
+    middleware = OutboundRateLimitMiddleware(scheduler)
+    bot = Bot(token="42:TEST")
+    sent = []
+
+    async def make_request(_bot, method):
+        sent.append(type(method).__name__)
+        return True
+
+    async def run():
+        await middleware(make_request, bot, GetChat(chat_id=1))
+        await middleware(make_request, bot, EditMessageText(chat_id=1, message_id=1, text="hi"))
+        with outbound_priority(Priority.NOTIFICATION):
+            await middleware(make_request, bot, SendMessage(chat_id=1, text="hi"))
+
+    asyncio.run(run())
+    assert sent == ["GetChat", "EditMessageText", "SendMessage"]
+    lanes = scheduler.stats()["lanes"]
+    assert (lanes["interactive"]["granted"], lanes["notification"]["granted"]) == (0, 1)
+
+
+def test_waiting_requests_are_served_by_lane():
+    scheduler = make_scheduler(chat_rate=1000, chat_burst=1000)
+    scheduler._global = TokenBucket(rate=50, capacity=1)
+    order = []
+
+    async def send(chat_id, priority):
+        await scheduler.acquire(chat_id, priority)
+        order.append(priority)
+
+    async def run():
+        await scheduler.acquire(0)  # Takes the only token, so the rest have to queue
+        await asyncio.gather(
+            send(1, Priority.BROADCAST),
+            send(2, Priority.NOTIFICATION),
+            send(3, Priority.INTERACTIVE),
+            send(4, Priority.BROADCAST),
+        )
+
+    asyncio.run(run())
+    assert order == [Priority.INTERACTIVE, Priority.NOTIFICATION, Priority.BROADCAST, Priority.BROADCAST]
+    assert scheduler.stats()["lanes"]["broadcast"]["delayed"] == 2
+
+
+def test_retry_after_pauses_the_chat_and_retries():
+    scheduler = make_scheduler()
+    middleware = OutboundRateLimitMiddleware(scheduler, max_retries=2)
+    method = SendMessage(chat_id=7, text="hi")
+    calls = []
+
+    async def make_request(_bot, _method):
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=method, message="Flood control exceeded", retry_after=1)
+        return "sent"
+
+    async def run():
+        return await middleware(make_request, Bot(token="42:TEST"), method)
+
+    assert asyncio.run(run()) == "sent"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.9
+    assert scheduler.stats()["retry_after_events"] == 1
+
+
+def test_retry_after_gives_up_after_max_retries():
+    scheduler = make_scheduler()
+    middleware = OutboundRateLimitMiddleware(scheduler, max_retries=2)
+    method = SendMessage(chat_id=7, text="hi")
+    calls = []
+
+    async def make_request(_bot, _method):
+        calls.append(_method)
+        raise TelegramRetryAfter(method=method, message="Flood control exceeded", retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(middleware(make_request, Bot(token="42:TEST"), method))
+    assert len(calls) == 3
+    assert scheduler.retry_after_events == 3
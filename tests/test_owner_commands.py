@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+from aiogram.filters import CommandObject
+from aiogram.types import Message
+
+from handlers.owner_commands import profile_command
+from services.loop_monitor import loop_monitor
+
+
+def owner_message(text: str) -> Message:
+    return Message.model_validate({
+        "message_id": 1, "date": 0, "chat": {"id": 900001, "type": "private"}, "text": text,
+    })
+
+
+@pytest.mark.parametrize("args", ["nan", "inf", "-inf", "soon"])
+def test_profile_rejects_invalid_durations(args, monkeypatch):
+    def start_profile(_seconds):
+        raise AssertionError("no profiling session should start")
+
+    monkeypatch.setattr(loop_monitor, "start_profile", start_profile)
+    result = asyncio.run(profile_command(owner_message(f"/profile {args}"), CommandObject(command="profile", args=args)))
+    assert result.text == "Usage: /profile [seconds]"
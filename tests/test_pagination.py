@@ -0,0 +1,65 @@
+from services.pagination import PageCache, parse_page, split_html, visible_length
+
+
+def test_visible_length_counts_entities_once_and_utf16_units():
+    assert visible_length("<b>bold</b> &amp; <a href='x'>link</a>") == 11
+    assert visible_length("&#128512;&lt;") == 3
+    assert visible_length("😀a") == 3
+
+
+def test_short_text_is_one_page():
+    assert split_html("", 10) == ("",)
+    text = "<b>0123456789</b>"
+    assert split_html(text, 10) == (text,)
+
+
+def test_pages_prefer_paragraph_breaks():
+    text = "first paragraph\n\nsecond paragraph"
+    assert split_html(text, 20) == ("first paragraph\n\n", "second paragraph")
+
+
+def test_open_tags_are_closed_and_reopened():
+    pages = split_html('<b>bold <a href="https://x.y/?a=1&amp;b=2">linked words here</a></b> tail', 12)
+    assert pages == (
+        '<b>bold <a href="https://x.y/?a=1&amp;b=2">linked </a></b>',
+        '<b><a href="https://x.y/?a=1&amp;b=2">words here</a></b>',
+        "tail",  # Not cut after "t", although the page above had room for it
+    )
+    assert all(visible_length(page) <= 12 for page in pages)
+
+
+def test_entities_are_never_cut():
+    pages = split_html("aaaa&amp;bbbb&lt;cc", 5)
+    assert pages == ("aaaa&amp;", "bbbb&lt;", "cc")
+
+
+def test_astral_characters_count_two_units():
+    assert split_html("😀😀😀😀", 4) == ("😀😀", "😀😀")
+    assert split_html("😀😀😀", 3) == ("😀", "😀", "😀")
+
+
+def test_no_empty_or_blank_pages():
+    assert split_html("aaaaa\n\n\n\n\n<b></b>", 5) == ("aaaaa",)
+    assert split_html("<b>" + "a" * 10 + "</b>" + "\n" * 20, 10) == ("<b>aaaaaaaaaa</b>",)
+    assert split_html("aaaaa\n\n\n\n\nbbbbb", 5) == ("aaaaa", "bbbbb")
+
+
+def test_self_closing_tags_are_not_reopened():
+    assert split_html("aaaaa<br/>bbbbb", 5) == ("aaaaa<br/>", "bbbbb")
+
+
+def test_parse_page():
+    assert parse_page("boats|p3") == ("boats", 3)
+    assert parse_page("boats|p0") == ("boats", 1)
+    assert parse_page("boats|pxyz") == ("boats|pxyz", None)
+    assert parse_page("boats") == ("boats", None)
+
+
+def test_page_cache_splits_once_per_text_and_limit():
+    cache = PageCache(max_entries=2)
+    text = "word " * 10
+    first = cache.pages(("bc-1", "boats"), text, 20)
+    assert cache.pages(("bc-1", "boats"), text, 20) is first
+    assert cache.pages(("bc-1", "boats"), text, 30) != first  # Caption or link: another limit
+    assert cache.pages(("bc-1", "boats"), "changed text", 20) == ("changed text",)
+    assert cache.stats() == {"splits": 3, "hits": 1, "entries": 2}
@@ -0,0 +1,35 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services.render_cache import RenderCache, render_signature
+
+
+def keyboard(*callback_data: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=data, callback_data=data) for data in callback_data]
+    ])
+
+
+def test_signature_compares_content_not_objects():
+    text = "Prices"
+    assert render_signature("prices", text, keyboard("back")) == render_signature("prices", "".join(text), keyboard("back"))
+    assert render_signature("prices", text, keyboard("back")) != render_signature("prices", text, keyboard("main_menu"))
+    assert render_signature("prices", text, keyboard("back")) != render_signature("prices", "Prices!", keyboard("back"))
+    assert render_signature("prices", text) != render_signature("prices", text, keyboard("back"))
+
+
+def test_cache_skips_only_identical_renders():
+    cache = RenderCache(max_entries=2)
+    signature = render_signature("prices", "Prices", keyboard("back"))
+    assert not cache.is_current(1, 10, signature)
+    cache.remember(1, 10, signature)
+    assert cache.is_current(1, 10, render_signature("prices", "Prices", keyboard("back")))
+    assert not cache.is_current(1, 10, render_signature("prices", "New prices", keyboard("back")))
+    assert cache.stats()["saved"] == 1
+
+
+def test_cache_is_bounded():
+    cache = RenderCache(max_entries=2)
+    for message_id in range(3):
+        cache.remember(1, message_id, render_signature("main_menu", "Menu"))
+    assert not cache.is_current(1, 0, render_signature("main_menu", "Menu"))
+    assert cache.stats()["evictions"] == 1
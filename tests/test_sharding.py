@@ -0,0 +1,135 @@
+import asyncio
+import json
+import zlib
+
+import sharding
+from sharding import ShardRouter, private_chat_id, shard_for, shard_key
+
+OWNER_CHAT = 900001
+CLIENT_CHAT = 900002
+
+
+def business_connection(connection_id="bc-1", user_chat_id=OWNER_CHAT, is_enabled=True):
+    return {
+        "update_id": 1,
+        "business_connection": {
+            "id": connection_id,
+            "user": {"id": user_chat_id, "is_bot": False, "first_name": "Owner"},
+            "user_chat_id": user_chat_id,
+            "date": 0,
+            "can_reply": True,
+            "is_enabled": is_enabled,
+        },
+    }
+
+
+def business_message(connection_id="bc-1", chat_id=CLIENT_CHAT):
+    return {
+        "update_id": 2,
+        "business_message": {
+            "message_id": 1,
+            "date": 0,
+            "business_connection_id": connection_id,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Client"},
+            "text": "hi",
+        },
+    }
+
+
+def private_message(chat_id, text="/stats"):
+    return {
+        "update_id": 3,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Someone"},
+            "text": text,
+        },
+    }
+
+
+def routed_to(router: ShardRouter, update: dict) -> int:
+    """Routes update (no worker is connected, so it is buffered) and returns its shard index."""
+    asyncio.run(router.route(update))
+    line = (json.dumps(update, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+    [index] = [shard.index for shard in router.shards if line in shard.buffer]
+    return index
+
+
+def test_shard_key_uses_business_connection():
+    assert shard_key(business_connection("bc-7")) == "bc-7"
+    assert shard_key(business_message("bc-7")) == "bc-7"
+    deleted = {"update_id": 4, "deleted_business_messages": {
+        "business_connection_id": "bc-7", "chat": {"id": CLIENT_CHAT, "type": "private"}, "message_ids": [1],
+    }}
+    assert shard_key(deleted) == "bc-7"
+
+
+def test_shard_key_of_callback_query():
+    callback = {"update_id": 5, "callback_query": {
+        "id": "1", "chat_instance": "x", "from": {"id": CLIENT_CHAT, "is_bot": False, "first_name": "Client"},
+        "message": {"message_id": 1, "date": 0, "business_connection_id": "bc-7",
+                    "chat": {"id": CLIENT_CHAT, "type": "private"}},
+    }}
+    assert shard_key(callback) == "bc-7"
+    del callback["callback_query"]["message"]["business_connection_id"]
+    assert shard_key(callback) == CLIENT_CHAT
+    del callback["callback_query"]["message"]
+    assert shard_key(callback) == CLIENT_CHAT
+
+
+def test_shard_key_falls_back_to_chat_and_update_id():
+    assert shard_key(private_message(CLIENT_CHAT)) == CLIENT_CHAT
+    assert shard_key({"update_id": 42}) == 42
+
+
+def test_shard_for_is_stable_and_in_range():
+    assert shard_for("bc-1", 4) == zlib.crc32(b"bc-1") % 4
+    assert shard_for(CLIENT_CHAT, 4) == shard_for(str(CLIENT_CHAT), 4)
+    assert {shard_for(f"bc-{i}", 3) for i in range(100)} == {0, 1, 2}
+
+
+def test_private_chat_id():
+    assert private_chat_id(private_message(CLIENT_CHAT)) == CLIENT_CHAT
+    assert private_chat_id(business_message()) is None
+    group = private_message(CLIENT_CHAT)
+    group["message"]["chat"]["type"] = "group"
+    assert private_chat_id(group) is None
+
+
+def test_router_keeps_a_connection_on_one_shard(tmp_path):
+    router = ShardRouter(4, str(tmp_path))
+    expected = shard_for("bc-1", 4)
+    assert routed_to(router, business_connection("bc-1")) == expected
+    assert routed_to(router, business_message("bc-1")) == expected
+
+
+def test_router_sends_owner_commands_to_the_connection_shard(tmp_path):
+    router = ShardRouter(4, str(tmp_path))
+    connection_id = next(f"bc-{i}" for i in range(100) if shard_for(f"bc-{i}", 4) != shard_for(OWNER_CHAT, 4))
+    routed_to(router, business_connection(connection_id))
+    assert routed_to(router, private_message(OWNER_CHAT)) == shard_for(connection_id, 4)
+
+
+def test_router_forgets_disabled_connections(tmp_path):
+    router = ShardRouter(4, str(tmp_path))
+    routed_to(router, business_connection("bc-1"))
+    routed_to(router, business_connection("bc-1", is_enabled=False))
+    assert routed_to(router, private_message(OWNER_CHAT)) == shard_for(OWNER_CHAT, 4)
+
+
+def test_router_routes_other_private_chats_by_chat(tmp_path):
+    router = ShardRouter(4, str(tmp_path))
+    assert routed_to(router, private_message(CLIENT_CHAT, "/start")) == shard_for(CLIENT_CHAT, 4)
+
+
+def test_router_buffer_drops_oldest_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "MAX_BUFFERED_UPDATES", 2)
+    router = ShardRouter(1, str(tmp_path))
+    for update_id in range(3):
+        asyncio.run(router.route({"update_id": update_id}))
+    shard = router.shards[0]
+    assert [json.loads(line)["update_id"] for line in shard.buffer] == [1, 2]
+    assert shard.dropped == 1
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models.db_models import Base, FSMRecord
+from storage.sql_storage import SQLStorage
+
+
+def storage_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+class BrokenEngine:
+    """Engine whose transactions always fail."""
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        raise OSError("database is down")
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def sqlite_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fsm.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def stored_rows(engine) -> dict[str, tuple]:
+    async with engine.connect() as conn:
+        rows = (await conn.execute(select(FSMRecord.key, FSMRecord.state, FSMRecord.data))).all()
+    return {row.key: (row.state, row.data) for row in rows}
+
+
+def test_writes_to_a_key_are_coalesced_into_one_row(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        storage = SQLStorage(engine, flush_interval=60)
+        key = storage_key(1)
+        await storage.set_state(key, "menu:a")
+        await storage.set_data(key, {"page": 1})
+        await storage.set_state(key, "menu:b")
+        await storage.set_data(key, {"page": 2})
+        pending = len(storage._pending)
+        state = await storage.get_state(key)
+        await storage.flush()
+        rows = await stored_rows(engine)
+        await storage.close()
+        await engine.dispose()
+        return storage, pending, state, rows
+
+    storage, pending, state, rows = asyncio.run(run())
+    assert pending == 1
+    assert state == "menu:b"
+    assert (storage.flushes, storage.rows_written, storage.db_reads) == (1, 1, 0)
+    assert list(rows.values()) == [("menu:b", '{"page":2}')]
+
+
+def test_cold_keys_are_loaded_once(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        writer = SQLStorage(engine, flush_interval=60)
+        await writer.set_state(storage_key(1), "menu:a")
+        await writer.set_data(storage_key(1), {"page": 3})
+        await writer.close()
+        reader = SQLStorage(engine, flush_interval=60)
+        states = await asyncio.gather(*(reader.get_state(storage_key(1)) for _ in range(5)))
+        data = await reader.get_data(storage_key(1))
+        missing = await reader.get_state(storage_key(2))
+        await reader.close()
+        await engine.dispose()
+        return reader, states, data, missing
+
+    reader, states, data, missing = asyncio.run(run())
+    assert states == ["menu:a"] * 5
+    assert data == {"page": 3}
+    assert missing is None
+    assert reader.db_reads == 2
+
+
+def test_failed_flush_keeps_the_batch_without_clobbering_newer_writes(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        storage = SQLStorage(BrokenEngine(), flush_interval=60)
+        await storage.set_state(storage_key(1), "menu:a")
+        await storage.set_data(storage_key(1), {"page": 1})
+        await storage.flush()
+        await storage.set_state(storage_key(1), "menu:b")
+        storage.engine = engine
+        await storage.flush()
+        rows = await stored_rows(engine)
+        await storage.close()
+        await engine.dispose()
+        return storage, rows
+
+    storage, rows = asyncio.run(run())
+    assert (storage.flush_errors, storage.flushes) == (1, 1)
+    assert list(rows.values()) == [("menu:b", '{"page":1}')]
+
+
+def test_full_batch_wakes_the_flusher(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        storage = SQLStorage(engine, flush_interval=60, flush_batch_size=2)
+        await storage.set_state(storage_key(1), "menu:a")
+        await storage.set_state(storage_key(2), "menu:a")
+        for _ in range(100):
+            if storage.flushes:
+                break
+            await asyncio.sleep(0.01)
+        rows = await stored_rows(engine)
+        await storage.close()
+        await engine.dispose()
+        return rows
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_close_flushes_and_rejects_later_writes(tmp_path):
+    async def run():
+        engine = await sqlite_engine(tmp_path)
+        storage = SQLStorage(engine, flush_interval=60)
+        await storage.set_state(storage_key(1), "menu:a")
+        await storage.close()
+        await storage.close()  # Idempotent
+        rows = await stored_rows(engine)
+        with pytest.raises(RuntimeError, match="closed"):
+            await storage.set_state(storage_key(1), "menu:b")
+        await engine.dispose()
+        return storage, rows
+
+    storage, rows = asyncio.run(run())
+    assert storage._flusher is None
+    assert list(rows.values()) == [("menu:a", None)]
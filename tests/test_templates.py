@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+import config as app_config
+from services import templates
+from services.content_store import content_store
+from services.templates import TemplateRenderer, compile_template
+
+
+def make_renderer(tmp_path, monkeypatch) -> TemplateRenderer:
+    monkeypatch.setattr(app_config, "BUSINESS_HOURS", "9-18 <daily>")
+    monkeypatch.setattr(app_config, "BUSINESS_CONTACT_EMAIL", "boats@example.com")
+    content_store.invalidate()
+    return TemplateRenderer(root=str(tmp_path))
+
+
+def write(path, text: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_compile_template_alternates_literals_and_names():
+    template = compile_template("Open {{ business_hours }}, write to {{contact_email}}.")
+    assert template.parts == ("Open ", "business_hours", ", write to ", "contact_email", ".")
+    assert template.variables == ("business_hours", "contact_email")
+    plain = compile_template("No placeholders")
+    assert plain.render({}) is plain.source
+
+
+def test_render_escapes_values_and_keeps_unknown_placeholders(tmp_path, monkeypatch):
+    renderer = make_renderer(tmp_path, monkeypatch)
+    path = write(tmp_path / "bc-1" / "hours.txt", "<b>Hours:</b> {{ business_hours }} {{ price_boat1 }}")
+    output = asyncio.run(renderer.render("bc-1", path))
+    assert output == "<b>Hours:</b> 9-18 &lt;daily&gt; {{price_boat1}}"
+
+
+def test_client_variables_override_globals(tmp_path, monkeypatch):
+    renderer = make_renderer(tmp_path, monkeypatch)
+    write(tmp_path / "bc-1" / "variables.json", json.dumps({"business_hours": "10-14", "price_boat1": "50 & up"}))
+    path_1 = write(tmp_path / "bc-1" / "prices.txt", "{{ business_hours }}: {{ price_boat1 }}, {{ contact_email }}")
+    path_2 = write(tmp_path / "bc-2" / "prices.txt", "{{ business_hours }}: {{ price_boat1 }}, {{ contact_email }}")
+
+    async def run():
+        return await renderer.render("bc-1", path_1), await renderer.render("bc-2", path_2)
+
+    assert asyncio.run(run()) == (
+        "10-14: 50 &amp; up, boats@example.com",
+        "9-18 &lt;daily&gt;: {{price_boat1}}, boats@example.com",
+    )
+
+
+def test_invalid_variables_fall_back_to_globals(tmp_path, monkeypatch):
+    renderer = make_renderer(tmp_path, monkeypatch)
+    write(tmp_path / "bc-1" / "variables.json", '["not", "an", "object"]')
+    path = write(tmp_path / "bc-1" / "hours.txt", "{{ business_hours }}")
+    assert asyncio.run(renderer.render("bc-1", path)) == "9-18 &lt;daily&gt;"
+
+
+def test_missing_variables_file_is_not_read_again(tmp_path, monkeypatch):
+    renderer = make_renderer(tmp_path, monkeypatch)
+    path = write(tmp_path / "bc-1" / "hours.txt", "{{ business_hours }}")
+    variables_path = os.path.join(str(tmp_path), "bc-1", templates.VARIABLES_FILE)
+    reads = []
+    original_read = content_store.read
+
+    async def counting_read(read_path):
+        reads.append(read_path)
+        return await original_read(read_path)
+
+    monkeypatch.setattr(content_store, "read", counting_read)
+
+    async def run():
+        return [await renderer.render("bc-1", path) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["9-18 &lt;daily&gt;"] * 3
+    assert reads.count(variables_path) == 1
+    assert renderer.stats()["hits"] == 2
+
+
+def test_changed_variables_render_again(tmp_path, monkeypatch):
+    renderer = make_renderer(tmp_path, monkeypatch)
+    variables_path = write(tmp_path / "bc-1" / "variables.json", json.dumps({"price_boat1": "50"}))
+    path = write(tmp_path / "bc-1" / "prices.txt", "From {{ price_boat1 }}")
+
+    async def run():
+        first = await renderer.render("bc-1", path)
+        write(variables_path, json.dumps({"price_boat1": "60"}))
+        content_store.invalidate(variables_path)  # What the watcher does on a change
+        return first, await renderer.render("bc-1", path)
+
+    assert asyncio.run(run()) == ("From 50", "From 60")
+    assert renderer.stats()["renders"] == 2
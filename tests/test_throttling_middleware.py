@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.types import Update
+
+from middlewares import throttling_middleware
+from middlewares.throttling_middleware import ThrottlingMiddleware
+from services import outbound
+
+
+class FakeBot:
+    def __init__(self):
+        self.answered: list[str] = []
+
+    async def answer_callback_query(self, callback_query_id: str):
+        self.answered.append(callback_query_id)
+        return True
+
+
+def use_clock(monkeypatch) -> list[float]:
+    """Replaces time.monotonic in the middleware and its buckets with a settable clock."""
+    now = [1000.0]
+    clock = SimpleNamespace(monotonic=lambda: now[0])
+    monkeypatch.setattr(throttling_middleware, "time", clock)
+    monkeypatch.setattr(outbound, "time", clock)
+    return now
+
+
+def callback_update(user_id: int, query_id: str) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": query_id,
+            "chat_instance": "1",
+            "from": {"id": user_id, "is_bot": False, "first_name": "Client"},
+            "data": "boats",
+        },
+    })
+
+
+def send(middleware, bot, user_id: int, connection_id: str = "bc-1", is_owner: bool = False, query_id: str = "q"):
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+        return "handled"
+
+    data = {
+        "event_from_user": SimpleNamespace(id=user_id),
+        "event_context": SimpleNamespace(business_connection_id=connection_id),
+        "bot": bot,
+        "is_owner": is_owner,
+    }
+    result = asyncio.run(middleware(handler, callback_update(user_id, query_id), data))
+    return result == "handled"
+
+
+def make_middleware(**kwargs) -> ThrottlingMiddleware:
+    defaults = dict(user_rate=1, user_burst=2, connection_rate=100, connection_burst=100, max_entries=100, ttl=60)
+    return ThrottlingMiddleware(**{**defaults, **kwargs})
+
+
+def test_user_bucket_drops_and_refills(monkeypatch):
+    now = use_clock(monkeypatch)
+    middleware = make_middleware()
+    bot = FakeBot()
+    assert [send(middleware, bot, 1) for _ in range(3)] == [True, True, False]
+    assert send(middleware, bot, 2)  # Another client has its own bucket
+    now[0] += 1.0
+    assert [send(middleware, bot, 1) for _ in range(2)] == [True, False]
+    assert middleware.stats()["passed"] == 4
+    assert middleware.stats()["dropped"] == 2
+
+
+def test_connection_bucket_limits_all_clients_of_a_connection(monkeypatch):
+    use_clock(monkeypatch)
+    middleware = make_middleware(user_burst=10, connection_rate=1, connection_burst=3)
+    bot = FakeBot()
+    assert [send(middleware, bot, user_id) for user_id in range(1, 5)] == [True, True, True, False]
+    assert send(middleware, bot, 5, connection_id="bc-2")
+
+
+def test_owners_are_never_throttled(monkeypatch):
+    use_clock(monkeypatch)
+    middleware = make_middleware(user_burst=1)
+    assert all(send(middleware, FakeBot(), 1, is_owner=True) for _ in range(5))
+    assert middleware.stats()["buckets"] == 0
+
+
+def test_throttled_callback_is_answered(monkeypatch):
+    use_clock(monkeypatch)
+    middleware = make_middleware(user_burst=1)
+    bot = FakeBot()
+    assert send(middleware, bot, 1, query_id="q1")
+    assert not send(middleware, bot, 1, query_id="q2")
+    assert bot.answered == ["q2"]
+
+
+def test_idle_and_excess_buckets_are_evicted(monkeypatch):
+    now = use_clock(monkeypatch)
+    middleware = make_middleware(max_entries=4, ttl=10)
+    bot = FakeBot()
+    send(middleware, bot, 1)  # Buckets ("u", 1) and ("c", "bc-1")
+    now[0] += 11
+    send(middleware, bot, 2)  # Both are idle past the TTL (and full again)
+    assert middleware.stats()["evicted"] == 2
+    for user_id in (3, 4, 5):
+        send(middleware, bot, user_id)
+    assert middleware.stats()["buckets"] == 4
+    assert ("u", 2) not in middleware._buckets  # The least recently used beyond the bound
+    assert ("c", "bc-1") in middleware._buckets
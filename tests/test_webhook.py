@@ -0,0 +1,144 @@
+import asyncio
+import importlib.util
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.filters import Command
+from aiogram.methods import DeleteWebhook, GetUpdates, SetWebhook, TelegramMethod
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+import config as app_config
+import sharding
+from services.outbound import OutboundScheduler
+from webhook import build_webhook_app, run_webhook
+
+SECRET = "webhook-secret"
+
+
+def message_update(text: str, update_id: int = 1) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 900002, "type": "private"},
+            "from": {"id": 900002, "is_bot": False, "first_name": "Client"},
+            "text": text,
+        },
+    }
+
+
+def make_dispatcher(received: list) -> Dispatcher:
+    router = Router()
+
+    @router.message(Command("ping"))
+    async def ping(message: Message):
+        received.append(message.text)
+        return message.answer("pong")
+
+    @router.message()
+    async def anything(message: Message):
+        received.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def post(update: dict, headers: dict, scheduler: OutboundScheduler | None = None):
+    """POSTs one update to a fresh webhook app; returns (status, body, texts seen by handlers)."""
+    received = []
+    bot = Bot(token="42:TEST")
+    app = build_webhook_app(make_dispatcher(received), bot, secret_token=SECRET, scheduler=scheduler)
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post(app_config.WEBHOOK_PATH, json=update, headers=headers)
+        return response.status, await response.text(), received
+
+
+def test_update_is_dispatched():
+    status, _body, received = asyncio.run(post(message_update("hello"), {"X-Telegram-Bot-Api-Secret-Token": SECRET}))
+    assert status == 200
+    assert received == ["hello"]
+
+
+def test_missing_or_wrong_secret_is_rejected():
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+        status, _body, received = asyncio.run(post(message_update("hello"), headers))
+        assert status == 401
+        assert received == []
+
+
+def test_returned_method_is_answered_inline_and_rate_limited():
+    scheduler = OutboundScheduler(global_rate=30, chat_rate=1, chat_burst=3)
+    status, body, received = asyncio.run(
+        post(message_update("/ping"), {"X-Telegram-Bot-Api-Secret-Token": SECRET}, scheduler)
+    )
+    assert status == 200
+    assert received == ["/ping"]
+    assert "sendMessage" in body
+    assert "pong" in body
+    assert scheduler.stats()["lanes"]["interactive"]["granted"] == 1
+
+
+class RecordingSession(BaseSession):
+    """Bot session that records API calls instead of sending them."""
+
+    def __init__(self, on_call=None):
+        super().__init__()
+        self.calls: list[TelegramMethod] = []
+        self.on_call = on_call
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if self.on_call is not None:
+            self.on_call(method)
+        return [] if isinstance(method, GetUpdates) else True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        for chunk in ():
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+def test_run_webhook_registers_url_and_secret(monkeypatch):
+    monkeypatch.setattr(app_config, "WEBHOOK_URL", "https://bot.example.com/")
+    monkeypatch.setattr(app_config, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(app_config, "WEBHOOK_LISTEN_HOST", "127.0.0.1")
+    monkeypatch.setattr(app_config, "WEBHOOK_LISTEN_PORT", 0)
+    registered = asyncio.Event()
+    session = RecordingSession(lambda method: registered.set() if isinstance(method, SetWebhook) else None)
+
+    async def run():
+        server = asyncio.create_task(run_webhook(make_dispatcher([]), Bot(token="42:TEST", session=session)))
+        await asyncio.wait_for(registered.wait(), 5)
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+    asyncio.run(run())
+    [set_webhook] = [call for call in session.calls if isinstance(call, SetWebhook)]
+    assert set_webhook.url == "https://bot.example.com" + app_config.WEBHOOK_PATH
+    assert set_webhook.secret_token == SECRET
+
+
+def test_sharded_front_polls_after_deleting_the_webhook():
+    stop = asyncio.Event()
+    session = RecordingSession(lambda method: stop.set() if isinstance(method, GetUpdates) else None)
+
+    async def run():
+        await sharding._poll(Bot(token="42:TEST", session=session), sharding.ShardRouter(1), ["message"], stop)
+
+    asyncio.run(run())
+    assert [type(call) for call in session.calls] == [DeleteWebhook, GetUpdates]
+
+
+def test_generated_secret_in_webhook_mode(monkeypatch):
+    monkeypatch.setenv("BOT_MODE", "webhook")
+    monkeypatch.setenv("WEBHOOK_URL", "https://bot.example.com")
+    monkeypatch.setenv("WEBHOOK_SECRET", "")
+    spec = importlib.util.spec_from_file_location("config_webhook_check", app_config.__file__)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    assert len(config.WEBHOOK_SECRET) >= 32